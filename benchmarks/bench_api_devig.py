@@ -0,0 +1,57 @@
+# Per-parlay latency of the /api/devig endpoint at different batch sizes
+#
+# Usage: python benchmarks/bench_api_devig.py [batch_size ...]
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "source"))
+
+from app import app  # noqa: E402
+
+
+def random_parlays(n_parlays, seed=0):
+    """
+    Generates parlays of 2-4 two-way legs with a 3-7% margin per leg.
+
+    Returns:
+        list: Parlays in the /api/devig request format.
+    """
+    rng = np.random.default_rng(seed)
+    parlays = []
+    for _ in range(n_parlays):
+        legs = []
+        for _ in range(rng.integers(2, 5)):
+            p = rng.uniform(0.2, 0.8)
+            margin = rng.uniform(0.03, 0.07)
+            legs.append([round(1 / (p * (1 + margin)), 2), round(1 / ((1 - p) * (1 + margin)), 2)])
+        fair_odds = np.prod([leg[0] for leg in legs])
+        parlays.append({
+            "legs": legs,
+            "final_odds": round(float(fair_odds) * rng.uniform(0.85, 1.1), 2),
+            "kelly_budget": 10000,
+            "kelly_mult": 0.1,
+        })
+    return parlays
+
+
+def main(batch_sizes=(1, 100, 10000), repeats=3):
+    client = app.test_client()
+    print(f"{'batch size':>10}{'request (ms)':>14}{'per parlay (ms)':>17}")
+    for batch_size in batch_sizes:
+        parlays = random_parlays(batch_size)
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            response = client.post("/api/devig", json=parlays)
+            timings.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.get_json()
+        best = min(timings) * 1000
+        print(f"{batch_size:>10}{best:>14.2f}{best / batch_size:>17.4f}")
+
+
+if __name__ == "__main__":
+    main([int(x) for x in sys.argv[1:]] or (1, 100, 10000))
@@ -0,0 +1,53 @@
+# Throughput and peak memory of the Monte Carlo bankroll simulator
+#
+# Usage: python benchmarks/bench_bankroll_sim.py [n_paths] [n_bets]
+#
+# Simulates n_paths paths of n_bets bets drawn from 20 random bets with method spreads, for the 5
+# default Kelly multipliers, at the default chunk (CHUNK_CELLS bets) and several chunk sizes. Peak
+# memory is traced during each run, so it shows the memory bounded by the chunk size and not the paths.
+
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "source"))
+
+from bankroll_sim import DEFAULT_KELLY_MULTS, simulate_bankroll  # noqa: E402
+
+
+def main():
+    n_paths = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    n_bets = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    rng = random.Random(0)
+    odds = [round(rng.uniform(1.5, 4), 2) for _ in range(20)]
+    probs = [min(1 / o * rng.uniform(1, 1.08), 0.95) for o in odds]
+    min_probs = [p * rng.uniform(0.97, 1) for p in probs]
+
+    # Warm-up, so imports and first-call allocations are not traced
+    simulate_bankroll(probs, odds, n_bets=n_bets, n_paths=1000, min_probs=min_probs)
+
+    for chunk_size in (None, 5000, 20000, 100000):
+        tracemalloc.start()
+        start = time.perf_counter()
+        results = simulate_bankroll(probs, odds, min_probs=min_probs, n_bets=n_bets, n_paths=n_paths,
+                                    chunk_size=chunk_size)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        steps = n_paths * n_bets * len(DEFAULT_KELLY_MULTS)
+        print(f"chunk {chunk_size or 'default':>7}: {elapsed:.2f} s, {steps / elapsed / 1e6:.0f}M bets/s, "
+              f"peak memory {peak / 2 ** 20:.1f} MiB")
+
+    print(f"{n_paths} paths x {n_bets} bets")
+    for result in results:
+        print(f"  kelly_mult {result['kelly_mult']:<5} growth/bet {result['growth']:.5f}  "
+              f"median x{result['final_quantiles']['0.5']:.3f}  ruin {result['ruin_prob']:.4f}  "
+              f"drawdown p50/p90/p99 {result['drawdown_quantiles']['0.5']:.3f}/"
+              f"{result['drawdown_quantiles']['0.9']:.3f}/{result['drawdown_quantiles']['0.99']:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# Throughput of batch_implied_odds against looping implied_odds over the same markets
+#
+# Usage: python benchmarks/bench_batch_implied_odds.py [n_markets]
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "source"))
+
+from implied_odds import implied_odds  # noqa: E402
+from batch_implied_odds import BATCH_METHODS, batch_implied_odds, pad_markets  # noqa: E402
+
+
+def random_markets(n_markets, seed=0):
+    """
+    Generates ragged markets of 2-6 outcomes with a 2-8% overround.
+
+    Returns:
+        list: Markets as lists of implied probabilities.
+        list: The margin of each market.
+    """
+    rng = np.random.default_rng(seed)
+    markets = []
+    margins = []
+    for _ in range(n_markets):
+        n = rng.integers(2, 7)
+        # Shrink towards uniform so no outcome is too close to 0 or 1
+        fair = 0.8 * rng.dirichlet(np.full(n, 2.0)) + 0.2 / n
+        margin = rng.uniform(0.02, 0.08)
+        probs = fair * (1 + margin)
+        markets.append([float(p) for p in probs])
+        margins.append(float(probs.sum() - 1))
+    return markets, margins
+
+
+def scalar_loop(markets, margins, method):
+    results = []
+    for probs, margin in zip(markets, margins):
+        res = implied_odds(probs, category="dec", method=method, margin=margin)
+        results.append(res["implied_odds"] if isinstance(res, dict) else res)
+    return results
+
+
+def main(n_markets=10000):
+    markets, margins = random_markets(n_markets)
+    padded = pad_markets(markets)
+    margins_arr = np.array(margins)
+
+    print(f"{n_markets} markets, 2-6 outcomes each")
+    print(f"{'method':<15}{'loop (s)':>10}{'batch (s)':>11}{'speedup':>9}{'max |diff|':>13}")
+    for method in BATCH_METHODS:
+        start = time.perf_counter()
+        expected = scalar_loop(markets, margins, method)
+        loop_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = batch_implied_odds(padded, method=method, margin=margins_arr)
+        batch_time = time.perf_counter() - start
+
+        max_diff = np.nanmax(np.abs(pad_markets(expected) - result["implied_odds"]))
+        print(f"{method:<15}{loop_time:>10.3f}{batch_time:>11.4f}{loop_time / batch_time:>8.0f}x{max_diff:>13.2e}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
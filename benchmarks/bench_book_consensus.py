@@ -0,0 +1,67 @@
+# Refresh time of the multi-book consensus for thousands of events quoted by dozens of books
+#
+# Usage: python benchmarks/bench_book_consensus.py [n_events] [n_books] [method]
+#
+# Ingests one snapshot of every book's line on every event (two- and three-way markets, each book off the
+# true probabilities by a little noise, one book with its lines reversed so it gets rejected), refreshes,
+# then moves 2% of the lines and refreshes again (only the moved lines are devigged).
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "source"))
+
+from book_consensus import BookConsensus  # noqa: E402
+
+
+def snapshot(n_events, n_books, rng):
+    books = [f"book-{i}" for i in range(n_books)]
+    lines = []
+    for event in range(n_events):
+        names = rng.choice([["home", "away"], ["home", "draw", "away"]])
+        weights = [rng.random() + 0.2 for _ in names]
+        probs = [w / sum(weights) for w in weights]
+        for book in books:
+            quoted = [p * (1 + rng.gauss(0, 0.02)) for p in probs]
+            quoted = [p / sum(quoted) for p in quoted]
+            if book == "book-1":
+                quoted.reverse()
+            margin = rng.uniform(0.02, 0.08)
+            lines.append({"book": book, "event": f"event-{event}", "market": "1x2" if len(names) == 3 else "ml",
+                          "outcomes": names, "odds": [round(1 / (p * (1 + margin)), 2) for p in quoted]})
+    return lines
+
+
+def main():
+    n_events = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    n_books = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    method = sys.argv[3] if len(sys.argv) > 3 else "power"
+
+    rng = random.Random(0)
+    lines = snapshot(n_events, n_books, rng)
+    engine = BookConsensus(method, weights={"book-0": 3})
+
+    start = time.perf_counter()
+    stored, errors = engine.ingest(lines)
+    ingest = time.perf_counter() - start
+    refresh = engine.refresh()
+    print(f"{n_events} events x {n_books} books ({stored} lines, {len(errors)} rejected at ingest), method {method}")
+    print(f"ingest {ingest * 1000:.0f} ms ({ingest / stored * 1e6:.1f} us per line)")
+    print(f"full refresh: {refresh['timing']} ms, {refresh['rejected']} outlier lines")
+
+    moved = rng.sample(lines, len(lines) // 50)
+    start = time.perf_counter()
+    engine.ingest(moved)
+    ingest = time.perf_counter() - start
+    refresh = engine.refresh()
+    print(f"{len(moved)} moved lines: ingest {ingest * 1000:.0f} ms, refresh {refresh['timing']} ms")
+
+    start = time.perf_counter()
+    value_bets = engine.value_bets(min_ev=2, kelly_budget=1000, kelly_mult=0.25)
+    print(f"value bets above 2% EV: {len(value_bets)} in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
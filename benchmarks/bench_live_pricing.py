@@ -0,0 +1,96 @@
+# Update-to-push latency of live re-pricing with many concurrent subscriptions
+#
+# Usage: python benchmarks/bench_live_pricing.py [n_subscriptions] [n_markets] [n_updates] [n_listeners]
+#
+# Subscribes n_subscriptions random 2-4 leg parlays to a hub fed by the simulated feed, then publishes
+# n_updates odds updates. Push latency is measured from the update to each affected subscription's
+# push; delivery latency from the update to a listener thread waiting on next_snapshot receiving it
+# (n_listeners of the subscriptions have one, as SSE streams do).
+
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "source"))
+
+from live_pricing import LiveHub, SimulatedFeed  # noqa: E402
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+def main():
+    n_subscriptions = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    n_markets = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    n_updates = int(sys.argv[3]) if len(sys.argv) > 3 else 2000
+    n_listeners = int(sys.argv[4]) if len(sys.argv) > 4 else 200
+
+    hub = LiveHub(max_subscriptions=n_subscriptions)
+    feed = SimulatedFeed(hub, n_markets)
+    rng = random.Random(1)
+    subscriptions = [
+        hub.subscribe(rng.sample(feed.ids, rng.randint(2, 4)), rng.uniform(3, 20), 1000, 0.25)
+        for _ in range(n_subscriptions)
+    ]
+
+    # The time each update was published, so listeners can measure delivery latency
+    published = {}
+    delivery = []
+    stop = threading.Event()
+
+    def listen(subscription):
+        while not stop.is_set():
+            snapshot = subscription.next_snapshot(timeout=0.1)
+            if snapshot is not None and (subscription.id, snapshot["version"]) in published:
+                delivery.append(time.perf_counter() - published[subscription.id, snapshot["version"]])
+
+    listened = subscriptions[:n_listeners]
+    for subscription in listened:
+        subscription.next_snapshot(timeout=0)
+    threads_by_subscription = {s: threading.Thread(target=listen, args=(s,), daemon=True) for s in listened}
+    threads = list(threads_by_subscription.values())
+    for thread in threads:
+        thread.start()
+    by_market = {}
+    for subscription in subscriptions:
+        for market_id, _ in subscription.legs:
+            by_market.setdefault(market_id, set()).add(subscription)
+
+    push = []
+    publish = []
+    pushed = 0
+    for _ in range(n_updates):
+        market_id = rng.choice(feed.ids)
+        subscribers = by_market.get(market_id, ())
+        received = time.perf_counter()
+        for subscription in subscribers:
+            if subscription in threads_by_subscription:
+                published[subscription.id, subscription.version + 1] = received
+        _, n_pushed = feed.tick(market_id)
+        publish.append(time.perf_counter() - received)
+        pushed += n_pushed
+        push.extend(subscription.pushed_at - received for subscription in subscribers)
+        time.sleep(0.001)  # lets the listeners run between updates
+
+    time.sleep(0.2)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    print(f"{n_subscriptions} subscriptions on {n_markets} markets, {n_updates} updates, "
+          f"{pushed / n_updates:.1f} pushes per update, {statistics.mean(publish) * 1000:.3f} ms per publish")
+    print(f"push latency:     p50 {percentile(push, 0.5) * 1000:.3f} ms, p99 {percentile(push, 0.99) * 1000:.3f} ms, "
+          f"max {max(push) * 1000:.3f} ms")
+    if delivery:
+        print(f"delivery latency: p50 {percentile(delivery, 0.5) * 1000:.3f} ms, "
+              f"p99 {percentile(delivery, 0.99) * 1000:.3f} ms ({len(delivery)} deliveries to {n_listeners} listeners, "
+              f"mean {statistics.mean(delivery) * 1000:.3f} ms)")
+
+
+if __name__ == "__main__":
+    main()
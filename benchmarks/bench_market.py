@@ -0,0 +1,97 @@
+# Pricing a large book from probability lists against pre-validated Market objects
+#
+# Usage: python benchmarks/bench_market.py [n_legs]
+
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "source"))
+
+from devig_cache import DevigCache, cached_implied_odds  # noqa: E402
+from implied_odds import implied_odds  # noqa: E402
+from market import Market  # noqa: E402
+from pricing import METHODS  # noqa: E402
+from utils import calculate_margin  # noqa: E402
+
+
+def random_book(n_legs, seed=0):
+    rng = random.Random(seed)
+    book = []
+    for _ in range(n_legs):
+        n = rng.choice([2, 2, 2, 3, 3, 12])
+        probs = [rng.random() + 0.1 for _ in range(n)]
+        total = sum(probs) / (1 + rng.uniform(0.02, 0.08))
+        book.append([round(total / p, 2) for p in probs])
+    return book
+
+
+def legs_as_lists(book):
+    # Probabilities and margin, plus the cache key implied_odds callers rebuild on every lookup
+    legs = []
+    for odds in book:
+        probs = [1 / o for o in odds]
+        legs.append((probs, calculate_margin(odds), tuple(round(p, 12) for p in probs)))
+    return legs
+
+
+def legs_as_markets(book):
+    return [Market.from_odds(odds) for odds in book]
+
+
+def allocated(build, book):
+    build(book[:100])  # imports done on first use are not part of the legs
+    tracemalloc.start()
+    legs = build(book)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del legs
+    return size
+
+
+def main():
+    n_legs = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    book = random_book(n_legs)
+    methods = list(METHODS.values())
+
+    lists_bytes = allocated(legs_as_lists, book)
+    markets_bytes = allocated(legs_as_markets, book)
+    print(f"memory per leg: lists {lists_bytes / n_legs:.0f} B, markets {markets_bytes / n_legs:.0f} B")
+
+    for normalize in (False, True):
+        start = time.perf_counter()
+        for probs, margin, _ in legs_as_lists(book):
+            for method in methods:
+                implied_odds(probs, category="dec", method=method, margin=margin, normalize=normalize)
+        lists = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for market in legs_as_markets(book):
+            for method in methods:
+                implied_odds(market, category="dec", method=method, margin=market.margin, normalize=normalize)
+        markets = time.perf_counter() - start
+        print(f"implied_odds x {len(methods)} methods, normalize={normalize}: "
+              f"lists {lists / n_legs * 1e6:.1f} us/leg, markets {markets / n_legs * 1e6:.1f} us/leg")
+
+    # Repeated legs through the devig cache: the Market carries its cache key
+    timings = {}
+    list_legs = [(probs, margin) for probs, margin, _ in legs_as_lists(book)]
+    market_legs = [(market, market.margin) for market in legs_as_markets(book)]
+    for name, legs in (("lists", list_legs), ("markets", market_legs)):
+        cache = DevigCache(max_entries=10 * n_legs * len(methods), max_bytes=2 ** 40)
+        for probs, margin in legs:
+            for method in methods:
+                cached_implied_odds(probs, category="dec", method=method, margin=margin, normalize=False, cache=cache)
+        start = time.perf_counter()
+        for probs, margin in legs:
+            for method in methods:
+                cached_implied_odds(probs, category="dec", method=method, margin=margin, normalize=False, cache=cache)
+        timings[name] = time.perf_counter() - start
+    print(f"cache hits x {len(methods)} methods: lists {timings['lists'] / n_legs * 1e6:.1f} us/leg, "
+          f"markets {timings['markets'] / n_legs * 1e6:.1f} us/leg")
+
+
+if __name__ == "__main__":
+    main()
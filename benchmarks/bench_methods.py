@@ -0,0 +1,79 @@
+# Parlay pricing with the original four devig methods against all of them, and the batched odds ratio solve
+#
+# Usage: python benchmarks/bench_methods.py [n_parlays] [n_markets]
+#
+# Prices n_parlays random 2-5 leg parlays with price_parlay, on a cleared devig cache (cold) and again
+# (warm), with the original four methods and with the default ones, and prints the cost of the default
+# methods relative to the four. Then devigs n_markets markets with batch_implied_odds odds_ratio against
+# a loop of implied_odds.
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "source"))
+
+from batch_implied_odds import batch_implied_odds, pad_markets  # noqa: E402
+from devig_cache import DEVIG_CACHE  # noqa: E402
+from implied_odds import implied_odds  # noqa: E402
+from pricing import DEFAULT_METHODS, price_parlay  # noqa: E402
+
+ORIGINAL_METHODS = ["mult", "add", "power", "shin"]
+
+
+def random_leg(rng):
+    probs = [rng.random() + 0.1 for _ in range(rng.choice([2, 2, 3, 12]))]
+    total = sum(probs) / (1 + rng.uniform(0.02, 0.08))
+    return [round(total / p, 2) for p in probs]
+
+
+def time_parlays(parlays, methods):
+    DEVIG_CACHE.clear()
+    start = time.perf_counter()
+    for legs in parlays:
+        price_parlay(legs, 6.0, 1000, 0.25, methods)
+    cold = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for legs in parlays:
+        price_parlay(legs, 6.0, 1000, 0.25, methods)
+    warm = time.perf_counter() - start
+    return cold, warm
+
+
+def main():
+    n_parlays = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    n_markets = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+
+    rng = random.Random(0)
+    parlays = [[random_leg(rng) for _ in range(rng.randint(2, 5))] for _ in range(n_parlays)]
+    # Once first, so imports and the solvers' first calls are not timed
+    time_parlays(parlays[:10], DEFAULT_METHODS)
+
+    timings = []
+    for name, methods in [("original 4", ORIGINAL_METHODS), (f"default {len(DEFAULT_METHODS)}", DEFAULT_METHODS)]:
+        cold, warm = time_parlays(parlays, methods)
+        timings.append((cold, warm))
+        print(f"{name:>10} methods: cold {cold / n_parlays * 1e6:7.1f} us, warm {warm / n_parlays * 1e6:6.1f} us per parlay")
+    (cold_4, warm_4), (cold_all, warm_all) = timings
+    print(f"default against original 4: cold {cold_all / cold_4 - 1:+.0%}, warm {warm_all / warm_4 - 1:+.0%}")
+
+    markets = [random_leg(rng) for _ in range(n_markets)]
+    legs_probs = 1 / pad_markets(markets)
+    margins = [sum(1 / o for o in odds) - 1 for odds in markets]
+
+    start = time.perf_counter()
+    for odds, margin in zip(markets, margins):
+        implied_odds([1 / o for o in odds], method="odds_ratio", margin=margin, normalize=False)
+    loop = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch_implied_odds(legs_probs, method="odds_ratio", margin=margins, normalize=False)
+    batch = time.perf_counter() - start
+    print(f"odds_ratio on {n_markets} markets: loop {loop * 1000:.1f} ms, batch {batch * 1000:.1f} ms "
+          f"({loop / batch:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# Parse time of pasted slips in each odds format, against the time to price the same legs
+#
+# Usage: python benchmarks/bench_odds_parser.py [n_legs ...]
+#
+# Builds slips of random 2-, 3- and 12-way legs written as decimal, US and fractional odds, parses each
+# with parse_slip (auto-detected and with the format given), and prices the legs with price_parlay and
+# the default methods on a cleared devig cache. The decimal slip is also parsed by pricing.parse_legs,
+# the decimal-only parser the page used before.
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "source"))
+
+from devig_cache import DEVIG_CACHE  # noqa: E402
+from odds_convert import dec_to_frac, dec_to_us  # noqa: E402
+from odds_parser import parse_slip  # noqa: E402
+from pricing import parse_legs, price_parlay  # noqa: E402
+
+
+def random_legs(n_legs, rng):
+    legs = []
+    for _ in range(n_legs):
+        probs = [rng.random() + 0.1 for _ in range(rng.choice([2, 2, 3, 12]))]
+        total = sum(probs) / (1 + rng.uniform(0.04, 0.08))
+        legs.append([round(total / p, 2) for p in probs])
+    return legs
+
+
+def slips(legs):
+    return {
+        "dec": ", ".join("/".join(str(o) for o in leg) for leg in legs),
+        "us": ", ".join("/".join(f"{o:+d}" for o in dec_to_us(leg)) for leg in legs),
+        "frac": "\n".join(" | ".join(dec_to_frac(leg)) for leg in legs),
+    }
+
+
+def best_of(function, repeats=5):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    sizes = [int(n) for n in sys.argv[1:]] or [10, 100, 1000, 5000]
+    rng = random.Random(0)
+    parse_slip("1.5/2.6")
+
+    for n_legs in sizes:
+        legs = random_legs(n_legs, rng)
+
+        def price():
+            DEVIG_CACHE.clear()
+            price_parlay(legs, 3.0, 1000, 0.25)
+
+        pricing = best_of(price, repeats=3)
+        print(f"{n_legs} legs: pricing {pricing * 1000:.2f} ms")
+        for odds_format, text in slips(legs).items():
+            auto = best_of(lambda: parse_slip(text))
+            given = best_of(lambda: parse_slip(text, odds_format))
+            slip = parse_slip(text)
+            assert not slip.errors and len(slip.legs()) == n_legs, slip.error_message()
+            print(f"  {odds_format:>4}: auto {auto * 1000:7.2f} ms, {odds_format} {given * 1000:7.2f} ms "
+                  f"({auto / n_legs * 1e6:.1f} us per leg, {auto / pricing:.1%} of pricing)")
+        old = best_of(lambda: parse_legs(slips(legs)["dec"]))
+        print(f"   parse_legs (decimal only): {old * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# Append and scan throughput of the odds store on a multi-GB dataset
+#
+# Usage: python benchmarks/bench_odds_store.py [gigabytes] [directory]
+#
+# Appends synthetic snapshots (2- and 3-way markets of 500 events open at a time, 30 books, timestamps
+# increasing) in batches of a million lines until the store holds the requested size (default 2 GB, in a
+# temporary directory removed at the end), then times a full scan, a one-hour range devigged with lines,
+# and the whole history of one event. Scans read through the page cache: on a dataset larger than memory they
+# measure the disk.
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "source"))
+
+from odds_store import COLUMNS, OddsStore  # noqa: E402
+
+BYTES_PER_ROW = sum(np.dtype(dtype).itemsize for dtype in COLUMNS.values())
+# Events open at a time; one closes and the next opens every EVENT_LINES lines
+N_EVENTS = 500
+EVENT_LINES = 2000
+N_BOOKS = 30
+LINES_PER_BATCH = 1000000
+
+
+def batch(rng, first_line):
+    # A million lines: each book requotes a random open event every few milliseconds
+    events = (first_line + np.arange(LINES_PER_BATCH)) // EVENT_LINES + rng.integers(0, N_EVENTS, LINES_PER_BATCH)
+    n_outcomes = 2 + events % 2
+    timestamps = 1.7e9 + (first_line + np.arange(LINES_PER_BATCH)) * 0.005
+    books = rng.integers(0, N_BOOKS, LINES_PER_BATCH)
+
+    line = np.repeat(np.arange(LINES_PER_BATCH), n_outcomes)
+    position = np.arange(len(line)) - np.repeat(np.cumsum(n_outcomes) - n_outcomes, n_outcomes)
+    probs = rng.uniform(0.2, 1, len(line))
+    sums = np.bincount(line, probs)
+    odds = np.round(1 / (probs / sums[line] * rng.uniform(1.02, 1.08, LINES_PER_BATCH)[line]), 2)
+    return {
+        "timestamp": timestamps[line],
+        "event": np.char.add("event-", events.astype(str))[line],
+        "market": np.where(n_outcomes == 3, "1x2", "ml")[line],
+        "outcome": np.array(["home", "away", "draw"])[position],
+        "book": np.char.add("book-", books.astype(str))[line],
+        "odds": np.maximum(odds, 1.01),
+    }
+
+
+def main():
+    gigabytes = float(sys.argv[1]) if len(sys.argv) > 1 else 2
+    directory = sys.argv[2] if len(sys.argv) > 2 else tempfile.mkdtemp(prefix="odds-store-")
+    target_rows = int(gigabytes * 1e9 / BYTES_PER_ROW)
+
+    try:
+        store = OddsStore(directory)
+        rng = np.random.default_rng(0)
+        lines = 0
+        generating = appending = 0.0
+        while store.rows < target_rows:
+            start = time.perf_counter()
+            columns = batch(rng, lines)
+            generating += time.perf_counter() - start
+            start = time.perf_counter()
+            store.append(**columns)
+            appending += time.perf_counter() - start
+            lines += LINES_PER_BATCH
+        size = store.stats()["bytes"]
+        print(f"appended {store.rows:,} rows ({lines:,} lines, {size / 1e9:.2f} GB) in {appending:.1f} s: "
+              f"{store.rows / appending / 1e6:.2f} M rows/s, {size / appending / 1e6:.0f} MB/s "
+              f"(generating the data took {generating:.1f} s more)")
+
+        reader = OddsStore(directory)
+        start = time.perf_counter()
+        total = 0.0
+        for chunk in reader.scan():
+            total += float(chunk["odds"].sum(dtype=np.float64))
+        elapsed = time.perf_counter() - start
+        print(f"full scan: {reader.rows / elapsed / 1e6:.1f} M rows/s, {size / elapsed / 1e9:.2f} GB/s")
+
+        first = float(reader.columns()["timestamp"][0])
+        start = time.perf_counter()
+        devigged = sum(len(result["timestamp"]) for result in reader.lines("power", first + 3600, first + 7200))
+        elapsed = time.perf_counter() - start
+        print(f"one hour devigged with power: {devigged:,} lines in {elapsed * 1000:.0f} ms "
+              f"({devigged / elapsed / 1e6:.2f} M lines/s)")
+
+        start = time.perf_counter()
+        rows = sum(len(chunk["timestamp"]) for chunk in reader.scan(events=["event-1000"]))
+        print(f"history of one event: {rows:,} rows in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+        start = time.perf_counter()
+        devigged = sum(len(result["timestamp"]) for result in reader.lines("mult"))
+        elapsed = time.perf_counter() - start
+        print(f"every line devigged with mult: {devigged / elapsed / 1e6:.2f} M lines/s")
+    finally:
+        if len(sys.argv) <= 2:
+            shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
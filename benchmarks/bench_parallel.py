@@ -0,0 +1,51 @@
+# Scaling of DevigPool from 1 to N worker processes
+#
+# Usage: python benchmarks/bench_parallel.py [n_markets] [max_workers]
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "source"))
+
+from batch_implied_odds import batch_implied_odds  # noqa: E402
+from parallel_devig import DevigPool  # noqa: E402
+
+
+def random_markets(n_markets, seed=0):
+    # 2-6 outcomes per market, 2-8% overround
+    rng = np.random.default_rng(seed)
+    width = 6
+    fair = 0.8 * rng.dirichlet(np.full(width, 2.0), size=n_markets) + 0.2 / width
+    n_outcomes = rng.integers(2, width + 1, size=n_markets)
+    fair[np.arange(width) >= n_outcomes[:, None]] = np.nan
+    fair = fair / np.nansum(fair, axis=1, keepdims=True)
+    return fair * (1 + rng.uniform(0.02, 0.08, size=(n_markets, 1)))
+
+
+def main(n_markets=2000000, max_workers=None):
+    max_workers = max_workers or os.cpu_count()
+    prob = random_markets(n_markets)
+    margin = np.nansum(prob, axis=1) - 1
+
+    workers = sorted({1, *[2 ** i for i in range(1, max_workers.bit_length())], max_workers})
+    print(f"{n_markets} markets, {os.cpu_count()} CPUs")
+    for method in ("power", "shin", "odds_ratio"):
+        start = time.perf_counter()
+        batch_implied_odds(prob, method=method, margin=margin, normalize=False)
+        serial = time.perf_counter() - start
+        print(f"{method}: in-process {serial:.2f} s")
+        for n in workers:
+            with DevigPool(workers=n, chunk_size=max(10000, n_markets // (4 * n))) as pool:
+                pool.implied_odds(prob[:n], method=method, margin=margin[:n], normalize=False)  # start the workers
+                start = time.perf_counter()
+                pool.implied_odds(prob, method=method, margin=margin, normalize=False)
+                elapsed = time.perf_counter() - start
+            print(f"  {n:>3} workers {elapsed:8.2f} s  speedup {serial / elapsed:5.2f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else None)
@@ -0,0 +1,104 @@
+# Time of the parlay search for pools of 30-50 legs, with and without a profit boost
+#
+# Usage: python benchmarks/bench_parlay_search.py [max_legs]
+#        python benchmarks/bench_parlay_search.py check [trials]
+#
+# check compares the search with a brute force over every parlay of small random pools, including pools
+# without an edge (every score negative), and exits with status 1 on a mismatch.
+
+import itertools
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "source"))
+
+from market import Market  # noqa: E402
+from parlay_search import ParlayPricing, search_parlays  # noqa: E402
+from pricing import devig_leg  # noqa: E402
+from utils import expected_value, kelly_bet  # noqa: E402
+
+
+def random_pool(n_legs, shade, seed=0):
+    """
+    Generates two-way legs with a 3-7% margin, offered at odds up to `shade` away from the market's.
+
+    Returns:
+        list: Legs in the /api/search request format, two legs per event for every fifth leg.
+    """
+    rng = np.random.default_rng(seed)
+    legs = []
+    for i in range(n_legs):
+        p = rng.uniform(0.25, 0.75)
+        margin = rng.uniform(0.03, 0.07)
+        odds = [round(1 / (p * (1 + margin)), 2), round(1 / ((1 - p) * (1 + margin)), 2)]
+        legs.append({
+            "id": f"leg-{i}",
+            "event": f"event-{i // 2 if i % 5 == 0 else i}",
+            "odds": odds,
+            "offered_odds": round(odds[0] * rng.uniform(1 - shade, 1 + shade), 2),
+        })
+    return legs
+
+
+def brute_force(legs, max_legs, top_k, objective, pricing, kelly_budget=100, kelly_mult=1.0):
+    # Scores of the top_k parlays of 2..max_legs legs from different events, best first
+    fair_prob = []
+    for leg in legs:
+        market = Market.from_odds(leg["odds"])
+        fair_prob.append(1 / devig_leg(market, market.margin, "mult")[0])
+    scores = []
+    for size in range(2, max_legs + 1):
+        for combo in itertools.combinations(range(len(legs)), size):
+            if len({legs[i]["event"] for i in combo}) < size:
+                continue
+            prob = float(np.prod([fair_prob[i] for i in combo]))
+            odds = float(pricing.offered_odds(float(np.prod([legs[i]["offered_odds"] for i in combo]))))
+            scores.append(expected_value(prob, odds) if objective == "ev"
+                          else kelly_bet(prob, odds - 1, kelly_budget, kelly_mult))
+    return sorted(scores, reverse=True)[:top_k]
+
+
+def check(trials):
+    rng = np.random.default_rng(0)
+    mismatches = 0
+    for trial in range(trials):
+        legs = random_pool(int(rng.integers(5, 11)), float(rng.choice([0.0, 0.03, 0.15])), seed=trial)
+        if trial % 2:
+            # No edge: every leg offered 5% under the market's odds, so every EV and Kelly stake is negative
+            for leg in legs:
+                leg["offered_odds"] = max(round(leg["odds"][0] * 0.95, 2), 1.01)
+        pricing = ParlayPricing(boost=float(rng.choice([0.0, 0.2, -0.1])), max_odds=rng.choice([None, 50.0]))
+        max_legs, top_k = int(rng.integers(2, 5)), int(rng.integers(1, 6))
+        objective = ("ev", "kelly")[trial // 2 % 2]
+        results, _ = search_parlays(legs, max_legs=max_legs, top_k=top_k, objective=objective, pricing=pricing)
+        found = [result[objective] for result in results]
+        expected = brute_force(legs, max_legs, top_k, objective, pricing)
+        if len(found) != len(expected) or not np.allclose(found, expected):
+            mismatches += 1
+            print(f"trial {trial} ({objective}, max_legs {max_legs}, top_k {top_k}): {found} != {expected}")
+    print(f"{trials - mismatches} of {trials} trials match the brute force")
+    return mismatches == 0
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "check":
+        sys.exit(0 if check(int(sys.argv[2]) if len(sys.argv) > 2 else 400) else 1)
+    max_legs = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+
+    print(f"{'legs':>5} {'pricing':>12} {'objective':>9} {'time':>10} {'evaluated':>10} {'pruned':>10}")
+    for n_legs in (30, 40, 50):
+        for name, shade, pricing in (("market", 0.06, ParlayPricing()), ("boost 25%", 0.15, ParlayPricing(boost=0.25))):
+            legs = random_pool(n_legs, shade)
+            for objective in ("ev", "kelly"):
+                start = time.perf_counter()
+                _, stats = search_parlays(legs, max_legs=max_legs, objective=objective, pricing=pricing)
+                elapsed = time.perf_counter() - start
+                print(f"{n_legs:>5} {name:>12} {objective:>9} {elapsed * 1000:>8.1f}ms "
+                      f"{stats['evaluated']:>10} {stats['pruned']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# Power method: batched safeguarded Newton against the former per-market secant solve
+#
+# Usage: python benchmarks/bench_power_solver.py [n_markets]
+
+import os
+import sys
+import time
+
+import numpy as np
+from scipy.optimize import root_scalar
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "source"))
+
+from batch_implied_odds import pad_markets, solve_power_exponent  # noqa: E402
+
+
+def secant_exponent(prob):
+    # The per-market secant solve previously used by implied_odds._implied_power_odds
+    odds = [1 / p for p in prob]
+
+    def find_k(k):
+        return sum(o ** (1 / k) for o in odds) - 1
+
+    return root_scalar(find_k, method="secant", x0=-1, x1=2.0, xtol=1e-6, rtol=1e-6, maxiter=100).root
+
+
+def random_markets(n_markets, longshot, seed=0):
+    rng = np.random.default_rng(seed)
+    markets = []
+    for _ in range(n_markets):
+        n = rng.integers(2, 7)
+        if longshot:
+            # One heavy favourite and a tail of longshots down to ~0.5%
+            fair = rng.dirichlet(np.full(n, 0.3))
+            fair = np.clip(fair, 0.005, None)
+            fair = fair / fair.sum()
+        else:
+            fair = 0.8 * rng.dirichlet(np.full(n, 2.0)) + 0.2 / n
+        markets.append(list(np.minimum(fair * (1 + rng.uniform(0.02, 0.08)), 0.99)))
+    return markets
+
+
+def main(n_markets=10000):
+    for label, longshot in (("balanced", False), ("longshot", True)):
+        markets = random_markets(n_markets, longshot)
+        padded = pad_markets(markets)
+
+        start = time.perf_counter()
+        secant = np.array([secant_exponent(m) for m in markets])
+        secant_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        exponent, converged, iterations = solve_power_exponent(padded)
+        newton_time = time.perf_counter() - start
+
+        # Re-price after a small line move (up to 0.2% per price), warm-started from the previous exponents
+        moved = padded * np.random.default_rng(1).uniform(0.998, 1.002, padded.shape)
+        start = time.perf_counter()
+        _, warm_converged, warm_iterations = solve_power_exponent(moved, warm_start=exponent)
+        warm_time = time.perf_counter() - start
+
+        residual = np.abs(np.nansum(padded ** (-1 / exponent[:, None]), axis=1) - 1)
+        secant_residual = np.abs(np.nansum(padded ** (-1 / secant[:, None]), axis=1) - 1)
+        print(f"{label} markets ({n_markets})")
+        print(f"  secant loop   {secant_time:8.3f} s  max residual {np.nanmax(secant_residual):.1e}  "
+              f"wrong root {np.sum(~(secant_residual < 1e-6))}")
+        print(f"  newton batch  {newton_time:8.4f} s  max residual {residual.max():.1e}  "
+              f"converged {converged.mean():.1%}  iterations mean {iterations.mean():.2f} max {iterations.max()}")
+        print(f"  warm start    {warm_time:8.4f} s  converged {warm_converged.mean():.1%}  "
+              f"iterations mean {warm_iterations.mean():.2f} max {warm_iterations.max()}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
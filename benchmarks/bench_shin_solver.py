@@ -0,0 +1,51 @@
+# Shin method: batched solve_shin against multiplicative devigging and per-leg shin package calls
+#
+# Usage: python benchmarks/bench_shin_solver.py [n_markets]
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "source"))
+
+from batch_implied_odds import batch_implied_odds  # noqa: E402
+
+try:
+    import shin
+except ImportError:
+    shin = None
+
+
+def main(n_markets=100000):
+    rng = np.random.default_rng(0)
+    print(f"{'outcomes':>8}{'basic (s)':>11}{'shin (s)':>10}{'max iter':>10}{'shin pkg (s)':>14}{'max |diff|':>12}")
+    for n in (2, 3, 6, 12):
+        fair = 0.8 * rng.dirichlet(np.ones(n), size=n_markets) + 0.2 / n
+        prob = fair * (1 + rng.uniform(0.02, 0.08, (n_markets, 1)))
+        margins = prob.sum(axis=1) - 1
+
+        start = time.perf_counter()
+        batch_implied_odds(prob, method="basic", margin=margins, normalize=False)
+        basic_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = batch_implied_odds(prob, method="shin", margin=margins, normalize=False)
+        shin_time = time.perf_counter() - start
+
+        # The shin package is no longer a dependency; compare against it on a sample when installed
+        pkg_time, max_diff = float("nan"), float("nan")
+        if shin is not None:
+            sample = prob[:10000]
+            start = time.perf_counter()
+            expected = np.array([shin.calculate_implied_probabilities(list(1 / p)) for p in sample])
+            pkg_time = (time.perf_counter() - start) * n_markets / len(sample)
+            max_diff = np.abs(1 / result["implied_odds"][:len(sample)] - expected).max()
+
+        print(f"{n:>8}{basic_time:>11.4f}{shin_time:>10.4f}{result['iterations'].max():>10}"
+              f"{pkg_time:>14.3f}{max_diff:>12.1e}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,69 @@
+# Import time and time to first response of the app in each preload mode, in fresh interpreters
+#
+# Usage: python benchmarks/bench_startup.py [--repeats N] [--budget-ms MS]
+#
+# With --budget-ms the script exits with status 1 when the median import time of the default
+# ("configured") mode exceeds the budget, so import-time regressions can fail a CI job.
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "source")
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+response = client.post("/", data={"kelly_budget": "1000", "kelly_mult": "0.1",
+                                  "odds_input": "1.5/2.6, 2.1/3.4/3.9", "final_odds": "3.8"})
+assert response.status_code == 200
+first_response = time.perf_counter()
+print(json.dumps({"import": imported - start, "first_response": first_response - imported,
+                  "modules": sorted(m for m in ("numpy", "scipy", "flask") if m in sys.modules)}))
+"""
+
+SCENARIOS = [
+    ("configured, all methods", {"DEVIG_PRELOAD": "configured"}),
+    ("configured, mult+add", {"DEVIG_PRELOAD": "configured", "DEVIG_METHODS": "mult,add"}),
+    ("none (fully lazy)", {"DEVIG_PRELOAD": "none"}),
+    ("all backends", {"DEVIG_PRELOAD": "all"}),
+]
+
+
+def run_probe(env):
+    result = subprocess.run([sys.executable, "-c", PROBE], cwd=SOURCE_DIR, env={**os.environ, **env},
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    print(f"{'mode':<26}{'import (ms)':>12}{'first response (ms)':>21}  loaded")
+    medians = {}
+    for label, env in SCENARIOS:
+        runs = [run_probe(env) for _ in range(args.repeats)]
+        import_ms = statistics.median(r["import"] for r in runs) * 1000
+        first_ms = statistics.median(r["first_response"] for r in runs) * 1000
+        medians[label] = import_ms
+        print(f"{label:<26}{import_ms:>12.1f}{first_ms:>21.1f}  {', '.join(runs[0]['modules'])}")
+
+    if args.budget_ms is not None:
+        default_ms = medians[SCENARIOS[0][0]]
+        if default_ms > args.budget_ms:
+            print(f"FAIL: import takes {default_ms:.1f} ms, budget is {args.budget_ms:.1f} ms")
+            sys.exit(1)
+        print(f"OK: import takes {default_ms:.1f} ms, budget is {args.budget_ms:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
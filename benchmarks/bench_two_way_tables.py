@@ -0,0 +1,60 @@
+# Power method on two-way markets: interpolation table against the Newton solver
+#
+# Usage: python benchmarks/bench_two_way_tables.py [n_markets]
+# Builds a table in a temporary directory unless DEVIG_TWO_WAY_TABLES points to one.
+
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "source"))
+
+import two_way_tables  # noqa: E402
+from batch_implied_odds import batch_implied_odds, solve_power_exponent_market  # noqa: E402
+
+
+def random_two_way(n_markets, seed=0):
+    rng = np.random.default_rng(seed)
+    q = rng.uniform(0.1, 0.9, n_markets)
+    m = rng.uniform(0.02, 0.08, n_markets)
+    return np.stack([q * (1 + m), (1 - q) * (1 + m)], axis=1)
+
+
+def main():
+    n_markets = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    if not os.environ.get("DEVIG_TWO_WAY_TABLES"):
+        path = os.path.join(tempfile.mkdtemp(), "power.tbl")
+        start = time.perf_counter()
+        two_way_tables.write_table(path, *two_way_tables.build_table("power"))
+        print(f"built {path} in {time.perf_counter() - start:.1f} s")
+        os.environ["DEVIG_TWO_WAY_TABLES"] = path
+    table = two_way_tables.get_table("power")
+
+    prob = random_two_way(n_markets)
+    sample = prob[:10000].tolist()
+
+    start = time.perf_counter()
+    exponents = [table.lookup(p1, p2) for p1, p2 in sample]
+    lookup = (time.perf_counter() - start) / len(sample)
+    start = time.perf_counter()
+    for p in sample:
+        solve_power_exponent_market(p)
+    solve = (time.perf_counter() - start) / len(sample)
+    hits = sum(a is not None for a in exponents) / len(sample)
+    print(f"single market: lookup {lookup * 1e6:.2f} us, solver {solve * 1e6:.2f} us, hit rate {hits:.1%}")
+
+    timings = {}
+    for name, tables in (("solver", {}), ("table", None)):
+        two_way_tables._TABLES = tables
+        start = time.perf_counter()
+        batch_implied_odds(prob, method="power", normalize=False)
+        timings[name] = time.perf_counter() - start
+    print(f"batch of {n_markets}: table {timings['table'] * 1000:.1f} ms, solver {timings['solver'] * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
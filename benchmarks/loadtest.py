@@ -0,0 +1,91 @@
+# Load test of a running devigger server: requests/second and p50/p99 latency per endpoint
+#
+# Usage:
+#   gunicorn -c gunicorn.conf.py --chdir source app:app &
+#   python benchmarks/loadtest.py http://127.0.0.1:5000 --concurrency 16 --duration 20
+
+import argparse
+import json
+import statistics
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+FORM = {"kelly_budget": "10000", "kelly_mult": "0.1",
+        "odds_input": "1.5/2.6, 2.1/3.4/3.9, 1.91/1.91", "final_odds": "7.5"}
+
+
+def scenarios(batch_size):
+    parlay = {"legs": [[1.5, 2.6], [2.1, 3.4, 3.9], [1.91, 1.91]], "final_odds": 7.5,
+              "kelly_budget": 10000, "kelly_mult": 0.1}
+    return {
+        "POST /": ("/", urllib.parse.urlencode(FORM).encode(), "application/x-www-form-urlencoded"),
+        f"POST /api/devig x{batch_size}": ("/api/devig", json.dumps([parlay] * batch_size).encode(),
+                                           "application/json"),
+    }
+
+
+def worker(url, body, content_type, stop_at, latencies, errors, lock):
+    while time.perf_counter() < stop_at:
+        request = urllib.request.Request(url, data=body, headers={"Content-Type": content_type})
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                response.read()
+            ok = True
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            if ok:
+                latencies.append(elapsed)
+            else:
+                errors.append(elapsed)
+
+
+def run_scenario(url, body, content_type, concurrency, duration):
+    latencies, errors, lock = [], [], threading.Lock()
+    stop_at = time.perf_counter() + duration
+    threads = [threading.Thread(target=worker, args=(url, body, content_type, stop_at, latencies, errors, lock))
+               for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    result = {"requests": len(latencies), "errors": len(errors), "rps": len(latencies) / wall}
+    if len(latencies) >= 2:
+        quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+        result.update(p50_ms=quantiles[49] * 1000, p99_ms=quantiles[98] * 1000)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the devigger endpoints.")
+    parser.add_argument("base_url", nargs="?", default="http://127.0.0.1:5000")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10, help="seconds per endpoint")
+    parser.add_argument("--batch-size", type=int, default=100, help="parlays per /api/devig request")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = {}
+    for name, (path, body, content_type) in scenarios(args.batch_size).items():
+        results[name] = run_scenario(args.base_url.rstrip("/") + path, body, content_type,
+                                     args.concurrency, args.duration)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'endpoint':<26}{'requests':>9}{'errors':>8}{'req/s':>9}{'p50 (ms)':>10}{'p99 (ms)':>10}")
+    for name, r in results.items():
+        print(f"{name:<26}{r['requests']:>9}{r['errors']:>8}{r['rps']:>9.1f}"
+              f"{r.get('p50_ms', float('nan')):>10.1f}{r.get('p99_ms', float('nan')):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
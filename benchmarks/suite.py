@@ -0,0 +1,143 @@
+# Benchmark suite: devig methods, odds conversions, Kelly sizing and the end-to-end page request
+#
+# Usage:
+#   python benchmarks/suite.py                              # run and print
+#   python benchmarks/suite.py --output results.json        # also write machine-readable results
+#   python benchmarks/suite.py --save-baseline              # store the results as the new baseline
+#   python benchmarks/suite.py --compare --threshold 0.25   # exit 1 on a >25% slowdown vs the baseline
+
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "source"))
+
+from implied_odds import _convert_dec_to_frac, _convert_dec_to_us_odds, implied_odds  # noqa: E402
+from utils import kelly_bet  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+IMPLIED_ODDS_METHODS = ["naive", "basic", "wpo", "odds_ratio", "power", "additive", "shin", "balanced_book"]
+
+MARKETS = {
+    "2way": [1.91, 1.91],
+    "3way": [2.1, 3.4, 3.9],
+    "12way": [4.5, 5.5, 6.0, 8.0, 9.0, 11.0, 13.0, 15.0, 21.0, 26.0, 34.0, 51.0],
+}
+
+
+def cases():
+    """
+    Builds the benchmark cases.
+
+    Returns:
+        dict: Case name -> zero-argument callable timing one operation.
+    """
+    suite = {}
+
+    for market_name, odds in MARKETS.items():
+        probs = [1 / o for o in odds]
+        margin = sum(probs) - 1
+        for method in IMPLIED_ODDS_METHODS:
+            suite[f"implied_odds/{method}/{market_name}"] = (
+                lambda probs=probs, margin=margin, method=method:
+                implied_odds(probs, category="dec", method=method, margin=margin, normalize=False)
+            )
+
+    many_odds = [1.01 + 0.37 * i for i in range(100)]
+    suite["convert/dec_to_us/100"] = lambda: _convert_dec_to_us_odds(many_odds)
+    suite["convert/dec_to_frac/100"] = lambda: _convert_dec_to_frac(many_odds)
+
+    suite["kelly_bet"] = lambda: kelly_bet(0.55, 1.0, 10000, 0.25)
+
+    from app import RESPONSE_CACHE, app
+    client = app.test_client()
+    form = {"kelly_budget": "10000", "kelly_mult": "0.1",
+            "odds_input": "1.5/2.6, 2.1/3.4/3.9, 1.91/1.91", "final_odds": "7.5"}
+
+    def post_index(cached=False):
+        if not cached:
+            RESPONSE_CACHE.clear()
+        response = client.post("/", data=form)
+        assert response.status_code == 200
+
+    suite["app/index_post/3legs"] = post_index
+    suite["app/index_post_cached/3legs"] = lambda: post_index(cached=True)
+
+    return suite
+
+
+def measure(func, repeat=5, min_time=0.2):
+    """
+    Times a callable with timeit, auto-scaling the loop count.
+
+    Returns:
+        float: Best-of-repeat seconds per call.
+    """
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def compare(results, baseline, threshold):
+    """
+    Compares results with a baseline.
+
+    Returns:
+        list: (case, baseline seconds, current seconds, ratio) for every case slower than 1 + threshold.
+    """
+    regressions = []
+    for name, seconds in results.items():
+        base = baseline.get(name)
+        if base and seconds / base > 1 + threshold:
+            regressions.append((name, base, seconds, seconds / base))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the devigger benchmark suite.")
+    parser.add_argument("--filter", default="", help="only run cases whose name contains this string")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the baseline")
+    parser.add_argument("--compare", action="store_true", help="compare against the baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown, e.g. 0.25 = 25%%")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.compare and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    results = {}
+    for name, func in cases().items():
+        if args.filter not in name:
+            continue
+        results[name] = measure(func, repeat=args.repeat)
+        base = baseline.get(name)
+        change = f"{(results[name] / base - 1) * 100:+7.1f}%" if base else ""
+        print(f"{name:<36}{results[name] * 1e6:>12.2f} us {change}")
+
+    report = {"python": platform.python_version(), "machine": platform.machine(), "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        regressions = compare(results, baseline, args.threshold)
+        for name, base, seconds, ratio in regressions:
+            print(f"REGRESSION {name}: {base * 1e6:.2f} us -> {seconds * 1e6:.2f} us ({ratio:.2f}x)")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+# Production serving settings, used by the Procfile: gunicorn -c gunicorn.conf.py --chdir source app:app
+# Every setting can be overridden through the environment variables below.
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+# Worker processes and threads per worker. Solver calls are CPU-bound, so processes give the
+# parallelism; a few threads keep cheap requests (GET /, cached legs) from queueing behind them
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+worker_class = "gthread" if threads > 1 else "sync"
+
+# Recycle workers gracefully after a number of requests (with jitter so they do not restart together)
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 2000))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 200))
+
+# Hard limit: a worker silent for longer than this is killed and replaced. The app enforces its own,
+# shorter deadline around the solver calls (DEVIG_REQUEST_TIMEOUT) and answers with an error instead
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+
+# Load the app (and its preloaded solver backends) once in the master, workers fork from it
+preload_app = True
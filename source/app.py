@@ -1,16 +1,101 @@
+import json
 import os
-import statistics
+import threading
+import time
 
-from flask import Flask, request, render_template, make_response
-import numpy as np
-import pybettor
-import shin
+from flask import Flask, Response, request, render_template, make_response, jsonify, g
 
-from implied_odds import implied_odds
-from utils import calculate_margin, kelly_bet
+import backends
+import metrics
+from devig_cache import DEVIG_CACHE
+from odds_parser import ODDS_FORMATS, SlipError, parse_price, parse_slip
+from pricing import DEFAULT_METHODS, METHODS, format_consensus, format_method, format_summary, price_parlay
+from response_cache import etag, from_environment, request_key
 
 app = Flask(__name__, template_folder='../templates')
 
+# Methods offered by the page and the APIs, e.g. DEVIG_METHODS=mult,add (default: every method but naive)
+ENABLED_METHODS = [m.strip() for m in os.environ.get("DEVIG_METHODS", ",".join(DEFAULT_METHODS)).split(",")
+                   if m.strip()]
+assert ENABLED_METHODS and all(m in METHODS for m in ENABLED_METHODS), \
+    f"DEVIG_METHODS must be a non-empty subset of {list(METHODS)}"
+
+# Solver backends are imported the first time a method needs them. DEVIG_PRELOAD=configured (default)
+# loads the backends of the enabled methods at startup, "all" loads every backend, "none" loads nothing
+DEVIG_PRELOAD = os.environ.get("DEVIG_PRELOAD", "configured")
+assert DEVIG_PRELOAD in backends.PRELOAD_MODES, f"DEVIG_PRELOAD must be one of {backends.PRELOAD_MODES}"
+if DEVIG_PRELOAD == "configured":
+    backends.preload([METHODS[m] for m in ENABLED_METHODS])
+elif DEVIG_PRELOAD == "all":
+    backends.preload(backends.METHOD_BACKENDS)
+
+# Rendered responses of repeated pricing requests (DEVIG_RESPONSE_CACHE=memory|sqlite|off, see
+# response_cache.from_environment); the sqlite backend is shared by the workers
+RESPONSE_CACHE = from_environment()
+
+# Seconds a request may spend in the solvers before it is answered with an error
+# (gunicorn.conf.py kills workers only after the longer GUNICORN_TIMEOUT)
+DEVIG_REQUEST_TIMEOUT = float(os.environ.get("DEVIG_REQUEST_TIMEOUT", 10))
+
+
+def _profile_requested():
+    # Opt-in per request: ?profile=1 or an "X-Devig-Profile: 1" header
+    return request.args.get("profile") == "1" or request.headers.get("X-Devig-Profile") == "1"
+
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+    g.profile = metrics.Profile() if _profile_requested() else None
+
+
+@app.after_request
+def record_request(response):
+    if request.endpoint not in (None, "static", "metrics_endpoint"):
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - g.request_start, request.endpoint)
+        metrics.REQUESTS.inc(request.endpoint, str(response.status_code))
+    if g.get("profile") is not None:
+        response.headers["Server-Timing"] = g.profile.server_timing()
+    return response
+
+
+def _cached_response(body, mimetype):
+    """
+    Response of a cacheable body with its ETag, or 304 Not Modified when a GET request already has it.
+    """
+    tag = etag(body)
+    if request.method == "GET" and request.if_none_match.contains(tag):
+        RESPONSE_CACHE.record_not_modified(len(body))
+        response = make_response("", 304)
+    else:
+        response = make_response(body)
+        response.mimetype = mimetype
+    response.set_etag(tag)
+    return response
+
+
+# Template variable of each method's results
+RESULT_NAMES = {
+    "mult": "multiplicative_results",
+    "add": "additive_results",
+    "power": "power_results",
+    "shin": "shin_results",
+    "wpo": "wpo_results",
+    "odds_ratio": "odds_ratio_results",
+    "balanced_book": "balanced_book_results",
+    "naive": "naive_results",
+}
+
+
+def _render_results(result):
+    # The results part of the page, by template variable
+    min_results, avg_results, max_results, spread_results = format_summary(result)
+    results = {"min_results": min_results, "avg_results": avg_results, "max_results": max_results,
+               "spread_results": spread_results, "consensus_results": format_consensus(result)}
+    for method in result.methods:
+        results[RESULT_NAMES[method]] = format_method(result, method)
+    return results
+
 
 @app.route("/", methods=["GET", "POST"])
 def index():
@@ -20,22 +105,23 @@ def index():
     kelly_mult_input = request.cookies.get("kelly_mult", "")
     odds_input = ""
     final_odds = ""
+    odds_format = "auto"
     error = None
 
-    multiplicative_results_str = None
-    additive_results_str = None
-    power_results_str = None
-    shin_results_str = None
-    min_results_str = None
-    avg_results_str = None
-    error = None
+    # A POST of the form, or a GET with the form fields in the query string (a shareable link to a slip)
+    if request.method == "POST" or "odds_input" in request.args:
+        form = request.form if request.method == "POST" else request.args
 
-    if request.method == "POST":
         # Get inputs
-        kelly_budget_input = request.form.get("kelly_budget", "")
-        kelly_mult_input = request.form.get("kelly_mult", "")
-        odds_input = request.form.get("odds_input", "")
-        final_odds_input = request.form.get("final_odds", "")
+        kelly_budget_input = form.get("kelly_budget", "")
+        kelly_mult_input = form.get("kelly_mult", "")
+        odds_input = form.get("odds_input", "")
+        final_odds_input = form.get("final_odds", "")
+        odds_format = form.get("odds_format", "auto")
+
+        results = {}
+        page = None
+        page_key = None
 
         # Validate input and perform calculations
         try:
@@ -44,62 +130,59 @@ def index():
                 raise ValueError("All fields are required.")
             kelly_budget = float(kelly_budget_input)
             kelly_mult = float(kelly_mult_input)
-            final_odds = float(final_odds_input)
-
-            # Parse odds input
-            legs = odds_input.split(',')
-            legs_odds = []
-            legs_probs = []
-            for leg in legs:
-                odds = list(map(float, leg.split('/')))
-                probs = [1 / o for o in odds]
-                legs_odds.append(odds)
-                legs_probs.append(probs)
-
-            # Calculate raw margin for each leg
-            margins = [calculate_margin(odds) for odds in legs_odds]
-
-            # Calculations for each method
-            results = {
-                "mult": calculate_multiplicative_method(legs_odds, legs_probs, margins, final_odds, kelly_budget, kelly_mult),
-                "add": calculate_additive_method(legs_odds, legs_probs, margins, final_odds, kelly_budget, kelly_mult),
-                "power": calculate_power_method(legs_odds, legs_probs, margins, final_odds, kelly_budget, kelly_mult),
-                "shin": calculate_shin_method(legs_odds, legs_probs, margins, final_odds, kelly_budget, kelly_mult)
-            }
-
-            evs = [result[1][1] for result in results.items()]
-            kellys = [result[1][2] for result in results.items()]
-
-            ev_avg = round(statistics.mean(evs), 2)
-            kelly_avg = round(statistics.mean(kellys), 2)
-            avg_results_str = f"AVG: EV% = {ev_avg}%, Kelly Wager = ${kelly_avg}"
-
-            ev_min = min(evs)
-            kelly_min = min(kellys)
-            min_results_str = f"MIN: EV% = {ev_min}%, Kelly Wager = ${kelly_min}"
-
-            multiplicative_results_str = results["mult"][0]
-            additive_results_str = results["add"][0]
-            power_results_str = results["power"][0]
-            shin_results_str = results["shin"][0]
 
+            # Parse odds input (decimal, US or fractional), devig with every enabled method, render the results
+            with metrics.stage(g.profile, "parse"):
+                slip = parse_slip(odds_input, odds_format)
+                slip.check()
+                legs_odds = slip.legs()
+                final_odds = parse_price(final_odds_input, odds_format)
+
+            # Repeated submissions: the page is cached by the normalized inputs and the form text it shows,
+            # the results by the normalized inputs alone, so they skip the solvers and the rendering
+            inputs = [legs_odds, final_odds, kelly_budget, kelly_mult, ENABLED_METHODS]
+            page_key = request_key("index", inputs,
+                                   [kelly_budget_input, kelly_mult_input, odds_input, final_odds_input, odds_format])
+            page = RESPONSE_CACHE.get(page_key)
+            if page is None:
+                results_key = request_key("index.results", inputs)
+                results = RESPONSE_CACHE.get_json(results_key)
+                if results is None:
+                    result = price_parlay(legs_odds, final_odds, kelly_budget, kelly_mult, ENABLED_METHODS,
+                                          deadline=time.monotonic() + DEVIG_REQUEST_TIMEOUT, profile=g.profile)
+                    with metrics.stage(g.profile, "render"):
+                        results = _render_results(result)
+                    RESPONSE_CACHE.put_json(results_key, results)
+
+        except TimeoutError as e:
+            metrics.TIMEOUTS.inc("index")
+            error = f"The calculation took too long, please try again with fewer legs.\n\nError: '{str(e)}'"
+            results, page_key = {}, None
+        except SlipError as e:
+            metrics.INPUT_ERRORS.inc("page")
+            error = f"Invalid odds, please correct these legs:\n\n{e}"
+            results, page_key = {}, None
         except Exception as e:
+            metrics.INPUT_ERRORS.inc("page")
             error = f"Invalid input. Please enter valid numbers.\n\nError: '{str(e)}'"
-
-        response = make_response(render_template(
-            "index.html",
-            multiplicative_results=multiplicative_results_str,
-            additive_results=additive_results_str,
-            power_results=power_results_str,
-            shin_results=shin_results_str,
-            min_results=min_results_str,
-            avg_results=avg_results_str,
-            kelly_budget=kelly_budget_input,
-            kelly_mult=kelly_mult_input,
-            odds_input=odds_input,
-            final_odds=final_odds_input,
-            error=error
-        ))
+            results, page_key = {}, None
+
+        if page is None:
+            with metrics.stage(g.profile, "render"):
+                page = render_template(
+                    "index.html",
+                    **results,
+                    kelly_budget=kelly_budget_input,
+                    kelly_mult=kelly_mult_input,
+                    odds_input=odds_input,
+                    final_odds=final_odds_input,
+                    odds_format=odds_format,
+                    odds_formats=ODDS_FORMATS,
+                    error=error
+                ).encode()
+            if page_key is not None:
+                RESPONSE_CACHE.put(page_key, page)
+        response = _cached_response(page, "text/html")
 
         # Save Kelly values to cookies, with 1 year expiration
         response.set_cookie("kelly_budget", kelly_budget_input, max_age=60 * 60 * 24 * 365)
@@ -108,177 +191,428 @@ def index():
         # Render page with calculated values
         return response
 
-    # Request is not POST: render page, fill form with values from cookies
+    # No inputs: render page, fill form with values from cookies
     return render_template("index.html",
                            kelly_budget=kelly_budget_input,
-                           kelly_mult=kelly_mult_input)
-
-
-def calculate_power_method(legs_odds, legs_probs, margins, final_odds, kelly_budget, kelly_mult):
-    # Devig each leg
-    legs_odds_devigged = []
-    legs_odds_devigged_us = []
-    for i in range(len(legs_odds)):
-        devigged_odds = implied_odds(legs_probs[i], category="dec", method="power", normalize=False,
-                                     margin=margins[i])['implied_odds']
-        devigged_odds_us = pybettor.convert_odds(devigged_odds, cat_in="dec", cat_out="us")
-        legs_odds_devigged.append(devigged_odds)
-        legs_odds_devigged_us.append(devigged_odds_us)
-
-    # Total odds calculation
-    total_odds_devigged = np.prod([leg_odds[0] for leg_odds in legs_odds_devigged])
-    total_odds_devigged_us = pybettor.convert_odds(total_odds_devigged, cat_in="dec", cat_out="us")
-
-    # EV calculation
-    total_ev = round(pybettor.expected_value_calc(1 / total_odds_devigged, final_odds, category="dec", risk=100), 2)
-
-    # Kelly bet amount calculation
-    if kelly_mult and kelly_budget:
-        total_kelly_bet = round(kelly_bet(1 / total_odds_devigged, final_odds - 1, kelly_budget, kelly_mult), 2)
-
-    # Output formatting
-    legs_summary = []
-    for i in range(len(legs_odds_devigged)):
-        legs_summary.append(f"Leg#{i} ({legs_odds[i][0]}): Margin = {round(margins[i] * 100, 2)}% | "
-                            f"Fair Value = {round(legs_odds_devigged[i][0], 2)} "
-                            f"(US {legs_odds_devigged_us[i][0]}) "
-                            f"({round(1 / legs_odds_devigged[i][0] * 100, 2)}%)")
-    summary = "<br>".join(legs_summary)
-
-    summary += f"<br>Final Odds ({final_odds}): Total Fair Value = {round(total_odds_devigged, 2)} " \
-               f"(US {total_odds_devigged_us[0]}) ({round(1 / total_odds_devigged * 100, 2)}%)"
-
-    return (
-        f"{summary}<br>EV% = {total_ev}%, Kelly Wager = ${total_kelly_bet}",
-        total_ev,
-        total_kelly_bet
-    )
-
-
-def calculate_additive_method(legs_odds, legs_probs, margins, final_odds, kelly_budget, kelly_mult):
-    # Devig each leg
-    legs_odds_devigged = []
-    legs_odds_devigged_us = []
-    for i in range(len(legs_odds)):
-        devigged_odds = implied_odds(legs_probs[i], category="dec", method="additive", normalize=False,
-                                     margin=margins[i])
-        devigged_odds_us = pybettor.convert_odds(devigged_odds, cat_in="dec", cat_out="us")
-        legs_odds_devigged.append(devigged_odds)
-        legs_odds_devigged_us.append(devigged_odds_us)
-
-    # Total odds calculation
-    total_odds_devigged = np.prod([leg_odds[0] for leg_odds in legs_odds_devigged])
-    total_odds_devigged_us = pybettor.convert_odds(total_odds_devigged, cat_in="dec", cat_out="us")
-
-    # EV calculation
-    total_ev = round(pybettor.expected_value_calc(1 / total_odds_devigged, final_odds, category="dec", risk=100), 2)
-
-    # Kelly bet amount calculation
-    if kelly_mult and kelly_budget:
-        total_kelly_bet = round(kelly_bet(1 / total_odds_devigged, final_odds - 1, kelly_budget, kelly_mult), 2)
-
-    # Output formatting
-    legs_summary = []
-    for i in range(len(legs_odds_devigged)):
-        legs_summary.append(f"Leg#{i} ({legs_odds[i][0]}): Margin = {round(margins[i] * 100, 2)}% | "
-                            f"Fair Value = {round(legs_odds_devigged[i][0], 2)} "
-                            f"(US {legs_odds_devigged_us[i][0]}) "
-                            f"({round(1 / legs_odds_devigged[i][0] * 100, 2)}%)")
-    summary = "<br>".join(legs_summary)
-
-    summary += f"<br>Final Odds ({final_odds}): Total Fair Value = {round(total_odds_devigged, 2)} " \
-               f"(US {total_odds_devigged_us[0]}) ({round(1 / total_odds_devigged * 100, 2)}%)"
-
-    return (
-        f"{summary}<br>EV% = {total_ev}%, Kelly Wager = ${total_kelly_bet}",
-        total_ev,
-        total_kelly_bet
+                           kelly_mult=kelly_mult_input,
+                           odds_format=odds_format,
+                           odds_formats=ODDS_FORMATS)
+
+
+@app.route("/api/devig", methods=["POST"])
+def api_devig():
+    # Imported here so the batch engine is only loaded once the bulk API is used
+    from bulk_devig import MAX_BATCH_SIZE, devig_parlays
+
+    # Bulk JSON API: {"parlays": [{"legs": [[1.5, 2.6], ...], "final_odds": 3.0,
+    #                              "kelly_budget": 10000, "kelly_mult": 0.1}, ...],
+    #                 "methods": ["mult", "add", "power", "shin"]}
+    with metrics.stage(g.profile, "parse"):
+        payload = request.get_json(silent=True)
+    if isinstance(payload, list):
+        payload = {"parlays": payload}
+    if not isinstance(payload, dict) or not isinstance(payload.get("parlays"), list):
+        return jsonify(error="Expected a JSON array of parlays or an object with a 'parlays' array."), 400
+
+    parlays = payload["parlays"]
+    if len(parlays) > MAX_BATCH_SIZE:
+        return jsonify(error=f"At most {MAX_BATCH_SIZE} parlays are accepted per request."), 413
+
+    methods = payload.get("methods", ENABLED_METHODS)
+    if not isinstance(methods, list) or not methods or any(m not in ENABLED_METHODS for m in methods):
+        return jsonify(error=f"methods must be a non-empty subset of {ENABLED_METHODS}."), 400
+
+    # Identical batches are answered from the response cache (not when a profile is requested)
+    key = request_key("api_devig", parlays, methods) if g.profile is None else None
+    body = RESPONSE_CACHE.get(key) if key is not None else None
+    if body is not None:
+        return _cached_response(body, "application/json")
+
+    try:
+        results = devig_parlays(parlays, methods, deadline=time.monotonic() + DEVIG_REQUEST_TIMEOUT,
+                                profile=g.profile)
+    except TimeoutError as e:
+        metrics.TIMEOUTS.inc("api_devig")
+        return jsonify(error=str(e)), 504
+    if g.profile is not None:
+        return jsonify(results=results, profile=g.profile.as_dict())
+    body = jsonify(results=results).get_data()
+    RESPONSE_CACHE.put(key, body)
+    return _cached_response(body, "application/json")
+
+
+@app.route("/api/search", methods=["POST"])
+def api_search():
+    # Imported here so the search engine is only loaded once it is used
+    from parlay_search import MAX_PARLAY_LEGS, MAX_POOL_SIZE, ParlayPricing, search_parlays
+
+    # Parlay search API: {"legs": [{"id": "a", "event": "match-1", "odds": [1.9, 2.0], "offered_odds": 1.95}, ...],
+    #                     "max_legs": 3, "top_k": 10, "objective": "ev", "method": "mult",
+    #                     "boost": 0.0, "max_odds": null, "exclude": [["a", "b"]],
+    #                     "kelly_budget": 10000, "kelly_mult": 0.1}
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get("legs"), list):
+        return jsonify(error="Expected an object with a 'legs' array."), 400
+    if len(payload["legs"]) > MAX_POOL_SIZE:
+        return jsonify(error=f"At most {MAX_POOL_SIZE} legs are accepted per request."), 413
+
+    method = payload.get("method", ENABLED_METHODS[0])
+    if method not in ENABLED_METHODS:
+        return jsonify(error=f"method must be one of {ENABLED_METHODS}."), 400
+
+    try:
+        max_legs = int(payload.get("max_legs", 3))
+        if max_legs > MAX_PARLAY_LEGS:
+            raise ValueError(f"max_legs must be at most {MAX_PARLAY_LEGS}")
+        max_odds = payload.get("max_odds")
+        pricing = ParlayPricing(boost=float(payload.get("boost", 0)),
+                                max_odds=float(max_odds) if max_odds is not None else None)
+        parlays, stats = search_parlays(
+            payload["legs"],
+            max_legs=max_legs,
+            top_k=int(payload.get("top_k", 10)),
+            objective=payload.get("objective", "ev"),
+            method=method,
+            pricing=pricing,
+            exclude=payload.get("exclude", []),
+            kelly_budget=float(payload.get("kelly_budget", 100)),
+            kelly_mult=float(payload.get("kelly_mult", 1)),
+            min_legs=int(payload.get("min_legs", 2)),
+            deadline=time.monotonic() + DEVIG_REQUEST_TIMEOUT,
+        )
+    except TimeoutError as e:
+        metrics.TIMEOUTS.inc("api_search")
+        return jsonify(error=str(e)), 504
+    except (AssertionError, ValueError, TypeError) as e:
+        metrics.INPUT_ERRORS.inc("search")
+        return jsonify(error=str(e)), 400
+    return jsonify(parlays=parlays, stats=stats)
+
+
+@app.route("/api/portfolio", methods=["POST"])
+def api_portfolio():
+    # Imported here so scipy is only loaded once the optimizer is used
+    from portfolio_kelly import MAX_PORTFOLIO_SIZE, optimize_portfolio
+
+    # Portfolio Kelly API: {"bets": [{"prob": 0.55, "odds": 2.0}, ...],
+    #                       "kelly_budget": 10000, "kelly_mult": 0.25, "max_exposure": 0.5}
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get("bets"), list) or not payload["bets"]:
+        return jsonify(error="Expected an object with a non-empty 'bets' array."), 400
+    if len(payload["bets"]) > MAX_PORTFOLIO_SIZE:
+        return jsonify(error=f"At most {MAX_PORTFOLIO_SIZE} bets are accepted per request."), 413
+
+    try:
+        probs = [float(bet["prob"]) for bet in payload["bets"]]
+        odds = [float(bet["odds"]) for bet in payload["bets"]]
+        result = optimize_portfolio(
+            probs,
+            odds,
+            kelly_budget=float(payload.get("kelly_budget", 100)),
+            kelly_mult=float(payload.get("kelly_mult", 1)),
+            max_exposure=float(payload.get("max_exposure", 1)),
+        )
+    except KeyError as e:
+        metrics.INPUT_ERRORS.inc("portfolio")
+        return jsonify(error=f"every bet needs {e}"), 400
+    except (AssertionError, ValueError, TypeError) as e:
+        metrics.INPUT_ERRORS.inc("portfolio")
+        return jsonify(error=str(e)), 400
+
+    return jsonify(
+        stakes=result["stakes"].tolist(),
+        independent_stakes=result["independent_stakes"].tolist(),
+        exposure=result["exposure"],
+        growth=result["growth"],
+        exact=result["exact"],
+        converged=result["converged"],
     )
 
 
-def calculate_multiplicative_method(legs_odds, legs_probs, margins, final_odds, kelly_budget, kelly_mult):
-    # Devig each leg
-    legs_odds_devigged = []
-    legs_odds_devigged_us = []
-    for i in range(len(legs_odds)):
-        devigged_odds = implied_odds(legs_probs[i], category="dec", method="basic", normalize=False,
-                                     margin=margins[i])
-        devigged_odds_us = pybettor.convert_odds(devigged_odds, cat_in="dec", cat_out="us")
-        legs_odds_devigged.append(devigged_odds)
-        legs_odds_devigged_us.append(devigged_odds_us)
-
-    # Total odds calculation
-    total_odds_devigged = np.prod([leg_odds[0] for leg_odds in legs_odds_devigged])
-    total_odds_devigged_us = pybettor.convert_odds(total_odds_devigged, cat_in="dec", cat_out="us")
-
-    # EV calculation
-    total_ev = round(pybettor.expected_value_calc(1 / total_odds_devigged, final_odds, category="dec", risk=100), 2)
-
-    # Kelly bet amount calculation
-    if kelly_mult and kelly_budget:
-        total_kelly_bet = round(kelly_bet(1 / total_odds_devigged, final_odds - 1, kelly_budget, kelly_mult), 2)
-
-    # Output formatting
-    legs_summary = []
-    for i in range(len(legs_odds_devigged)):
-        legs_summary.append(f"Leg#{i} ({legs_odds[i][0]}): Margin = {round(margins[i] * 100, 2)}% | "
-                            f"Fair Value = {round(legs_odds_devigged[i][0], 2)} "
-                            f"(US {legs_odds_devigged_us[i][0]}) "
-                            f"({round(1 / legs_odds_devigged[i][0] * 100, 2)}%)")
-    summary = "<br>".join(legs_summary)
-
-    summary += f"<br>Final Odds ({final_odds}): Total Fair Value = {round(total_odds_devigged, 2)} " \
-               f"(US {total_odds_devigged_us[0]}) ({round(1 / total_odds_devigged * 100, 2)}%)"
-
-    return (
-        f"{summary}<br>EV% = {total_ev}%, Kelly Wager = ${total_kelly_bet}",
-        total_ev,
-        total_kelly_bet
-    )
-
-
-def calculate_shin_method(legs_odds, legs_probs, margins, final_odds, kelly_budget, kelly_mult):
-    # Devig each leg
-    legs_odds_devigged = []
-    legs_odds_devigged_us = []
-    for i in range(len(legs_odds)):
-        devigged_probs = shin.calculate_implied_probabilities(legs_odds[i])
-        devigged_odds = [1/p for p in devigged_probs]
-        devigged_odds_us = pybettor.convert_odds(devigged_probs, cat_in="prob", cat_out="us")
-        legs_odds_devigged.append(devigged_odds)
-        legs_odds_devigged_us.append(devigged_odds_us)
-
-    # Total odds calculation
-    total_odds_devigged = np.prod([leg_odds[0] for leg_odds in legs_odds_devigged])
-    total_odds_devigged_us = pybettor.convert_odds(total_odds_devigged, cat_in="dec", cat_out="us")
-
-    # EV calculation
-    total_ev = round(pybettor.expected_value_calc(1 / total_odds_devigged, final_odds, category="dec", risk=100), 2)
-
-    # Kelly bet amount calculation
-    if kelly_mult and kelly_budget:
-        total_kelly_bet = round(kelly_bet(1 / total_odds_devigged, final_odds - 1, kelly_budget, kelly_mult), 2)
-
-    # Output formatting
-    legs_summary = []
-    for i in range(len(legs_odds_devigged)):
-        legs_summary.append(f"Leg#{i} ({legs_odds[i][0]}): Margin = {round(margins[i] * 100, 2)}% | "
-                            f"Fair Value = {round(legs_odds_devigged[i][0], 2)} "
-                            f"(US {legs_odds_devigged_us[i][0]}) "
-                            f"({round(1 / legs_odds_devigged[i][0] * 100, 2)}%)")
-    summary = "<br>".join(legs_summary)
-
-    summary += f"<br>Final Odds ({final_odds}): Total Fair Value = {round(total_odds_devigged, 2)} " \
-               f"(US {total_odds_devigged_us[0]}) ({round(1 / total_odds_devigged * 100, 2)}%)"
-
-    return (
-        f"{summary}<br>EV% = {total_ev}%, Kelly Wager = ${total_kelly_bet}",
-        total_ev,
-        total_kelly_bet
-    )
+@app.route("/api/bankroll", methods=["POST"])
+def api_bankroll():
+    # Imported here so numpy is only loaded once the simulator is used
+    from bankroll_sim import MAX_BETS, MAX_PATHS, MAX_STEPS, simulate_bankroll
+
+    # Bankroll simulation API: {"bets": [{"prob": 0.55, "odds": 2.0, "min_prob": 0.53}, ...],
+    #                           "kelly_mults": [0.1, 0.25, 0.5, 1], "n_bets": null, "n_paths": 100000,
+    #                           "ruin_level": 0.1, "seed": 0}
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get("bets"), list) or not payload["bets"]:
+        return jsonify(error="Expected an object with a non-empty 'bets' array."), 400
+    if len(payload["bets"]) > MAX_BETS:
+        return jsonify(error=f"At most {MAX_BETS} bets are accepted per request."), 413
+
+    try:
+        probs = [float(bet["prob"]) for bet in payload["bets"]]
+        odds = [float(bet["odds"]) for bet in payload["bets"]]
+        min_probs = None
+        if any("min_prob" in bet for bet in payload["bets"]):
+            min_probs = [float(bet.get("min_prob", bet["prob"])) for bet in payload["bets"]]
+        n_bets = int(payload["n_bets"]) if payload.get("n_bets") is not None else None
+        n_paths = int(payload.get("n_paths", 100000))
+        if n_paths > MAX_PATHS or (n_bets or len(probs)) > MAX_BETS or n_paths * (n_bets or len(probs)) > MAX_STEPS:
+            return jsonify(error=f"At most {MAX_PATHS} paths of {MAX_BETS} bets and {MAX_STEPS} bets in total "
+                                 f"are simulated per request."), 413
+        results = simulate_bankroll(
+            probs,
+            odds,
+            kelly_mults=[float(m) for m in payload.get("kelly_mults", [0.1, 0.25, 0.5, 0.75, 1])],
+            min_probs=min_probs,
+            n_bets=n_bets,
+            n_paths=n_paths,
+            ruin_level=float(payload.get("ruin_level", 0.1)),
+            seed=int(payload.get("seed", 0)),
+            deadline=time.monotonic() + DEVIG_REQUEST_TIMEOUT,
+        )
+    except TimeoutError as e:
+        metrics.TIMEOUTS.inc("api_bankroll")
+        return jsonify(error=str(e)), 504
+    except KeyError as e:
+        metrics.INPUT_ERRORS.inc("bankroll")
+        return jsonify(error=f"every bet needs {e}"), 400
+    except (AssertionError, ValueError, TypeError) as e:
+        metrics.INPUT_ERRORS.inc("bankroll")
+        return jsonify(error=str(e)), 400
+
+    return jsonify(results=results)
+
+
+# Live pricing hub of this worker, created on first use (with the simulated feed when
+# DEVIG_LIVE_SIMULATED_FEED is set), so that its feed thread starts in the worker and not in the
+# gunicorn master. Feed updates and subscriptions must reach the same worker: serve live pricing
+# with WEB_CONCURRENCY=1 and enough GUNICORN_THREADS for the open streams
+DEVIG_LIVE_SIMULATED_FEED = int(os.environ.get("DEVIG_LIVE_SIMULATED_FEED", 0))
+DEVIG_LIVE_FEED_INTERVAL = float(os.environ.get("DEVIG_LIVE_FEED_INTERVAL", 0.1))
+DEVIG_LIVE_HEARTBEAT = float(os.environ.get("DEVIG_LIVE_HEARTBEAT", 15))
+_live_hub = None
+_live_hub_lock = threading.Lock()
+
+
+def live_hub():
+    global _live_hub
+    with _live_hub_lock:
+        if _live_hub is None:
+            from live_pricing import LiveHub, SimulatedFeed
+
+            _live_hub = LiveHub(ENABLED_METHODS)
+            if DEVIG_LIVE_SIMULATED_FEED:
+                SimulatedFeed(_live_hub, DEVIG_LIVE_SIMULATED_FEED, DEVIG_LIVE_FEED_INTERVAL).start()
+        return _live_hub
+
+
+@app.route("/api/live/odds", methods=["POST"])
+def api_live_odds():
+    from live_pricing import MAX_LIVE_UPDATES
+
+    # Odds feed: {"updates": [{"market": "match-1/1x2", "odds": [2.1, 3.4, 3.9]}, ...]}
+    received = time.perf_counter()
+    payload = request.get_json(silent=True)
+    if isinstance(payload, list):
+        payload = {"updates": payload}
+    if not isinstance(payload, dict) or not isinstance(payload.get("updates"), list):
+        return jsonify(error="Expected a JSON array of updates or an object with an 'updates' array."), 400
+    if len(payload["updates"]) > MAX_LIVE_UPDATES:
+        return jsonify(error=f"At most {MAX_LIVE_UPDATES} updates are accepted per request."), 413
+
+    hub = live_hub()
+    results = []
+    for update in payload["updates"]:
+        try:
+            market_id = str(update["market"])
+            results.append({"market": market_id, "pushed": hub.publish(market_id, update["odds"], received=received)})
+        except RuntimeError as e:
+            results.append({"market": market_id, "error": str(e)})
+        except (AssertionError, ValueError, TypeError, KeyError, ZeroDivisionError) as e:
+            metrics.INPUT_ERRORS.inc("live")
+            results.append({"error": f"every update needs {e}" if isinstance(e, KeyError) else str(e)})
+    return jsonify(results=results)
+
+
+@app.route("/api/live/stream", methods=["GET"])
+def api_live_stream():
+    # Server-sent events: GET /api/live/stream?legs=match-1/1x2,match-2/ou:1&final_odds=6.5
+    #                         &kelly_budget=10000&kelly_mult=0.1&methods=mult,power
+    # pushes a "price" event with the repriced parlay (see Subscription.snapshot) after every odds update
+    # of one of its markets; "market:selection" picks an outcome other than the first
+    try:
+        legs = [leg.rsplit(":", 1) if ":" in leg else leg for leg in request.args.get("legs", "").split(",") if leg]
+        kelly_budget = request.args.get("kelly_budget")
+        kelly_mult = request.args.get("kelly_mult")
+        methods = request.args.get("methods")
+        subscription = live_hub().subscribe(
+            legs,
+            float(request.args.get("final_odds", "")),
+            kelly_budget=float(kelly_budget) if kelly_budget else None,
+            kelly_mult=float(kelly_mult) if kelly_mult else None,
+            methods=methods.split(",") if methods else None,
+        )
+    except RuntimeError as e:
+        return jsonify(error=str(e)), 503
+    except (ValueError, TypeError) as e:
+        metrics.INPUT_ERRORS.inc("live")
+        return jsonify(error=str(e)), 400
+
+    def events():
+        try:
+            while True:
+                snapshot = subscription.next_snapshot(timeout=DEVIG_LIVE_HEARTBEAT)
+                if subscription.closed:
+                    break
+                if snapshot is None:
+                    yield ": keep-alive\n\n"
+                else:
+                    yield f"event: price\nid: {snapshot['version']}\ndata: {json.dumps(snapshot)}\n\n"
+        finally:
+            # Also runs when the client disconnects and the server closes the generator
+            live_hub().unsubscribe(subscription)
+
+    response = Response(events(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+# Multi-book consensus of this worker, created on first use: books' lines are devigged with
+# DEVIG_CONSENSUS_METHOD (default power) and weighted by DEVIG_CONSENSUS_WEIGHTS (e.g. pinnacle=3,betfair=2,
+# default 1). Like the live hub, snapshots and queries must reach the same worker
+DEVIG_CONSENSUS_METHOD = os.environ.get("DEVIG_CONSENSUS_METHOD",
+                                        "power" if "power" in ENABLED_METHODS else ENABLED_METHODS[0])
+DEVIG_CONSENSUS_WEIGHTS = {book.strip(): float(weight) for book, weight in
+                           (item.split("=") for item in os.environ.get("DEVIG_CONSENSUS_WEIGHTS", "").split(",")
+                            if item.strip())}
+_book_consensus = None
+_book_consensus_lock = threading.Lock()
+
+
+def book_consensus():
+    global _book_consensus
+    with _book_consensus_lock:
+        if _book_consensus is None:
+            from book_consensus import BookConsensus
+
+            _book_consensus = BookConsensus(DEVIG_CONSENSUS_METHOD, DEVIG_CONSENSUS_WEIGHTS)
+        return _book_consensus
+
+
+@app.route("/api/consensus/odds", methods=["POST"])
+def api_consensus_odds():
+    from book_consensus import MAX_SNAPSHOT_LINES
+
+    # Odds snapshot: {"lines": [{"book": "pinnacle", "event": "match-1", "market": "1x2",
+    #                            "outcomes": ["home", "draw", "away"], "odds": [2.1, 3.4, 3.9]}, ...],
+    #                 "weights": {"pinnacle": 3}, "max_age": null}
+    # stores the lines, then refreshes the consensus of every market
+    payload = request.get_json(silent=True)
+    if isinstance(payload, list):
+        payload = {"lines": payload}
+    if not isinstance(payload, dict) or not isinstance(payload.get("lines"), list):
+        return jsonify(error="Expected a JSON array of lines or an object with a 'lines' array."), 400
+    if len(payload["lines"]) > MAX_SNAPSHOT_LINES:
+        return jsonify(error=f"At most {MAX_SNAPSHOT_LINES} lines are accepted per request."), 413
+
+    engine = book_consensus()
+    try:
+        if payload.get("weights") is not None:
+            engine.set_weights(payload["weights"])
+        max_age = float(payload["max_age"]) if payload.get("max_age") is not None else None
+    except (AttributeError, ValueError, TypeError) as e:
+        metrics.INPUT_ERRORS.inc("consensus")
+        return jsonify(error=str(e)), 400
+
+    stored, errors = engine.ingest(payload["lines"])
+    try:
+        refresh = engine.refresh(max_age=max_age, deadline=time.monotonic() + DEVIG_REQUEST_TIMEOUT)
+    except TimeoutError as e:
+        metrics.TIMEOUTS.inc("api_consensus_odds")
+        return jsonify(error=str(e)), 504
+    return jsonify(stored=stored, errors=errors, refresh=refresh)
+
+
+@app.route("/api/consensus/market", methods=["GET"])
+def api_consensus_market():
+    # GET /api/consensus/market?event=match-1&market=1x2: consensus fair odds, books and best odds
+    try:
+        result = book_consensus().market(request.args.get("event", ""), request.args.get("market", ""))
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    if result is None:
+        return jsonify(error="unknown market"), 404
+    return jsonify(result)
+
+
+@app.route("/api/consensus/price", methods=["POST"])
+def api_consensus_price():
+    # Offers priced against the consensus: {"offers": [{"event": "match-1", "market": "1x2",
+    #                                                    "outcome": "home", "odds": 2.25}, ...],
+    #                                       "kelly_budget": 10000, "kelly_mult": 0.1}
+    # or, without offers, every book's odds with an EV above min_ev: {"min_ev": 2, "top_k": 100, ...}
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify(error="Expected a JSON object."), 400
+
+    engine = book_consensus()
+    try:
+        kelly_budget = float(payload["kelly_budget"]) if payload.get("kelly_budget") is not None else None
+        kelly_mult = float(payload["kelly_mult"]) if payload.get("kelly_mult") is not None else None
+        if "offers" in payload:
+            if not isinstance(payload["offers"], list):
+                raise ValueError("offers must be a list")
+            return jsonify(results=engine.price(payload["offers"], kelly_budget, kelly_mult))
+        return jsonify(value_bets=engine.value_bets(float(payload.get("min_ev", 0)), kelly_budget, kelly_mult,
+                                                    int(payload.get("top_k", 100))))
+    except (AssertionError, ValueError, TypeError) as e:
+        metrics.INPUT_ERRORS.inc("consensus")
+        return jsonify(error=str(e)), 400
+
+
+@app.route("/api/stats", methods=["GET"])
+def api_stats():
+    live = _live_hub.stats() if _live_hub is not None else None
+    consensus = _book_consensus.stats() if _book_consensus is not None else None
+    return jsonify(devig_cache=DEVIG_CACHE.stats(), response_cache=RESPONSE_CACHE.stats(),
+                   loaded_backends=backends.loaded_backends(), live=live, consensus=consensus)
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    # Prometheus text format; every gunicorn worker keeps its own metrics, so each scrape sees one worker
+    cache = DEVIG_CACHE.stats()
+    extra_lines = [
+        "# HELP devig_cache_entries Entries in the devig cache.",
+        "# TYPE devig_cache_entries gauge",
+        f"devig_cache_entries {cache['entries']}",
+        "# HELP devig_cache_bytes Approximate memory used by the devig cache.",
+        "# TYPE devig_cache_bytes gauge",
+        f"devig_cache_bytes {cache['bytes']}",
+    ]
+    for counter in ("hits", "misses", "evictions", "expirations"):
+        extra_lines += [
+            f"# HELP devig_cache_{counter}_total Devig cache {counter}.",
+            f"# TYPE devig_cache_{counter}_total counter",
+            f"devig_cache_{counter}_total {cache[counter]}",
+        ]
+    response_cache = RESPONSE_CACHE.stats()
+    for counter in ("hits", "misses", "not_modified", "bytes_saved"):
+        extra_lines += [
+            f"# HELP devig_response_cache_{counter}_total Response cache {counter.replace('_', ' ')}.",
+            f"# TYPE devig_response_cache_{counter}_total counter",
+            f"devig_response_cache_{counter}_total {response_cache[counter]}",
+        ]
+    if _live_hub is not None:
+        extra_lines += [
+            "# HELP devig_live_subscriptions Open live pricing subscriptions.",
+            "# TYPE devig_live_subscriptions gauge",
+            f"devig_live_subscriptions {_live_hub.stats()['subscriptions']}",
+        ]
+    response = make_response(metrics.render(extra_lines))
+    response.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+    return response
 
 
 if __name__ == "__main__":
+    # Development server; in production the Procfile serves the app with gunicorn (gunicorn.conf.py)
+
     # # Run in localhost
     # app.run(debug=True)
 
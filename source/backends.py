@@ -0,0 +1,65 @@
+# Solver backends behind each devig method, loaded on first use or preloaded at startup
+
+import importlib
+import sys
+import time
+
+# Modules each implied_odds method imports when it is first used
+METHOD_BACKENDS = {
+    "naive": [],
+    "basic": ["numpy"],
+    "wpo": ["numpy"],
+    "additive": ["numpy"],
+    "balanced_book": ["numpy"],
+    "power": ["numpy", "batch_implied_odds", "two_way_tables"],
+    "shin": ["numpy", "batch_implied_odds"],
+    "odds_ratio": ["numpy", "batch_implied_odds"],
+}
+
+PRELOAD_MODES = ["configured", "all", "none"]
+
+
+def backends_for(methods):
+    """
+    Lists the backends needed by a set of implied_odds methods, without duplicates.
+
+    Args:
+        methods (list): implied_odds method names.
+
+    Returns:
+        list: Module names, in the order they should be imported.
+    """
+    modules = []
+    for method in methods:
+        for module in METHOD_BACKENDS[method]:
+            if module not in modules:
+                modules.append(module)
+    return modules
+
+
+def preload(methods):
+    """
+    Imports the backends of the given methods now, instead of on their first use.
+
+    Args:
+        methods (list): implied_odds method names.
+
+    Returns:
+        dict: Seconds spent importing each module that was not loaded yet.
+    """
+    timings = {}
+    for module in backends_for(methods):
+        if module in sys.modules:
+            continue
+        start = time.perf_counter()
+        importlib.import_module(module)
+        timings[module] = time.perf_counter() - start
+    return timings
+
+
+def loaded_backends():
+    """
+    Returns:
+        list: The backends of METHOD_BACKENDS that are currently imported.
+    """
+    return [module for module in backends_for(METHOD_BACKENDS) if module in sys.modules]
@@ -0,0 +1,163 @@
+# Monte Carlo simulation of a bankroll betting fractional Kelly stakes, for choosing the Kelly multiplier
+
+import math
+
+import numpy as np
+
+from pricing import check_deadline
+
+DEFAULT_KELLY_MULTS = (0.1, 0.25, 0.5, 0.75, 1.0)
+DEFAULT_PATHS = 100000
+# Default chunk: paths x bets simulated at once, about 50 MiB of working arrays
+CHUNK_CELLS = 1000000
+
+# Largest simulation accepted by the /api/bankroll endpoint: paths, bets per path and paths x bets
+MAX_PATHS = 5000000
+MAX_BETS = 1000
+MAX_STEPS = 100000000
+
+FINAL_QUANTILES = (0.05, 0.5, 0.95)
+DRAWDOWN_QUANTILES = (0.5, 0.9, 0.99)
+
+# Quantiles come from histograms, so memory does not grow with the number of paths: max drawdowns over
+# [0, 1], final log bankrolls over the range of the first chunk (widened; the few paths outside it are
+# counted in the edge bins)
+_DRAWDOWN_BINS = 1000
+_FINAL_BINS = 4000
+
+
+def _quantiles(counts, edges, qs):
+    # Bin centers at the requested quantiles of a histogram
+    cumulative = np.cumsum(counts) / counts.sum()
+    centers = (edges[:-1] + edges[1:]) / 2
+    return [float(centers[min(np.searchsorted(cumulative, q), len(centers) - 1)]) for q in qs]
+
+
+def simulate_bankroll(probs, odds, kelly_mults=DEFAULT_KELLY_MULTS, min_probs=None, n_bets=None,
+                      n_paths=DEFAULT_PATHS, ruin_level=0.1, chunk_size=None, seed=0, deadline=None):
+    """
+    Simulates bankroll paths betting fractional Kelly stakes, for several Kelly multipliers.
+
+    Each bet is staked kelly_mult x its Kelly fraction of the current bankroll, computed from its
+    devigged probability (as kelly_bet). The bet then wins with its true probability. The true
+    probability is the devigged one, or, when min_probs is given, drawn per path uniformly within
+    prob +- (prob - min_prob) and clipped to [0, 1]. Use the spread between the devig methods for it,
+    e.g. min_prob from the MIN EV and prob from the AVG EV: min_prob = (1 + min_ev / 100) / odds. Every
+    multiplier is simulated on the same outcomes, so the differences between them are not sampling noise.
+
+    Paths are simulated chunk_size at a time, vectorized over paths and bets.
+
+    Args:
+        probs (list): Devigged win probability of each bet.
+        odds (list): Offered decimal odds of each bet.
+        kelly_mults (list): Kelly multipliers to compare, each in (0, 1].
+        min_probs (list): Lower end of the uncertainty of each probability (default is None, the
+            devigged probabilities are exact).
+        n_bets (int): Bets per path, drawn at random from the given bets (default is None, every path
+            bets the given sequence once, in order).
+        n_paths (int): Number of simulated paths.
+        ruin_level (float): A path is ruined once its bankroll falls below this fraction of the start.
+        chunk_size (int): Paths simulated at once, which bounds memory (default is None, CHUNK_CELLS
+            bets at once).
+        seed (int): Seed of the simulation, so results are reproducible.
+        deadline (float): time.monotonic() value after which the simulation stops with a TimeoutError
+            (default is None, no deadline).
+
+    Returns:
+        list: One dictionary per multiplier: "kelly_mult", "growth" (mean log growth of the bankroll
+            per bet), "final_quantiles" (bankroll at the end as a multiple of the start, at
+            FINAL_QUANTILES), "profit_prob" (probability of ending above the start), "ruin_prob"
+            (probability of falling below ruin_level at some point), "drawdown_quantiles" (largest
+            drop from a peak, as a fraction of the peak, at DRAWDOWN_QUANTILES).
+    """
+    probs = np.asarray(probs, dtype=float)
+    odds = np.asarray(odds, dtype=float)
+    kelly_mults = np.asarray(kelly_mults, dtype=float)
+
+    assert probs.shape == odds.shape and probs.ndim == 1 and len(probs), "probs and odds must be lists of the same length"
+    assert np.all((probs > 0) & (probs < 1)), "probabilities must be between 0 and 1"
+    assert np.all((odds > 1) & np.isfinite(odds)), "decimal odds must be finite and greater than 1"
+    assert kelly_mults.ndim == 1 and len(kelly_mults), "kelly_mults must be a non-empty list"
+    assert np.all((kelly_mults > 0) & (kelly_mults <= 1)), "kelly multipliers must be in (0, 1]"
+    assert 0 < ruin_level < 1, "ruin_level must be between 0 and 1"
+    assert n_paths >= 1, "n_paths must be positive"
+    assert n_bets is None or n_bets >= 1, "n_bets must be positive"
+    assert chunk_size is None or chunk_size >= 1, "chunk_size must be positive"
+
+    spreads = None
+    if min_probs is not None:
+        min_probs = np.asarray(min_probs, dtype=float)
+        assert min_probs.shape == probs.shape, "min_probs must have one probability per bet"
+        assert np.all((min_probs > 0) & (min_probs <= probs)), "min_probs must be between 0 and probs"
+        spreads = probs - min_probs
+
+    # Log bankroll increments of every bet on a win and a loss, per multiplier (Kelly fractions of bets
+    # without an edge are 0, they are not staked)
+    kelly_fractions = np.maximum(probs - (1 - probs) / (odds - 1), 0)
+    fractions = kelly_mults[:, None] * kelly_fractions[None, :]
+    # Bet i's loss at column i, its win at column len(probs) + i
+    steps = np.concatenate([np.log1p(-fractions), np.log1p(fractions * (odds - 1))], axis=1)
+
+    n_steps = len(probs) if n_bets is None else n_bets
+    chunk_size = max(CHUNK_CELLS // n_steps, 1) if chunk_size is None else chunk_size
+    rng = np.random.default_rng(seed)
+    log_ruin = math.log(ruin_level)
+
+    n_mults = len(kelly_mults)
+    log_final_sums = np.zeros(n_mults)
+    ruined = np.zeros(n_mults, dtype=np.int64)
+    profitable = np.zeros(n_mults, dtype=np.int64)
+    drawdown_edges = np.linspace(0, 1, _DRAWDOWN_BINS + 1)
+    drawdown_counts = np.zeros((n_mults, _DRAWDOWN_BINS), dtype=np.int64)
+    final_edges = [None] * n_mults
+    final_counts = np.zeros((n_mults, _FINAL_BINS), dtype=np.int64)
+
+    for start in range(0, n_paths, chunk_size):
+        check_deadline(deadline)
+        size = min(chunk_size, n_paths - start)
+
+        # Bets of each path (the sequence, or draws from the given bets) and their outcomes, as columns of
+        # steps
+        bets = np.arange(n_steps) if n_bets is None else rng.integers(0, len(probs), (size, n_steps))
+        true_probs = probs[bets]
+        if spreads is not None:
+            true_probs = np.clip(true_probs + spreads[bets] * (2 * rng.random((size, n_steps)) - 1), 0, 1)
+        outcomes = bets + len(probs) * (rng.random((size, n_steps)) < true_probs)
+        del bets, true_probs
+
+        for j in range(n_mults):
+            # Increments, then log bankroll in place; peaks, then drawdowns in place
+            log_bankroll = steps[j].take(outcomes)
+            np.cumsum(log_bankroll, axis=1, out=log_bankroll)
+            # Peaks include the starting bankroll (log 0)
+            peaks = np.maximum.accumulate(log_bankroll, axis=1)
+            np.maximum(peaks, 0, out=peaks)
+            np.subtract(log_bankroll, peaks, out=peaks)
+            max_drawdowns = 1 - np.exp(peaks.min(axis=1))
+            log_final = log_bankroll[:, -1]
+
+            log_final_sums[j] += log_final.sum()
+            ruined[j] += int((log_bankroll.min(axis=1) < log_ruin).sum())
+            profitable[j] += int((log_final > 0).sum())
+            drawdown_counts[j] += np.histogram(max_drawdowns, drawdown_edges)[0]
+
+            if final_edges[j] is None:
+                low, high = float(log_final.min()), float(log_final.max())
+                pad = max(high - low, 1e-9) / 4
+                final_edges[j] = np.linspace(low - pad, high + pad, _FINAL_BINS + 1)
+            edges = final_edges[j]
+            final_counts[j] += np.histogram(np.clip(log_final, edges[0], edges[-1]), edges)[0]
+
+    results = []
+    for j, kelly_mult in enumerate(kelly_mults.tolist()):
+        results.append({
+            "kelly_mult": kelly_mult,
+            "growth": float(log_final_sums[j] / (n_paths * n_steps)),
+            "final_quantiles": {str(q): math.exp(x) for q, x in
+                                zip(FINAL_QUANTILES, _quantiles(final_counts[j], final_edges[j], FINAL_QUANTILES))},
+            "profit_prob": float(profitable[j] / n_paths),
+            "ruin_prob": float(ruined[j] / n_paths),
+            "drawdown_quantiles": dict(zip(map(str, DRAWDOWN_QUANTILES),
+                                           _quantiles(drawdown_counts[j], drawdown_edges, DRAWDOWN_QUANTILES))),
+        })
+    return results
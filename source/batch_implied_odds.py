@@ -0,0 +1,599 @@
+# Vectorized counterpart of implied_odds.implied_odds for many markets at once
+
+import math
+import time
+from typing import Union
+
+import numpy as np
+
+import metrics
+
+BATCH_METHODS = [
+    "naive",
+    "basic",
+    "wpo",
+    "odds_ratio",
+    "power",
+    "additive",
+    "shin",
+    "balanced_book",
+]
+
+
+def pad_markets(markets, fill_value=np.nan):
+    """
+    Packs a ragged list of markets into a padded 2-D array.
+
+    Args:
+        markets (list): A list of markets, each a list of probabilities (or odds).
+        fill_value (float): Value used for the missing outcomes of shorter markets (default is NaN).
+
+    Returns:
+        np.ndarray: Array of shape (n_markets, max_outcomes).
+    """
+    lengths = [len(market) for market in markets]
+    width = max(lengths, default=0)
+    padded = np.full((len(markets), width), fill_value, dtype=float)
+    # One assignment per market length rather than per market
+    rows_by_length = {}
+    for i, length in enumerate(lengths):
+        rows_by_length.setdefault(length, []).append(i)
+    for length, rows in rows_by_length.items():
+        if length:
+            padded[rows, :length] = [markets[i] for i in rows]
+    return padded
+
+
+def _as_masked_2d(prob):
+    # Accept a masked array, or a plain array padded with NaN
+    if isinstance(prob, np.ma.MaskedArray):
+        mask = np.ma.getmaskarray(prob)
+        prob = prob.filled(np.nan).astype(float)
+    else:
+        prob = np.array(prob, dtype=float)
+        mask = np.isnan(prob)
+
+    if prob.ndim == 1:
+        prob = prob[np.newaxis, :]
+        mask = mask[np.newaxis, :]
+
+    prob = np.where(mask, np.nan, prob)
+    return prob, ~mask
+
+
+def _as_market_vector(value, n_markets, name):
+    value = np.asarray(value, dtype=float)
+    assert value.ndim == 0 or value.shape == (n_markets,), \
+        f"calculating implied odds: {name} must be a scalar or have one value per market"
+    return np.broadcast_to(value, (n_markets,))
+
+
+def _batch_basic_odds(prob, margin):
+    return (1 + margin[:, None]) / prob
+
+
+def _batch_wpo_odds(prob, margin, num_outcomes):
+    naive_odds = 1 / prob
+    specific_margins = (margin[:, None] * naive_odds) / num_outcomes[:, None]
+    imp_odds = naive_odds / (1 - specific_margins)
+    return imp_odds, specific_margins
+
+
+def solve_odds_ratio(prob, target, tol=1e-12, maxiter=50):
+    """
+    Solves the odds ratio method for many markets at once.
+
+    Finds c with sum(prob / (c * (1 - prob) + prob)) = target for each market, the fair probabilities
+    being prob / (c * (1 - prob) + prob). Two-outcome markets use the closed form (a quadratic in c).
+    For n outcomes the residual is convex and decreasing in c and positive at c = 1 (target is at most
+    the sum of prob), so Newton's method started at c = 1 increases monotonically to the root.
+
+    Args:
+        prob (np.ndarray): Padded 2-D array of probabilities, one market per row (NaN padding).
+        target (np.ndarray): Sum of the fair probabilities of each market.
+        tol (float): Relative tolerance on c. Newton converges quadratically, so a market is done once a
+            Newton step is below sqrt(tol).
+        maxiter (int): Maximum number of iterations per market.
+
+    Returns:
+        np.ndarray: The odds ratio c of each market.
+        np.ndarray: Boolean flags marking the markets that converged.
+        np.ndarray: Number of iterations used by each market (0 for the closed form).
+    """
+    n_markets = prob.shape[0]
+    num_outcomes = np.sum(~np.isnan(prob), axis=1)
+    cc = np.ones(n_markets)
+    converged = np.zeros(n_markets, dtype=bool)
+    iterations = np.zeros(n_markets, dtype=int)
+
+    # Closed form for two-outcome markets
+    two_way = np.flatnonzero(num_outcomes == 2)
+    if two_way.size:
+        # Positive root of t * a1 * a2 * c ** 2 + (t - 1) * (a1 * x2 + a2 * x1) * c + (t - 2) * x1 * x2, in the
+        # form without cancellation for either sign of the linear term
+        x1, x2, t = prob[two_way, 0], prob[two_way, 1], target[two_way]
+        a1, a2 = 1 - x1, 1 - x2
+        qa, qb, qc = t * a1 * a2, (t - 1) * (a1 * x2 + a2 * x1), (t - 2) * x1 * x2
+        root = np.sqrt(qb ** 2 - 4 * qa * qc)
+        cc[two_way] = np.where(qb >= 0, 2 * qc / (-qb - root), (root - qb) / (2 * qa))
+        converged[two_way] = True
+
+    # Newton iterations for the rest, on the markets still iterating
+    active = np.flatnonzero(num_outcomes > 2)
+    for _ in range(maxiter):
+        if active.size == 0:
+            break
+
+        c = cc[active]
+        p = prob[active]
+        denominator = c[:, None] * (1 - p) + p
+        fair_prob = p / denominator
+        residual = np.nansum(fair_prob, axis=1) - target[active]
+        derivative = -np.nansum(fair_prob * (1 - p) / denominator, axis=1)
+
+        c_new = c - residual / derivative
+        done = (np.abs(c_new - c) <= np.sqrt(tol) * c) | (np.abs(residual) <= tol)
+        cc[active] = c_new
+        iterations[active] += 1
+        converged[active] = done
+        active = active[~done]
+
+    return cc, converged, iterations
+
+
+def solve_odds_ratio_market(prob, target, tol=1e-12, maxiter=50):
+    """
+    solve_odds_ratio for a single market, in plain Python.
+
+    Same closed form and Newton iteration as the batched solver, without the numpy overhead that
+    dominates on one small market.
+
+    Args:
+        prob (list): Probabilities of the market.
+        target (float): Sum of the fair probabilities.
+        tol (float): Relative tolerance on c.
+        maxiter (int): Maximum number of iterations.
+
+    Returns:
+        float: The odds ratio c.
+        bool: Whether the solve converged.
+        int: Number of iterations used (0 for the closed form).
+    """
+    if len(prob) == 2:
+        x1, x2 = prob
+        a1, a2 = 1 - x1, 1 - x2
+        qa, qb, qc = target * a1 * a2, (target - 1) * (a1 * x2 + a2 * x1), (target - 2) * x1 * x2
+        root = math.sqrt(qb ** 2 - 4 * qa * qc)
+        return (2 * qc / (-qb - root) if qb >= 0 else (root - qb) / (2 * qa)), True, 0
+
+    c = 1.0
+    for iteration in range(1, maxiter + 1):
+        residual = -target
+        derivative = 0.0
+        for p in prob:
+            denominator = c * (1 - p) + p
+            fair_prob = p / denominator
+            residual += fair_prob
+            derivative -= fair_prob * (1 - p) / denominator
+
+        c_new = c - residual / derivative
+        done = abs(c_new - c) <= math.sqrt(tol) * c or abs(residual) <= tol
+        c = c_new
+        if done:
+            return c, True, iteration
+
+    return c, False, maxiter
+
+
+def _batch_odds_ratio_odds(prob, margin):
+    # Markets without a margin keep their odds (c = 1) without iterating
+    no_margin = margin == 0
+    odds_ratio = np.ones(len(prob))
+    converged = np.ones(len(prob), dtype=bool)
+    iterations = np.zeros(len(prob), dtype=int)
+    if not no_margin.all():
+        rest = ~no_margin
+        target = np.nansum(prob[rest], axis=1) - margin[rest]
+        odds_ratio[rest], converged[rest], iterations[rest] = solve_odds_ratio(prob[rest], target)
+
+    imp_odds = (odds_ratio[:, None] * (1 - prob) + prob) / prob
+    return imp_odds, odds_ratio, converged, iterations
+
+
+def solve_power_exponent(prob, warm_start=None, tol=1e-12, maxiter=50):
+    """
+    Solves the power method for many markets with safeguarded Newton iterations.
+
+    Finds a with sum(prob ** a) = 1 for each market. The residual is convex and decreasing in a,
+    and the root always lies in [log(n) / -log(min(prob)), log(n) / -log(max(prob))], so every
+    Newton step that leaves the (shrinking) bracket is replaced by a bisection step.
+
+    Args:
+        prob (np.ndarray): Padded 2-D array of probabilities, one market per row (NaN padding).
+        warm_start (np.ndarray): Exponents k from a previous solve of the same markets (NaN for a cold start).
+        tol (float): Relative tolerance on the exponent. Newton converges quadratically, so a market
+            is done once a Newton step is below sqrt(tol).
+        maxiter (int): Maximum number of iterations per market.
+
+    Returns:
+        np.ndarray: The exponent k of each market, as reported by implied_odds (odds ** (1 / k) are the fair probabilities).
+        np.ndarray: Boolean flags marking the markets that converged.
+        np.ndarray: Number of iterations used by each market.
+    """
+    n_markets = prob.shape[0]
+    log_p = np.log(prob)
+    log_n = np.log(np.sum(~np.isnan(prob), axis=1))
+
+    # Every prob ** a_lo >= 1 / n and every prob ** a_hi <= 1 / n, so the root is bracketed
+    a_lo = log_n / -np.nanmin(log_p, axis=1)
+    a_hi = log_n / -np.nanmax(log_p, axis=1)
+
+    # a = 1 reproduces the raw probabilities; for an overround it lies left of the root,
+    # where Newton on a convex decreasing function converges monotonically
+    aa = np.ones(n_markets)
+    if warm_start is not None:
+        warm_start = np.broadcast_to(np.asarray(warm_start, dtype=float), (n_markets,))
+        aa = np.where(np.isnan(warm_start), aa, -1 / warm_start)
+    aa = np.clip(aa, a_lo, a_hi)
+
+    converged = np.zeros(n_markets, dtype=bool)
+    iterations = np.zeros(n_markets, dtype=int)
+    active = np.flatnonzero(~np.isnan(aa))
+
+    for _ in range(maxiter):
+        if active.size == 0:
+            break
+
+        a = aa[active]
+        lp = log_p[active]
+        pa = np.exp(a[:, None] * lp)
+        residual = np.nansum(pa, axis=1) - 1
+        derivative = np.nansum(pa * lp, axis=1)
+
+        # Shrink the bracket around the root
+        lo = np.where(residual > 0, a, a_lo[active])
+        hi = np.where(residual < 0, a, a_hi[active])
+        a_lo[active] = lo
+        a_hi[active] = hi
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            a_new = a - residual / derivative
+        outside = ~((a_new >= lo) & (a_new <= hi))
+        a_new = np.where(outside, 0.5 * (lo + hi), a_new)
+
+        small_step = np.abs(a_new - a) <= np.sqrt(tol) * np.maximum(1, np.abs(a))
+        done = (small_step & ~outside) | (np.abs(residual) <= tol)
+        aa[active] = a_new
+        iterations[active] += 1
+        converged[active] = done
+        active = active[~done]
+
+    return -1 / aa, converged, iterations
+
+
+def solve_power_exponent_market(prob, warm_start=None, tol=1e-12, maxiter=50):
+    """
+    solve_power_exponent for a single market, in plain Python.
+
+    Same bracket, iteration and stopping rule as the batched solver, without the numpy overhead
+    that dominates on one small market.
+
+    Args:
+        prob (list): Probabilities of the market.
+        warm_start (float): Exponent k from a previous solve of the market (default is None, cold start).
+        tol (float): Relative tolerance on the exponent.
+        maxiter (int): Maximum number of iterations.
+
+    Returns:
+        float: The exponent k.
+        bool: Whether the solve converged.
+        int: Number of iterations used.
+    """
+    log_p = [math.log(p) for p in prob]
+    log_n = math.log(len(prob))
+    a_lo = log_n / -min(log_p)
+    a_hi = log_n / -max(log_p)
+
+    a = 1.0 if warm_start is None or math.isnan(warm_start) else -1 / warm_start
+    a = min(max(a, a_lo), a_hi)
+
+    for iteration in range(1, maxiter + 1):
+        pa = [math.exp(a * lp) for lp in log_p]
+        residual = sum(pa) - 1
+        derivative = sum(x * lp for x, lp in zip(pa, log_p))
+
+        # Shrink the bracket around the root
+        if residual > 0:
+            a_lo = a
+        elif residual < 0:
+            a_hi = a
+
+        a_new = a - residual / derivative if derivative != 0 else math.nan
+        outside = not a_lo <= a_new <= a_hi
+        if outside:
+            a_new = 0.5 * (a_lo + a_hi)
+
+        small_step = abs(a_new - a) <= math.sqrt(tol) * max(1, abs(a))
+        done = (small_step and not outside) or abs(residual) <= tol
+        a = a_new
+        if done:
+            return -1 / a, True, iteration
+
+    return -1 / a, False, maxiter
+
+
+def _batch_power_odds(prob, warm_start=None):
+    from two_way_tables import get_table, record_lookups
+
+    # Two-way markets come from the interpolation table when one is loaded; the solver handles the rest
+    table = get_table("power")
+    two_way = np.sum(~np.isnan(prob), axis=1) == 2 if table is not None else None
+    if table is None or not two_way.any():
+        exponent, converged, iterations = solve_power_exponent(prob, warm_start)
+    else:
+        a = np.full(prob.shape[0], np.nan)
+        a[two_way] = table.lookup_many(prob[two_way, 0], prob[two_way, 1])
+        hit = ~np.isnan(a)
+        record_lookups("power", int(hit.sum()), int(two_way.sum() - hit.sum()))
+
+        exponent = -1 / a
+        converged = hit.copy()
+        iterations = np.zeros(prob.shape[0], dtype=int)
+        if not hit.all():
+            rest = ~hit
+            warm = None if warm_start is None else np.broadcast_to(np.asarray(warm_start, dtype=float), hit.shape)[rest]
+            exponent[rest], converged[rest], iterations[rest] = solve_power_exponent(prob[rest], warm)
+    # The scalar path applies the exponent to the decimal odds: odds ** (1 / k) == prob ** (-1 / k)
+    imp_odds = prob ** (1 / exponent[:, None])
+    return imp_odds, exponent, converged, iterations
+
+
+def _batch_additive_odds(prob, margin, num_outcomes):
+    return 1 / (prob - (margin / num_outcomes)[:, None])
+
+
+def solve_shin(prob, tol=1e-12, maxiter=100):
+    """
+    Solves Shin's model for many markets at once.
+
+    Two-outcome markets use the closed form for z. For n outcomes z is the smallest root of
+    h(z) = sum(sqrt(z ** 2 + 4 * (1 - z) * prob ** 2 / booksum)) - 2 - (n - 2) * z, the fixed point
+    iterated by the shin package. h is convex with h(0) > 0 (and h(1) = 0), so Newton's method
+    started at z = 0 increases monotonically to that root.
+
+    Args:
+        prob (np.ndarray): Padded 2-D array of implied probabilities (1 / odds), one market per row (NaN padding).
+        tol (float): Absolute tolerance on z. Newton converges quadratically, so a market is done
+            once a step is below sqrt(tol).
+        maxiter (int): Maximum number of iterations per market.
+
+    Returns:
+        np.ndarray: Fair probabilities, padded like prob.
+        np.ndarray: The z value of each market.
+        np.ndarray: Boolean flags marking the markets that converged.
+        np.ndarray: Number of iterations used by each market (0 for the closed form).
+    """
+    n_markets = prob.shape[0]
+    num_outcomes = np.sum(~np.isnan(prob), axis=1)
+    booksum = np.nansum(prob, axis=1)
+    scaled = 4 * prob ** 2 / booksum[:, None]
+
+    z_value = np.full(n_markets, np.nan)
+    converged = np.zeros(n_markets, dtype=bool)
+    iterations = np.zeros(n_markets, dtype=int)
+
+    # Closed form for two-outcome markets
+    two_way = np.flatnonzero(num_outcomes == 2)
+    if two_way.size:
+        p = prob[two_way, :2]
+        diff = (p[:, 0] - p[:, 1]) ** 2
+        total = booksum[two_way]
+        z_value[two_way] = ((total - 1) * (diff - total)) / (total * (diff - 1))
+        converged[two_way] = True
+
+    # Newton iterations for the rest, on arrays compacted to the markets still iterating
+    active = np.flatnonzero(num_outcomes > 2)
+    z = np.zeros(active.size)
+    sc = scaled[active]
+    extra = num_outcomes[active] - 2
+    for _ in range(maxiter):
+        if active.size == 0:
+            break
+
+        root = np.sqrt(z[:, None] ** 2 + (1 - z[:, None]) * sc)
+        residual = np.nansum(root, axis=1) - 2 - extra * z
+        derivative = np.nansum((z[:, None] - sc / 2) / root, axis=1) - extra
+
+        z_new = z - residual / derivative
+        done = np.abs(z_new - z) <= np.sqrt(tol)
+        z_value[active] = z_new
+        iterations[active] += 1
+        converged[active] = done
+
+        keep = ~done
+        active, z, sc, extra = active[keep], z_new[keep], sc[keep], extra[keep]
+
+    z = z_value[:, None]
+    fair_prob = (np.sqrt(z ** 2 + (1 - z) * scaled) - z) / (2 * (1 - z))
+    return fair_prob, z_value, converged, iterations
+
+
+def solve_shin_market(prob, tol=1e-12, maxiter=100):
+    """
+    solve_shin for a single market, in plain Python.
+
+    Same closed form and Newton iteration as the batched solver, without the numpy overhead
+    that dominates on one small market.
+
+    Args:
+        prob (list): Implied probabilities (1 / odds) of the market.
+        tol (float): Absolute tolerance on z.
+        maxiter (int): Maximum number of iterations.
+
+    Returns:
+        list: Fair probabilities.
+        float: The z value.
+        bool: Whether the solve converged.
+        int: Number of iterations used (0 for the closed form).
+    """
+    n = len(prob)
+    booksum = sum(prob)
+    scaled = [4 * p ** 2 / booksum for p in prob]
+
+    converged, iterations = True, 0
+    if n == 2:
+        diff = (prob[0] - prob[1]) ** 2
+        z = ((booksum - 1) * (diff - booksum)) / (booksum * (diff - 1))
+    else:
+        z, converged = 0.0, False
+        while iterations < maxiter and not converged:
+            roots = [math.sqrt(z ** 2 + (1 - z) * c) for c in scaled]
+            residual = sum(roots) - 2 - (n - 2) * z
+            derivative = sum((z - c / 2) / r for c, r in zip(scaled, roots)) - (n - 2)
+
+            z_new = z - residual / derivative
+            converged = abs(z_new - z) <= math.sqrt(tol)
+            z = z_new
+            iterations += 1
+
+    fair_prob = [(math.sqrt(z ** 2 + (1 - z) * c) - z) / (2 * (1 - z)) for c in scaled]
+    return fair_prob, z, converged, iterations
+
+
+def _batch_shin_odds(prob):
+    fair_prob, z_value, converged, iterations = solve_shin(prob)
+    return 1 / fair_prob, z_value, converged, iterations
+
+
+def _batch_balanced_book_odds(prob, margin, gross_margin, num_outcomes):
+    zz = (((1 - gross_margin) * (1 + margin)) - 1) / (num_outcomes - 1)
+    imp_odds = (1 - zz[:, None]) / (prob * (1 - gross_margin[:, None]) - zz[:, None])
+    return imp_odds, zz
+
+
+def batch_implied_odds(
+    prob: Union[list, np.ndarray, np.ma.MaskedArray],
+    method: str = "basic",
+    margin: Union[float, list, np.ndarray] = 0,
+    gross_margin: Union[float, list, np.ndarray] = None,
+    normalize: bool = True,
+    warm_start: Union[float, list, np.ndarray] = None,
+) -> dict:
+    """Batch Implied Odds
+    Provides the fair decimal odds for many markets in a single vectorized pass.
+
+    Gives the same numbers as implied_odds.implied_odds(..., category="dec") applied to
+    each market in turn (iterative methods agree up to the solver tolerance), except for naive:
+    implied_odds rounds its decimal odds to 2 decimals, the batch returns them unrounded.
+
+    Args:
+        prob (list, np.ndarray, np.ma.MaskedArray): 2-D array of probabilities, one market per row.
+            Markets with fewer outcomes are padded with NaN (see pad_markets) or masked.
+        method (str, optional): method to calculate implied odds. Defaults to "basic". \n
+            'naive', naive implied odds (1 / prob unrounded, the margin is kept) \n
+            'basic', basic implied odds \n
+            'wpo', weighted probability odds (the margin of each outcome proportional to its odds) \n
+            'odds_ratio', odds ratio (solved for the odds ratio that removes the margin) \n
+            'power', power \n
+            'additive', additive \n
+            'shin', shin (Shin's model, solved for the given probabilities; margin is not used) \n
+            'balanced_book', balanced book
+        margin (float, list, np.ndarray, optional): margin of each market, or one margin for all. Defaults to 0.
+        gross_margin (float, list, np.ndarray, optional): gross margin of each market. Defaults to None.
+        normalize (bool, optional): normalize each market to sum to 1 before devigging. Defaults to True.
+        warm_start (float, list, np.ndarray, optional): power method only, the exponents from a previous
+            solve of the same markets (NaN for a cold start). After small line moves the solver then
+            needs one or two iterations. Defaults to None.
+
+    Returns:
+        dictionary: "implied_odds" holds the fair decimal odds (NaN in padded cells), followed by the
+            method parameters under the same keys as implied_odds ("specific_margins", "odds_ratio",
+            "exponent", "z_value"). Iterative methods also report a boolean "converged" per market,
+            and the power, shin and odds_ratio methods the "iterations" used by each market.
+    """
+    # Time every batch and record solver convergence for /metrics
+    start = time.perf_counter()
+    try:
+        mydict = _batch_implied_odds(prob, method, margin, gross_margin, normalize, warm_start)
+    except AssertionError:
+        metrics.INPUT_ERRORS.inc("batch_implied_odds")
+        raise
+    metrics.BATCH_SECONDS.observe(time.perf_counter() - start, method)
+    metrics.BATCH_MARKETS.inc(method, amount=len(mydict["implied_odds"]))
+    if "converged" in mydict:
+        metrics.observe_solver(method, mydict.get("iterations"), mydict["converged"], path="batch")
+    return mydict
+
+
+def _batch_implied_odds(prob, method, margin, gross_margin, normalize, warm_start):
+    prob, valid = _as_masked_2d(prob)
+    n_markets = prob.shape[0]
+    num_outcomes = valid.sum(axis=1)
+
+    margin = _as_market_vector(margin, n_markets, "margin")
+    gross_margin = _as_market_vector(0 if gross_margin is None else gross_margin, n_markets, "gross_margin")
+
+    assert method in BATCH_METHODS, \
+        "method must be either: ('naive', 'basic', 'wpo', 'odds_ratio', 'power', 'additive', 'shin', 'balanced_book')"
+    assert np.all((prob[valid] > 0) & (prob[valid] < 1)), \
+        "calculating implied odds: probability must be between 0 and 1"
+    assert np.all(margin >= 0), "calculating implied odds: margin must be greater than or equal to 0"
+    assert np.all((gross_margin >= 0) & (gross_margin < 1)), \
+        "calculating implied odds: gross_margin must be None or between 0 and 1"
+
+    prob_sum = np.nansum(prob, axis=1)
+    multi = num_outcomes > 1
+    assert np.all(prob_sum[multi] >= 1 - margin[multi]), \
+        "calculating implied odds: sum of probabilities must be greater than or equal to 1 - margin"
+
+    if normalize:
+        balanced_prob = prob / prob_sum[:, None]
+    else:
+        balanced_prob = prob
+
+    mydict = {}
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if method == "naive":
+            imp_odds = 1 / prob
+        elif method == "basic":
+            imp_odds = _batch_basic_odds(balanced_prob, margin)
+        elif method == "wpo":
+            imp_odds, specific_margins = _batch_wpo_odds(balanced_prob, margin, num_outcomes)
+            mydict["specific_margins"] = specific_margins
+        elif method == "odds_ratio":
+            imp_odds, odds_ratio, converged, iterations = _batch_odds_ratio_odds(balanced_prob, margin)
+            mydict["odds_ratio"] = odds_ratio
+            mydict["converged"] = converged
+            mydict["iterations"] = iterations
+        elif method == "power":
+            imp_odds, exponent, converged, iterations = _batch_power_odds(balanced_prob, warm_start)
+            mydict["exponent"] = exponent
+            mydict["converged"] = converged
+            mydict["iterations"] = iterations
+        elif method == "additive":
+            imp_odds = _batch_additive_odds(balanced_prob, margin, num_outcomes)
+        elif method == "shin":
+            imp_odds, z_value, converged, iterations = _batch_shin_odds(balanced_prob)
+            mydict["z_value"] = z_value
+            mydict["converged"] = converged
+            mydict["iterations"] = iterations
+        elif method == "balanced_book":
+            imp_odds, z_value = _batch_balanced_book_odds(balanced_prob, margin, gross_margin, num_outcomes)
+            mydict["z_value"] = z_value
+
+    mydict["implied_odds"] = np.where(valid, imp_odds, np.nan)
+
+    # sort dictionary
+    sort_order = [
+        "implied_odds",
+        "specific_margins",
+        "odds_ratio",
+        "exponent",
+        "z_value",
+        "converged",
+        "iterations",
+    ]
+    mydict = {key: mydict[key] for key in sort_order if key in mydict}
+
+    return mydict
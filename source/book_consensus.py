@@ -0,0 +1,468 @@
+# Consensus fair prices from the same markets quoted by many bookmakers
+
+import threading
+import time
+
+import numpy as np
+
+import metrics
+from batch_implied_odds import batch_implied_odds, pad_markets
+from pricing import METHODS, check_deadline
+from utils import expected_value, kelly_bet
+
+# Largest snapshot accepted by the /api/consensus/odds endpoint, and largest number of lines per engine
+MAX_SNAPSHOT_LINES = 100000
+MAX_LINES = 2000000
+
+DEFAULT_OUTLIER_Z = 3.0
+# Floor of the robust standard deviation of the books' fair probabilities, so lines are not rejected
+# over odds rounding on markets where the books agree closely
+DEFAULT_MIN_DEVIATION = 0.005
+
+# Standard deviation of a normal distribution per unit of median absolute deviation
+_MAD_SCALE = 1.4826
+
+
+class BookConsensus:
+    """
+    Latest odds of many bookmakers, indexed by event, market and outcome, and the consensus fair
+    probability of every outcome.
+
+    Each book's line of a market is a row of one odds array, replaced in place when the book quotes the
+    market again. refresh devigs the lines quoted since the previous refresh in one batch_implied_odds
+    call, then combines the books of every market at once: a line is rejected when one of its fair
+    probabilities lies more than outlier_z robust standard deviations (1.4826 x the median absolute
+    deviation, at least min_deviation) from the median of the books, and the consensus is the weighted
+    average of the other lines, normalized to sum to 1.
+
+    Args:
+        method (str): Devig method of pricing.METHODS applied to every line.
+        weights (dict): Weight of each book in the consensus (default 1 for books not listed), e.g.
+            more for sharp books, 0 for books only priced against the consensus.
+        outlier_z (float): Rejection threshold (None keeps every line).
+        min_deviation (float): Floor of the robust standard deviation, in probability.
+        max_lines (int): Largest number of lines (book x market) held.
+    """
+
+    def __init__(self, method="power", weights=None, outlier_z=DEFAULT_OUTLIER_Z,
+                 min_deviation=DEFAULT_MIN_DEVIATION, max_lines=MAX_LINES):
+        assert method in METHODS, f"method must be one of {list(METHODS)}"
+        assert outlier_z is None or outlier_z > 0, "outlier_z must be positive"
+        self.method = method
+        self.weights = dict(weights or {})
+        self.outlier_z = outlier_z
+        self.min_deviation = min_deviation
+        self.max_lines = max_lines
+
+        self._market_index = {}  # (event, market) -> market index
+        self._keys = []  # (event, market) of each market
+        self._outcomes = []  # outcome names of each market
+        self._slot_counts = []  # books quoting each market
+        self._book_index = {}
+        self._books = []
+        self._rows = {}  # (market index, book index) -> row of the line
+
+        # Lines, one per row: odds (NaN padded), market, book, position among the market's books, when
+        # it was last quoted, and whether it changed since the last refresh
+        self._n_lines = 0
+        self._odds = np.full((1024, 2), np.nan)
+        self._line_market = np.zeros(1024, dtype=np.int64)
+        self._line_book = np.zeros(1024, dtype=np.int64)
+        self._line_slot = np.zeros(1024, dtype=np.int64)
+        self._received = np.zeros(1024)
+        self._dirty = np.zeros(1024, dtype=bool)
+        self._fair = np.full((1024, 2), np.nan)  # fair probabilities of each line, as of the last refresh
+
+        self._consensus = None
+        self._lock = threading.Lock()
+        self.refreshes = 0
+
+    def _grow(self, rows, width):
+        # Called with self._lock held: room for at least rows lines of width outcomes
+        capacity, current_width = self._odds.shape
+        if rows <= capacity and width <= current_width:
+            return
+        capacity = max(capacity * 2, rows) if rows > capacity else capacity
+        width = max(width, current_width)
+        for name in ("_odds", "_fair"):
+            grown = np.full((capacity, width), np.nan)
+            grown[:self._n_lines, :current_width] = getattr(self, name)[:self._n_lines]
+            setattr(self, name, grown)
+        for name in ("_line_market", "_line_book", "_line_slot", "_received", "_dirty"):
+            array = getattr(self, name)
+            grown = np.zeros(capacity, dtype=array.dtype)
+            grown[:self._n_lines] = array[:self._n_lines]
+            setattr(self, name, grown)
+
+    def _index_line(self, book, key, outcomes, n_outcomes):
+        """
+        Called with self._lock held: the row of a book's line of a market, added when the book quotes the
+        market for the first time.
+
+        Returns:
+            int: Row of the line.
+            list: Positions of the market's outcomes in the line (None when they are in order).
+        """
+        market = self._market_index.get(key)
+        order = None
+        if market is None or outcomes != self._outcomes[market] or n_outcomes != len(outcomes):
+            # Outcomes are only checked when they are not the market's, in its order
+            outcomes = [str(i) for i in range(n_outcomes)] if outcomes is None else [str(o) for o in outcomes]
+            if len(outcomes) != n_outcomes or len(set(outcomes)) != n_outcomes:
+                raise ValueError("outcomes must name each of the odds once")
+            if market is not None and outcomes != self._outcomes[market]:
+                names = self._outcomes[market]
+                if sorted(outcomes) != sorted(names):
+                    raise ValueError(f"market {key[0]}/{key[1]} has the outcomes {names}")
+                order = [outcomes.index(name) for name in names]
+
+        book_index = self._book_index.get(book)
+        row = self._rows.get((market, book_index)) if market is not None and book_index is not None else None
+        if row is None:
+            if self._n_lines >= self.max_lines:
+                raise ValueError(f"at most {self.max_lines} lines are held")
+            if market is None:
+                market = self._market_index[key] = len(self._keys)
+                self._keys.append(key)
+                self._outcomes.append(outcomes)
+                self._slot_counts.append(0)
+            if book_index is None:
+                book_index = self._book_index[book] = len(self._books)
+                self._books.append(book)
+            row = self._rows[market, book_index] = self._n_lines
+            self._n_lines += 1
+            self._line_market[row] = market
+            self._line_book[row] = book_index
+            self._line_slot[row] = self._slot_counts[market]
+            self._slot_counts[market] += 1
+        return row, order
+
+    def ingest(self, lines, received=None):
+        """
+        Stores an odds snapshot: the latest line of each book on each market.
+
+        Lines are parsed one by one, their odds checked and written all at once.
+
+        Args:
+            lines (list): {"book": str, "event": str, "market": str, "odds": [odds, ...],
+                "outcomes": [name, ...] (optional, default "0", "1", ...)}. The outcomes of a market are
+                fixed by its first line; later lines may list them in any order.
+            received (float): time.time() of the snapshot (default is now), used by refresh's max_age.
+
+        Returns:
+            int: Number of lines stored.
+            list: {"line": position, "error": message} for every line rejected.
+        """
+        received = time.time() if received is None else received
+        errors = []
+        parsed = []
+        for i, line in enumerate(lines):
+            try:
+                book, key, outcomes, odds = _parse_line(line)
+                parsed.append((i, book, key, outcomes, odds))
+            except KeyError as e:
+                errors.append({"line": i, "error": f"every line needs {e}"})
+            except (ValueError, TypeError) as e:
+                errors.append({"line": i, "error": str(e)})
+
+        stored = 0
+        if parsed:
+            odds = pad_markets([line[4] for line in parsed])
+            lengths = np.array([len(line[4]) for line in parsed])
+            with np.errstate(invalid="ignore", divide="ignore"):
+                bad_odds = (lengths < 2) | (((odds > 1) & np.isfinite(odds)).sum(axis=1) != lengths)
+                no_margin = ~bad_odds & (np.nansum(1 / odds, axis=1) < 1)
+            for j in np.flatnonzero(bad_odds | no_margin).tolist():
+                message = ("odds must be a list of at least two finite decimal odds greater than 1" if bad_odds[j]
+                           else "odds must include a margin (implied probabilities summing to at least 1)")
+                errors.append({"line": parsed[j][0], "error": message})
+
+            rows, kept = [], []
+            with self._lock:
+                valid = np.flatnonzero(~(bad_odds | no_margin)).tolist()
+                self._grow(self._n_lines + len(valid), odds.shape[1])
+                for j in valid:
+                    i, book, key, outcomes, line_odds = parsed[j]
+                    try:
+                        row, order = self._index_line(book, key, outcomes, len(line_odds))
+                    except ValueError as e:
+                        errors.append({"line": i, "error": str(e)})
+                        continue
+                    if order is not None:
+                        odds[j, :len(order)] = odds[j, order]
+                    rows.append(row)
+                    kept.append(j)
+
+                self._odds[rows] = np.nan
+                self._odds[rows, :odds.shape[1]] = odds[kept]
+                self._received[rows] = received
+                self._dirty[rows] = True
+                stored = len(rows)
+
+        if errors:
+            errors.sort(key=lambda error: error["line"])
+            metrics.INPUT_ERRORS.inc("consensus", amount=len(errors))
+        return stored, errors
+
+    def set_weights(self, weights):
+        """
+        Replaces the weight of the given books (the others keep theirs), used from the next refresh.
+        """
+        weights = {str(book): float(weight) for book, weight in weights.items()}
+        if any(not weight >= 0 for weight in weights.values()):
+            raise ValueError("book weights must be non-negative")
+        with self._lock:
+            self.weights.update(weights)
+
+    def refresh(self, max_age=None, deadline=None):
+        """
+        Devigs the lines quoted since the last refresh and rebuilds the consensus of every market.
+
+        Args:
+            max_age (float): Lines last quoted more than max_age seconds ago are left out (default is
+                None, every line counts).
+            deadline (float): time.monotonic() value after which the refresh stops with a TimeoutError,
+                checked between stages (default is None, no deadline).
+
+        Returns:
+            dict: Markets, lines, lines devigged, lines rejected as outliers, and the milliseconds spent
+                copying the lines ("index"), devigging and combining them, and in total.
+        """
+        profile = metrics.Profile()
+        with profile.stage("index"):
+            with self._lock:
+                n = self._n_lines
+                odds = self._odds[:n].copy()
+                dirty = np.flatnonzero(self._dirty[:n])
+                self._dirty[:n] = False
+                line_market = self._line_market[:n].copy()
+                line_book = self._line_book[:n].copy()
+                line_slot = self._line_slot[:n].copy()
+                received = self._received[:n].copy()
+                keys, n_slots = list(self._keys), max(self._slot_counts, default=1)
+                book_weights = np.array([self.weights.get(book, 1.0) for book in self._books])
+            live = np.ones(n, dtype=bool) if max_age is None else received >= time.time() - max_age
+
+        try:
+            check_deadline(deadline)
+            with profile.stage("devig"):
+                if len(dirty):
+                    probs = 1 / odds[dirty]
+                    margins = np.nansum(probs, axis=1) - 1
+                    devigged = batch_implied_odds(probs, method=METHODS[self.method], margin=margins,
+                                                  normalize=False)["implied_odds"]
+                    with self._lock:
+                        self._fair[dirty, :odds.shape[1]] = 1 / devigged
+                fair = self._fair[:n, :odds.shape[1]]
+        except BaseException:
+            # The lines stay dirty, so the next refresh devigs them
+            with self._lock:
+                self._dirty[dirty] = True
+            raise
+
+        check_deadline(deadline)
+        with profile.stage("combine"):
+            # Markets x books x outcomes, NaN where a book does not quote the market
+            n_markets, width = len(keys), odds.shape[1]
+            markets, slots = line_market[live], line_slot[live]
+            cube = np.full((n_markets, n_slots, width), np.nan)
+            cube[markets, slots] = fair[live]
+            odds_cube = np.full((n_markets, n_slots, width), np.nan)
+            odds_cube[markets, slots] = odds[live]
+            slot_book = np.full((n_markets, n_slots), -1)
+            slot_book[markets, slots] = line_book[live]
+            weights = np.zeros((n_markets, n_slots))
+            weights[markets, slots] = book_weights[line_book[live]]
+            quoted = slot_book >= 0
+
+            with np.errstate(invalid="ignore", divide="ignore"):
+                median = _nanmedian(cube)
+                deviation = np.abs(cube - median[:, None, :])
+                rejected = np.zeros_like(quoted)
+                if self.outlier_z is not None:
+                    scale = np.maximum(_MAD_SCALE * _nanmedian(deviation), self.min_deviation)
+                    rejected = quoted & (np.fmax.reduce(deviation / scale[:, None, :], axis=2) > self.outlier_z)
+
+                used = np.where(rejected, 0, weights)
+                total_weight = used.sum(axis=1)
+                consensus = np.einsum("ms,mso->mo", used, np.nan_to_num(cube)) / total_weight[:, None]
+                consensus[np.isnan(median) | (total_weight == 0)[:, None]] = np.nan
+                consensus /= np.nansum(consensus, axis=1, keepdims=True)
+
+            # Best odds of each outcome across the books
+            best_slot = np.argmax(np.nan_to_num(odds_cube, nan=-np.inf), axis=1)
+            best_odds = np.take_along_axis(odds_cube, best_slot[:, None, :], axis=1)[:, 0]
+
+            consensus_state = {
+                "keys": keys, "fair_probs": consensus, "books": quoted.sum(axis=1), "used": (used > 0).sum(axis=1),
+                "slot_book": slot_book, "rejected": rejected, "best_odds": best_odds,
+                "best_book": np.take_along_axis(slot_book, best_slot, axis=1),
+                "line_market": line_market[live], "line_book": line_book[live], "odds": odds[live],
+            }
+            with self._lock:
+                self._consensus = consensus_state
+                self.refreshes += 1
+
+        timing = profile.as_dict()
+        metrics.CONSENSUS_REFRESH_SECONDS.observe(timing["total"] / 1000)
+        return {"markets": n_markets, "lines": int(live.sum()), "devigged": len(dirty),
+                "rejected": int(rejected.sum()), "timing": timing}
+
+    def _state(self):
+        with self._lock:
+            if self._consensus is None:
+                raise ValueError("the consensus has not been refreshed yet")
+            return self._consensus, list(self._books), list(self._outcomes)
+
+    def market(self, event, market):
+        """
+        Returns:
+            dict: Consensus of a market as of the last refresh: outcome names, fair probabilities and
+                odds, books quoting it, books in the consensus, rejected books and best odds of each
+                outcome with their book. None for an unknown market.
+        """
+        state, books, outcomes = self._state()
+        index = self._market_index.get((str(event), str(market)))
+        if index is None or index >= len(state["keys"]):
+            return None
+        names = outcomes[index]
+        n = len(names)
+        fair_probs = state["fair_probs"][index, :n]
+        return {
+            "event": str(event),
+            "market": str(market),
+            "outcomes": names,
+            "fair_probs": _to_json_list(fair_probs),
+            "fair_odds": _to_json_list(1 / fair_probs),
+            "books": int(state["books"][index]),
+            "used": int(state["used"][index]),
+            "rejected": [books[b] for b in state["slot_book"][index][state["rejected"][index]]],
+            "best_odds": [{"book": books[b] if b >= 0 else None, "odds": _to_json(o)}
+                          for b, o in zip(state["best_book"][index, :n], state["best_odds"][index, :n])],
+        }
+
+    def price(self, offers, kelly_budget=None, kelly_mult=None):
+        """
+        Prices offered odds against the consensus, with EV% and Kelly wager.
+
+        Args:
+            offers (list): {"event": str, "market": str, "outcome": name, "odds": offered decimal odds}.
+            kelly_budget (float): Kelly bank roll (default is None, no Kelly wager).
+            kelly_mult (float): Kelly multiplier (default is None, no Kelly wager).
+
+        Returns:
+            list: Per offer, the consensus fair probability and odds, EV% and Kelly wager, or an "error".
+        """
+        state, _, outcomes = self._state()
+        results = []
+        for offer in offers:
+            try:
+                index = self._market_index.get((str(offer["event"]), str(offer["market"])))
+                if index is None or index >= len(state["keys"]):
+                    raise ValueError(f"unknown market {offer['event']}/{offer['market']}")
+                outcome = str(offer["outcome"])
+                if outcome not in outcomes[index]:
+                    raise ValueError(f"market {offer['event']}/{offer['market']} has no outcome {outcome}")
+                odds = float(offer["odds"])
+                if not odds > 1:
+                    raise ValueError("odds must be decimal odds greater than 1")
+                fair_prob = float(state["fair_probs"][index, outcomes[index].index(outcome)])
+                if np.isnan(fair_prob):
+                    raise ValueError(f"market {offer['event']}/{offer['market']} has no consensus")
+            except KeyError as e:
+                metrics.INPUT_ERRORS.inc("consensus")
+                results.append({"error": f"every offer needs {e}"})
+                continue
+            except (ValueError, TypeError) as e:
+                metrics.INPUT_ERRORS.inc("consensus")
+                results.append({"error": str(e)})
+                continue
+
+            kelly = None
+            if kelly_budget is not None and kelly_mult is not None:
+                kelly = kelly_bet(fair_prob, odds - 1, kelly_budget, kelly_mult)
+            results.append({"fair_prob": fair_prob, "fair_odds": 1 / fair_prob,
+                            "ev": expected_value(fair_prob, odds), "kelly": kelly})
+        return results
+
+    def value_bets(self, min_ev=0.0, kelly_budget=None, kelly_mult=None, top_k=100):
+        """
+        Every book's odds priced against the consensus at once, keeping the best EV% above min_ev.
+
+        Returns:
+            list: Up to top_k offers, best EV first: event, market, outcome, book, odds, consensus fair
+                probability, EV% and Kelly wager.
+        """
+        assert top_k >= 1, "top_k must be at least 1"
+        state, books, outcomes = self._state()
+        odds = state["odds"]
+        line_market = state["line_market"]
+        fair_probs = state["fair_probs"][line_market][:, :odds.shape[1]]
+        with np.errstate(invalid="ignore"):
+            evs = expected_value(fair_probs, odds)
+        rows, columns = np.nonzero(evs > min_ev)
+        order = np.argsort(-evs[rows, columns], kind="stable")[:top_k]
+
+        results = []
+        for row, column in zip(rows[order].tolist(), columns[order].tolist()):
+            event, market = state["keys"][line_market[row]]
+            fair_prob = float(fair_probs[row, column])
+            offered = float(odds[row, column])
+            kelly = None
+            if kelly_budget is not None and kelly_mult is not None:
+                kelly = kelly_bet(fair_prob, offered - 1, kelly_budget, kelly_mult)
+            results.append({
+                "event": event,
+                "market": market,
+                "outcome": outcomes[line_market[row]][column],
+                "book": books[state["line_book"][row]],
+                "odds": offered,
+                "fair_prob": fair_prob,
+                "ev": float(evs[row, column]),
+                "kelly": kelly,
+            })
+        return results
+
+    def stats(self):
+        """
+        Returns:
+            dict: Events, markets, books, lines held and refreshes.
+        """
+        with self._lock:
+            return {
+                "events": len({event for event, _ in self._keys}),
+                "markets": len(self._keys),
+                "books": len(self._books),
+                "lines": self._n_lines,
+                "refreshes": self.refreshes,
+            }
+
+
+def _nanmedian(values):
+    # Median over the books (axis 1) of a markets x books x outcomes array, ignoring NaN (np.nanmedian
+    # falls back to a slow path on arrays with NaN); NaN where no book quotes the outcome
+    ordered = np.sort(values, axis=1)
+    counts = (~np.isnan(values)).sum(axis=1)[:, None, :]
+    low = np.take_along_axis(ordered, np.maximum(counts - 1, 0) // 2, axis=1)[:, 0]
+    high = np.take_along_axis(ordered, np.minimum(counts // 2, values.shape[1] - 1), axis=1)[:, 0]
+    return (low + high) / 2
+
+
+def _parse_line(line):
+    # Book, (event, market), outcome names (None when not given) and odds of one snapshot line
+    if not isinstance(line, dict):
+        raise ValueError("line must be an object")
+    odds = [float(o) for o in line["odds"]]
+    outcomes = line.get("outcomes")
+    if outcomes is not None and not isinstance(outcomes, list):
+        raise ValueError("outcomes must be a list of names")
+    return str(line["book"]), (str(line["event"]), str(line["market"])), outcomes, odds
+
+
+def _to_json(value):
+    # NaN is not valid JSON, report it as null
+    return None if np.isnan(value) else float(value)
+
+
+def _to_json_list(values):
+    return [_to_json(x) for x in values]
@@ -0,0 +1,177 @@
+# Structured devigging of many parlays at once, used by the /api/devig endpoint
+
+import math
+
+import numpy as np
+
+from batch_implied_odds import batch_implied_odds, pad_markets
+from metrics import INPUT_ERRORS, stage
+from pricing import DEFAULT_METHODS, METHODS, check_deadline
+from utils import expected_value, kelly_bet
+
+# Largest number of parlays accepted in a single /api/devig request
+MAX_BATCH_SIZE = 10000
+
+def _to_json_list(values):
+    # NaN is not valid JSON, report it as null
+    return [None if np.isnan(x) else float(x) for x in values]
+
+
+def _validate_parlay(parlay):
+    """
+    Checks one parlay of a bulk request and converts it to plain floats.
+
+    Args:
+        parlay (dict): {"legs": [[odds, ...], ...], "final_odds": float,
+            "kelly_budget": float (optional), "kelly_mult": float (optional)}
+
+    Returns:
+        tuple: Legs odds, final odds, Kelly budget and Kelly multiplier.
+    """
+    if not isinstance(parlay, dict):
+        raise ValueError("parlay must be an object")
+
+    legs = parlay.get("legs")
+    if not isinstance(legs, list) or not legs:
+        raise ValueError("legs must be a non-empty list")
+
+    legs_odds = []
+    for leg in legs:
+        if not isinstance(leg, list) or not leg:
+            raise ValueError("each leg must be a non-empty list of decimal odds")
+        odds = [float(o) for o in leg]
+        if any(not (o > 1 and math.isfinite(o)) for o in odds):
+            raise ValueError("decimal odds must be finite and greater than 1")
+        if sum(1 / o for o in odds) < 1:
+            raise ValueError("leg odds must include a margin (implied probabilities summing to at least 1)")
+        legs_odds.append(odds)
+
+    final_odds = float(parlay["final_odds"]) if "final_odds" in parlay else None
+    if final_odds is None or not (final_odds > 1 and math.isfinite(final_odds)):
+        raise ValueError("final_odds must be finite decimal odds greater than 1")
+
+    kelly_budget = parlay.get("kelly_budget")
+    kelly_mult = parlay.get("kelly_mult")
+    kelly_budget = float(kelly_budget) if kelly_budget is not None else None
+    kelly_mult = float(kelly_mult) if kelly_mult is not None else None
+
+    return legs_odds, final_odds, kelly_budget, kelly_mult
+
+
+def _devig_legs(legs_probs, margins, method):
+    """
+    Devigs all legs of all parlays with one method.
+
+    Args:
+        legs_probs (np.ndarray): Padded 2-D array of implied probabilities, one leg per row.
+        margins (np.ndarray): Margin of each leg.
+        method (str): One of pricing.METHODS.
+
+    Returns:
+        np.ndarray: Fair decimal odds, padded like legs_probs.
+    """
+    return batch_implied_odds(legs_probs, method=METHODS[method], margin=margins, normalize=False)["implied_odds"]
+
+
+def devig_parlays(parlays, methods=None, devig_legs=_devig_legs, deadline=None, profile=None):
+    """
+    Devigs a batch of parlays and calculates EV and Kelly wager for each method.
+
+    All legs of all parlays are devigged together, one vectorized pass per method.
+    Invalid parlays get an "error" entry and do not affect the rest of the batch.
+
+    Args:
+        parlays (list): A list of parlays, see _validate_parlay for the format.
+        methods (list): Methods to run (default is pricing.DEFAULT_METHODS).
+        devig_legs (callable): Devigs the padded legs with one method, see _devig_legs
+            (parallel_devig.DevigPool passes one that runs on a process pool).
+        deadline (float): time.monotonic() value after which pricing stops with a TimeoutError,
+            checked between methods (default is None, no deadline).
+        profile (metrics.Profile): Records the time spent validating, devigging with each method and
+            on EV/Kelly (default is None, no profiling).
+
+    Returns:
+        list: One result dictionary per parlay, in input order: its legs (with the fair odds per method
+            and the "consensus" min/avg/max/spread of the fair probability of the selection), the results
+            per method and the "min", "avg", "max" and "spread" of the EV% and Kelly wager across methods.
+    """
+    methods = list(DEFAULT_METHODS) if methods is None else methods
+
+    results = [None] * len(parlays)
+    valid = []
+    with stage(profile, "validate"):
+        for i, parlay in enumerate(parlays):
+            try:
+                valid.append((i,) + _validate_parlay(parlay))
+            except (ValueError, TypeError) as e:
+                results[i] = {"error": str(e)}
+                INPUT_ERRORS.inc("parlay")
+
+    if not valid:
+        return results
+
+    # Flatten the legs of every valid parlay into one padded array
+    all_legs = [odds for _, legs_odds, _, _, _ in valid for odds in legs_odds]
+    leg_counts = np.array([len(legs_odds) for _, legs_odds, _, _, _ in valid])
+    leg_starts = np.concatenate(([0], np.cumsum(leg_counts)[:-1]))
+
+    legs_probs = 1 / pad_markets(all_legs)
+    margins = np.nansum(legs_probs, axis=1) - 1
+
+    final_odds = np.array([v[2] for v in valid])
+
+    devigged = {}
+    totals = {}
+    for method in methods:
+        check_deadline(deadline)
+        with stage(profile, f"devig.{method}"):
+            devigged[method] = devig_legs(legs_probs, margins, method)
+            # Parlay fair odds: product of the fair odds of the first outcome of each leg
+            totals[method] = np.multiply.reduceat(devigged[method][:, 0], leg_starts)
+
+    # Method consensus on the fair probability of each leg's selection (the first outcome)
+    legs_fair_probs = 1 / np.stack([devigged[method][:, 0] for method in methods])
+    legs_min, legs_avg, legs_max = legs_fair_probs.min(axis=0), legs_fair_probs.mean(axis=0), legs_fair_probs.max(axis=0)
+
+    with stage(profile, "ev_kelly"):
+        for j, (i, legs_odds, _, kelly_budget, kelly_mult) in enumerate(valid):
+            start = leg_starts[j]
+            legs = []
+            for k, odds in enumerate(legs_odds):
+                row = start + k
+                legs.append({
+                    "odds": odds,
+                    "margin": float(margins[row]),
+                    "fair_odds": {method: _to_json_list(devigged[method][row, :len(odds)]) for method in methods},
+                    "consensus": {"min": float(legs_min[row]), "avg": float(legs_avg[row]), "max": float(legs_max[row]),
+                                  "spread": float(legs_max[row] - legs_min[row])},
+                })
+
+            method_results = {}
+            for method in methods:
+                total_odds = float(totals[method][j])
+                fair_prob = 1 / total_odds
+                ev = expected_value(fair_prob, final_odds[j])
+                kelly = None
+                if kelly_budget and kelly_mult:
+                    kelly = kelly_bet(fair_prob, final_odds[j] - 1, kelly_budget, kelly_mult)
+                method_results[method] = {
+                    "fair_odds": total_odds,
+                    "fair_prob": fair_prob,
+                    "ev": ev,
+                    "kelly": kelly,
+                }
+
+            evs = [r["ev"] for r in method_results.values()]
+            kellys = [r["kelly"] for r in method_results.values() if r["kelly"] is not None]
+            results[i] = {
+                "legs": legs,
+                "final_odds": float(final_odds[j]),
+                "methods": method_results,
+                "min": {"ev": min(evs), "kelly": min(kellys) if kellys else None},
+                "avg": {"ev": float(np.mean(evs)), "kelly": float(np.mean(kellys)) if kellys else None},
+                "max": {"ev": max(evs), "kelly": max(kellys) if kellys else None},
+                "spread": {"ev": max(evs) - min(evs), "kelly": max(kellys) - min(kellys) if kellys else None},
+            }
+
+    return results
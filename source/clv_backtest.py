@@ -0,0 +1,382 @@
+# Closing-line-value backtest and calibration of the devig methods on a history of placed bets
+#
+# Usage:
+#   python source/clv_backtest.py bets.csv
+#   python source/clv_backtest.py bets.parquet --methods power,shin -o report.json --plot calibration.png
+#
+# Rows (CSV, JSONL or Parquet, one per bet): "odds" (the decimal odds taken), "closing_odds" (the closing
+# line of the bet's market, "2.1/3.4/3.9" in CSV, a list in JSONL and Parquet), "selection" (index of the
+# outcome bet on in closing_odds, default 0), "won" (1 or 0; empty, "void" or "push" while unsettled or
+# void) and optional "market_type" and "id". Parquet needs pyarrow.
+
+import argparse
+import json
+import math
+import sys
+import time
+
+import numpy as np
+
+from batch_implied_odds import batch_implied_odds, pad_markets
+from devig_cli import chunked, read_rows
+from pricing import METHODS
+
+DEFAULT_CHUNK_SIZE = 100000
+DEFAULT_BINS = 10
+# Rows with errors listed in the report; the others are only counted
+MAX_ERROR_EXAMPLES = 20
+# Probabilities are clipped to [EPSILON, 1 - EPSILON] in the log loss
+EPSILON = 1e-15
+
+# Values of "won" (True and False match 1 and 0), compared after stripping and lowercasing strings
+_WON = {"1": 1.0, "0": 0.0, "true": 1.0, "false": 0.0, "won": 1.0, "lost": 0.0, 1: 1.0, 0: 0.0}
+_UNSETTLED = {"", "void", "push", None}
+
+
+def _parse_bet(row):
+    """
+    Validates one row of the history.
+
+    Returns:
+        tuple: (odds taken, closing odds, selection, won (1.0, 0.0 or NaN when unsettled), market type).
+    """
+    try:
+        odds = float(row["odds"])
+        closing = row["closing_odds"]
+    except KeyError as e:
+        raise ValueError(f"missing {e}") from None
+    closing = [float(o) for o in closing.split('/')] if isinstance(closing, str) else [float(o) for o in closing]
+    if any(not (o > 1 and math.isfinite(o)) for o in [odds, *closing]):
+        raise ValueError("decimal odds must be finite and greater than 1")
+    if len(closing) < 2:
+        raise ValueError("a closing line needs at least two odds")
+    if sum(1 / o for o in closing) < 1:
+        raise ValueError("closing odds must include a margin (implied probabilities summing to at least 1)")
+
+    selection = row.get("selection")
+    selection = 0 if selection in ("", None) else int(selection)
+    if not 0 <= selection < len(closing):
+        raise ValueError(f"selection must be an index of the closing odds (0 to {len(closing) - 1})")
+
+    won = row.get("won")
+    if isinstance(won, str):
+        won = won.strip().lower()
+    if won in _WON:
+        won = _WON[won]
+    elif won in _UNSETTLED:
+        won = math.nan
+    else:
+        raise ValueError("won must be 1, 0 or empty")
+    return odds, closing, selection, won, str(row.get("market_type") or "unknown")
+
+
+class _Totals:
+    # Running sums of one group of bets, one row per method
+
+    def __init__(self, n_methods, bins):
+        self.bets = np.zeros(n_methods)
+        self.clv = np.zeros(n_methods)
+        self.clv_squared = np.zeros(n_methods)
+        self.beat_close = np.zeros(n_methods)
+        self.settled = np.zeros(n_methods)
+        self.brier = np.zeros(n_methods)
+        self.log_loss = np.zeros(n_methods)
+        self.bin_bets = np.zeros((n_methods, bins))
+        self.bin_prob = np.zeros((n_methods, bins))
+        self.bin_won = np.zeros((n_methods, bins))
+
+    def add(self, prob, clv, beat_close, won, bin_index):
+        # prob, clv, beat_close, bin_index: (methods, bets), NaN where a method has no fair price; won: (bets,)
+        priced = np.isfinite(prob)
+        self.bets += priced.sum(axis=1)
+        self.clv += np.where(priced, clv, 0).sum(axis=1)
+        self.clv_squared += np.where(priced, clv ** 2, 0).sum(axis=1)
+        self.beat_close += (priced & beat_close).sum(axis=1)
+
+        scored = priced & np.isfinite(won)
+        won = np.where(np.isfinite(won), won, 0)
+        clipped = np.clip(np.where(scored, prob, 0.5), EPSILON, 1 - EPSILON)
+        self.settled += scored.sum(axis=1)
+        self.brier += np.where(scored, (clipped - won) ** 2, 0).sum(axis=1)
+        self.log_loss -= np.where(scored, won * np.log(clipped) + (1 - won) * np.log(1 - clipped), 0).sum(axis=1)
+
+        # Calibration bins of all methods in one bincount: index method * bins + bin
+        n_methods, bins = self.bin_bets.shape
+        flat = (np.arange(n_methods)[:, None] * bins + bin_index)[scored]
+        size = n_methods * bins
+        self.bin_bets += np.bincount(flat, minlength=size).reshape(n_methods, bins)
+        self.bin_prob += np.bincount(flat, clipped[scored], minlength=size).reshape(n_methods, bins)
+        self.bin_won += np.bincount(flat, np.broadcast_to(won, prob.shape)[scored],
+                                    minlength=size).reshape(n_methods, bins)
+
+    def report(self, methods):
+        bins = self.bin_bets.shape[1]
+        report = {}
+        for i, method in enumerate(methods):
+            bets, settled = self.bets[i], self.settled[i]
+            clv = self.clv[i] / bets if bets else None
+            variance = self.clv_squared[i] / bets - clv ** 2 if bets else None
+            calibration = [
+                {"bin": [b / bins, (b + 1) / bins], "bets": int(self.bin_bets[i, b]),
+                 "predicted": self.bin_prob[i, b] / self.bin_bets[i, b],
+                 "observed": self.bin_won[i, b] / self.bin_bets[i, b]}
+                for b in range(bins) if self.bin_bets[i, b]
+            ]
+            report[method] = {
+                "bets": int(bets),
+                "clv": clv,
+                "clv_std_error": math.sqrt(max(variance, 0) / bets) if bets else None,
+                "beat_close": self.beat_close[i] / bets if bets else None,
+                "settled": int(settled),
+                "brier": self.brier[i] / settled if settled else None,
+                "log_loss": self.log_loss[i] / settled if settled else None,
+                "calibration_error": sum(abs(c["predicted"] - c["observed"]) * c["bets"] for c in calibration) / settled
+                if settled else None,
+                "calibration": calibration,
+            }
+        return report
+
+
+class ClvBacktest:
+    """
+    Scores the devig methods against closing lines, a chunk of bets at a time.
+
+    Every chunk's closing lines are devigged with each method in one batch_implied_odds call. A bet's
+    closing line value under a method is the EV% of the odds taken at the method's fair closing
+    probability of the selection, (odds * prob - 1) * 100; settled bets also score the method's
+    probability against the result (Brier score, log loss and a calibration curve). Only running sums
+    are kept, so memory does not grow with the history.
+
+    Args:
+        methods (list): Methods of pricing.METHODS to score (default is all of them; naive is the
+            closing line with the margin left in).
+        bins (int): Equal-width probability bins of the calibration curves.
+    """
+
+    def __init__(self, methods=None, bins=DEFAULT_BINS):
+        self.methods = list(METHODS) if methods is None else list(methods)
+        assert self.methods and all(m in METHODS for m in self.methods), f"methods must be a subset of {list(METHODS)}"
+        assert bins >= 1, "bins must be at least 1"
+        self.bins = bins
+        self.rows = 0
+        self.errors = 0
+        self.error_examples = []
+        self._groups = {}
+
+    def _totals(self, by, key):
+        if (by, key) not in self._groups:
+            self._groups[by, key] = _Totals(len(self.methods), self.bins)
+        return self._groups[by, key]
+
+    def add(self, rows):
+        """
+        Scores a chunk of bets.
+
+        Args:
+            rows (list): Rows of the history as dictionaries (see the module header). Rows that fail
+                validation are counted as errors, not fatal.
+        """
+        odds, closing, selection, won, market_types = [], [], [], [], []
+        for row in rows:
+            self.rows += 1
+            try:
+                if "error" in row:
+                    raise ValueError(row["error"])
+                bet = _parse_bet(row)
+            except (ValueError, TypeError) as e:
+                self.errors += 1
+                if len(self.error_examples) < MAX_ERROR_EXAMPLES:
+                    self.error_examples.append({"row": self.rows, "id": row.get("id"), "error": str(e)})
+                continue
+            odds.append(bet[0])
+            closing.append(bet[1])
+            selection.append(bet[2])
+            won.append(bet[3])
+            market_types.append(bet[4])
+        if not odds:
+            return
+
+        odds = np.array(odds)
+        won = np.array(won)
+        selection = np.array(selection)
+        probs = 1 / pad_markets(closing)
+        margins = np.nansum(probs, axis=1) - 1
+        n_outcomes = np.isfinite(probs).sum(axis=1)
+
+        bets = np.arange(len(odds))
+        prob = np.empty((len(self.methods), len(odds)))
+        for i, method in enumerate(self.methods):
+            fair_odds = batch_implied_odds(probs, method=METHODS[method], margin=margins, normalize=False)
+            prob[i] = 1 / fair_odds["implied_odds"][bets, selection]
+        with np.errstate(invalid="ignore"):
+            # Some methods can price a long shot at or below 0 (additive): no probability
+            prob[~(prob > 0)] = np.nan
+            clv = (odds * prob - 1) * 100
+            beat_close = odds * prob > 1
+            bin_index = np.clip(np.nan_to_num(prob * self.bins).astype(int), 0, self.bins - 1)
+
+        groups = [("all", "all", slice(None))]
+        market_types = np.array(market_types)
+        groups += [("market_type", key, market_types == key) for key in np.unique(market_types).tolist()]
+        groups += [("outcomes", n, n_outcomes == n) for n in np.unique(n_outcomes).tolist()]
+        for by, key, mask in groups:
+            self._totals(by, key).add(prob[:, mask], clv[:, mask], beat_close[:, mask], won[mask],
+                                      bin_index[:, mask])
+
+    def report(self):
+        """
+        Returns:
+            dict: "rows", "errors", "error_examples" (the first rows with errors), "methods" (the scores
+                of every method over all bets: "bets", mean "clv" in % with its "clv_std_error",
+                "beat_close" (share of bets at better odds than the fair close), "settled", "brier",
+                "log_loss", "calibration_error" (bet-weighted mean gap between predicted and observed win
+                rate) and the "calibration" bins), and the same scores per group in "by_market_type" and
+                "by_outcomes" (outcomes in the closing line).
+        """
+        report = {"rows": self.rows, "errors": self.errors, "error_examples": self.error_examples,
+                  "methods": self._totals("all", "all").report(self.methods),
+                  "by_market_type": {}, "by_outcomes": {}}
+        for (by, key), totals in sorted(self._groups.items()):
+            if by != "all":
+                report[f"by_{by}"][str(key)] = totals.report(self.methods)
+        return report
+
+
+def read_history(path, fmt=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yields the rows of a history file in chunks of row dictionaries.
+
+    Args:
+        path (str): CSV, JSONL or Parquet file.
+        fmt (str): 'csv', 'jsonl' or 'parquet' (default is None, from the extension).
+        chunk_size (int): Rows per chunk.
+    """
+    fmt = fmt or _detect_format(path)
+    if fmt == "parquet":
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("reading Parquet needs pyarrow (pip install pyarrow)") from None
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pylist()
+        return
+
+    with open(path, newline="") as stream:
+        yield from chunked(read_rows(stream, fmt), chunk_size)
+
+
+def run_backtest(path, fmt=None, methods=None, bins=DEFAULT_BINS, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """
+    Streams a history file through a ClvBacktest.
+
+    Args:
+        path (str): CSV, JSONL or Parquet file.
+        fmt (str): 'csv', 'jsonl' or 'parquet' (default is None, from the extension).
+        methods (list): Methods of pricing.METHODS to score (default is all of them).
+        bins (int): Bins of the calibration curves.
+        chunk_size (int): Rows held in memory at a time.
+        progress (file): Stream for per-chunk progress lines (default is None, no progress).
+
+    Returns:
+        dict: ClvBacktest.report(), with the elapsed "seconds".
+    """
+    backtest = ClvBacktest(methods, bins)
+    start = time.perf_counter()
+    for chunk in read_history(path, fmt, chunk_size):
+        backtest.add(chunk)
+        if progress is not None:
+            elapsed = time.perf_counter() - start
+            print(f"{backtest.rows} rows, {backtest.errors} errors, {backtest.rows / elapsed:.0f} rows/s", file=progress)
+    report = backtest.report()
+    report["seconds"] = time.perf_counter() - start
+    return report
+
+
+def _detect_format(path):
+    for fmt, extensions in (("csv", (".csv",)), ("jsonl", (".jsonl", ".ndjson")), ("parquet", (".parquet", ".pq"))):
+        if path.endswith(extensions):
+            return fmt
+    raise ValueError(f"cannot detect the format of '{path}', pass --format")
+
+
+def format_report(report):
+    """
+    Renders the scores of every method as a text table, overall and per group.
+    """
+    def table(title, scores):
+        lines = [title, f"{'method':>14} {'bets':>10} {'CLV %':>8} {'+-':>6} {'beat':>6} {'Brier':>7} "
+                        f"{'log loss':>8} {'cal err':>7}"]
+        for method, s in scores.items():
+            if not s["bets"]:
+                lines.append(f"{method:>14} {0:>10}")
+                continue
+            cells = [f"{s['clv']:8.2f}", f"{s['clv_std_error']:6.2f}", f"{s['beat_close']:6.1%}"]
+            cells += [f"{s[key]:{width}.4f}" if s["settled"] else f"{'-':>{width}}"
+                      for key, width in (("brier", 7), ("log_loss", 8), ("calibration_error", 7))]
+            lines.append(f"{method:>14} {s['bets']:>10} " + " ".join(cells))
+        return "\n".join(lines)
+
+    tables = [table("All bets", report["methods"])]
+    tables += [table(f"Market type {key}", scores) for key, scores in report["by_market_type"].items()]
+    tables += [table(f"{key}-way markets", scores) for key, scores in report["by_outcomes"].items()]
+    return "\n\n".join(tables)
+
+
+def plot_calibration(report, path):
+    """
+    Saves the calibration curve of every method over all bets to an image file (needs matplotlib).
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    figure, axes = plt.subplots(figsize=(7, 6))
+    axes.plot([0, 1], [0, 1], color="grey", linestyle="--", linewidth=1)
+    for method, scores in report["methods"].items():
+        bins = scores["calibration"]
+        axes.plot([b["predicted"] for b in bins], [b["observed"] for b in bins], marker="o", markersize=3,
+                  label=method)
+    axes.set_xlabel("fair closing probability")
+    axes.set_ylabel("observed win rate")
+    axes.legend()
+    figure.savefig(path, dpi=120, bbox_inches="tight")
+    plt.close(figure)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backtest the devig methods against closing lines.")
+    parser.add_argument("input", help="CSV, JSONL or Parquet file of bets")
+    parser.add_argument("--format", choices=["csv", "jsonl", "parquet"], help="input format (default: from the extension)")
+    parser.add_argument("--methods", default=",".join(METHODS), help="comma-separated methods (default: all)")
+    parser.add_argument("--bins", type=int, default=DEFAULT_BINS, help="calibration bins (default: 10)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("-o", "--output", help="write the full report as JSON to this file")
+    parser.add_argument("--plot", help="save the calibration curves to this image file")
+    parser.add_argument("--progress", action="store_true", help="print progress after every chunk")
+    args = parser.parse_args(argv)
+
+    methods = [m.strip() for m in args.methods.split(",") if m.strip()]
+    if not methods or any(m not in METHODS for m in methods):
+        parser.error(f"--methods must be a subset of {list(METHODS)}")
+    if args.bins < 1:
+        parser.error("--bins must be at least 1")
+    try:
+        report = run_backtest(args.input, args.format, methods, args.bins, args.chunk_size,
+                              progress=sys.stderr if args.progress else None)
+    except ValueError as e:
+        parser.error(str(e))
+
+    print(format_report(report))
+    for example in report["error_examples"]:
+        print(f"row {example['row']}: {example['error']}", file=sys.stderr)
+    print(f"Scored {report['rows'] - report['errors']} bets ({report['errors']} errors) in {report['seconds']:.2f} s, "
+          f"{report['rows'] / report['seconds']:.0f} rows/s", file=sys.stderr)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.plot:
+        plot_calibration(report, args.plot)
+
+
+if __name__ == "__main__":
+    main()
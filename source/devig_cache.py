@@ -0,0 +1,205 @@
+# Bounded memoization of devigged legs, shared by every request of the process
+
+import os
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from implied_odds import implied_odds, implied_odds_methods
+from market import Market, probs_key
+
+
+def _sizeof(obj):
+    """
+    Approximates the memory used by a cached key or value.
+
+    Args:
+        obj: A number, string, or a (nested) list, tuple or dict of them.
+
+    Returns:
+        int: Size in bytes.
+    """
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_sizeof(k) + _sizeof(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(_sizeof(x) for x in obj)
+    return size
+
+
+class DevigCache:
+    """
+    Thread-safe LRU cache with an optional TTL, bounded by entry count and approximate memory.
+
+    Args:
+        max_entries (int): Maximum number of cached entries.
+        max_bytes (int): Maximum approximate memory used by keys and values.
+        ttl (float): Seconds after which an entry expires (default is None, entries never expire).
+    """
+
+    def __init__(self, max_entries=100000, max_bytes=64 * 1024 * 1024, ttl=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """
+        Looks up a key and marks it as recently used.
+
+        Returns:
+            tuple: (True, value) on a hit, (False, None) on a miss or an expired entry.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+
+            value, size, expires = entry
+            if expires is not None and expires < time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return False, None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, value
+
+    def put(self, key, value):
+        size = _sizeof(key) + _sizeof(value)
+        if size > self.max_bytes:
+            return
+
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, expires)
+            self._bytes += size
+
+            # Evict least recently used entries until both bounds hold
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        Returns:
+            dict: Entry count, approximate bytes, hit/miss/eviction/expiration counters and hit ratio.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+DEVIG_CACHE = DevigCache(
+    max_entries=int(os.environ.get("DEVIG_CACHE_MAX_ENTRIES", 100000)),
+    max_bytes=int(os.environ.get("DEVIG_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+    ttl=float(os.environ["DEVIG_CACHE_TTL"]) if os.environ.get("DEVIG_CACHE_TTL") else None,
+)
+
+
+def cached_implied_odds(prob, category="us", method="naive", margin=0, gross_margin=None, normalize=True,
+                        cache=DEVIG_CACHE):
+    """
+    implied_odds.implied_odds behind a bounded cache.
+
+    The key is the normalized odds (probabilities rounded to 12 decimals, packed by market.probs_key and
+    precomputed for a Market) plus the method and margin parameters. Cached results are shared between callers and must not be modified.
+
+    Args:
+        prob, category, method, margin, gross_margin, normalize: as in implied_odds.implied_odds.
+        cache (DevigCache): Cache to use (default is the process-wide DEVIG_CACHE).
+
+    Returns:
+        list or dictionary: fair odds of a given event, as returned by implied_odds.
+    """
+    key = (
+        prob.key if isinstance(prob, Market) else probs_key(prob if isinstance(prob, list) else [prob]),
+        category,
+        method,
+        round(float(margin), 12),
+        gross_margin,
+        normalize,
+    )
+
+    hit, value = cache.get(key)
+    if hit:
+        return value
+
+    value = implied_odds(prob, category=category, method=method, margin=margin,
+                         gross_margin=gross_margin, normalize=normalize)
+    cache.put(key, value)
+    return value
+
+
+def cached_fair_odds(prob, methods, margin=0, gross_margin=None, normalize=True, cache=DEVIG_CACHE, seconds=None):
+    """
+    Fair decimal odds of several implied_odds methods (implied_odds_methods) behind the same cache.
+
+    The odds of all the methods share one entry, packed into a single array of doubles: one lookup per
+    market whatever the number of methods, and an entry whose size is known without walking it.
+
+    Args:
+        prob (list, Market): as in implied_odds.implied_odds.
+        methods (list): implied_odds method names.
+        margin, gross_margin, normalize: as in implied_odds.implied_odds.
+        cache (DevigCache): Cache to use (default is the process-wide DEVIG_CACHE).
+        seconds (dict): Receives the devig time of each method on a cache miss, see implied_odds_methods
+            (default is None).
+
+    Returns:
+        list: fair decimal odds of the event for each method, in the order of methods.
+    """
+    key = (
+        prob.key if isinstance(prob, Market) else probs_key(prob if isinstance(prob, list) else [prob]),
+        "fair_odds",
+        ",".join(methods),
+        round(float(margin), 12),
+        gross_margin,
+        normalize,
+    )
+
+    hit, packed = cache.get(key)
+    if not hit:
+        devigged = implied_odds_methods(prob, methods, category="dec", margin=margin,
+                                        gross_margin=gross_margin, normalize=normalize, seconds=seconds)
+        packed = array("d")
+        for method in methods:
+            value = devigged[method]
+            packed.extend(value["implied_odds"] if isinstance(value, dict) else value)
+        cache.put(key, packed)
+
+    n_outcomes = len(packed) // len(methods)
+    return [packed[start:start + n_outcomes].tolist() for start in range(0, len(packed), n_outcomes)]
@@ -0,0 +1,357 @@
+# Streaming bulk devigging of CSV/JSONL files of markets or parlays
+#
+# Usage:
+#   python source/devig_cli.py markets.csv -o fair.csv
+#   python source/devig_cli.py parlays.jsonl --mode parlays --methods mult,shin > results.jsonl
+#
+# Fair odds are written as decimal odds, or in the format given by --odds-format (us, frac, prob).
+#
+# Markets rows: "odds" ("1.5/2.6" in CSV, [1.5, 2.6] in JSONL) and an optional "id".
+# Parlays rows: "legs" ("1.5/2.6, 2.1/3.4/3.9" in CSV, [[1.5, 2.6], [2.1, 3.4, 3.9]] in JSONL),
+# "final_odds", optional "kelly_budget", "kelly_mult" and "id".
+
+import argparse
+import csv
+import itertools
+import json
+import sys
+import time
+
+from odds_convert import FORMATS
+from pricing import DEFAULT_METHODS, METHODS, parse_legs
+
+DEFAULT_CHUNK_SIZE = 10000
+
+
+def read_rows(stream, fmt):
+    """
+    Yields the rows of a CSV or JSONL stream as dictionaries, one at a time.
+
+    Rows that cannot be decoded are yielded as {"error": ...} so they are reported, not fatal.
+    """
+    if fmt == "csv":
+        yield from csv.DictReader(stream)
+        return
+
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            row = {"error": f"invalid JSON: {e}"}
+        if not isinstance(row, dict):
+            row = {"error": "row must be a JSON object"}
+        yield row
+
+
+def chunked(rows, chunk_size):
+    iterator = iter(rows)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _parse_odds(value):
+    odds = [float(o) for o in value.split('/')] if isinstance(value, str) else [float(o) for o in value]
+    if len(odds) < 2:
+        raise ValueError("a market needs at least two odds")
+    if any(not 1 < o < float("inf") for o in odds):
+        raise ValueError("decimal odds must be finite and greater than 1")
+    if sum(1 / o for o in odds) < 1:
+        raise ValueError("odds must include a margin (implied probabilities summing to at least 1)")
+    return odds
+
+
+def _format_fair_odds(fair_odds, odds_format):
+    """
+    Converts fair decimal odds to the output format in one bulk conversion.
+
+    Args:
+        fair_odds (np.ndarray): Fair decimal odds, NaN where there are none.
+        odds_format (str): One of odds_convert.FORMATS.
+
+    Returns:
+        np.ndarray: Object array of the converted odds, None where fair_odds is NaN.
+    """
+    import numpy as np
+    from odds_convert import convert
+
+    fair_odds = np.asarray(fair_odds, dtype=float)
+    cells = np.full(fair_odds.shape, None, dtype=object)
+    finite = np.isfinite(fair_odds)
+    cells[finite] = convert(fair_odds[finite], "dec", odds_format).tolist()
+    return cells
+
+
+def _devig_group(implied_odds, valid, methods, odds_format):
+    from batch_implied_odds import pad_markets
+
+    probs = 1 / pad_markets([odds for _, odds in valid])
+    margins = [sum(1 / o for o in odds) - 1 for _, odds in valid]
+    fair_odds = {
+        method: _format_fair_odds(
+            implied_odds(probs, method=METHODS[method], margin=margins, normalize=False)["implied_odds"],
+            odds_format,
+        )
+        for method in methods
+    }
+    return margins, fair_odds
+
+
+def devig_markets(rows, methods, pool=None, odds_format="dec"):
+    """
+    Devigs a chunk of markets with every method in one vectorized pass per method.
+
+    Args:
+        rows (list): (id, row) pairs read from the input.
+        methods (list): Methods of pricing.METHODS to run.
+        pool (DevigPool): Process pool to devig on (default is None, devig in this process).
+        odds_format (str): Format of the fair odds, one of odds_convert.FORMATS (default is 'dec').
+
+    Returns:
+        list: One output dictionary per row, in input order.
+    """
+    from batch_implied_odds import batch_implied_odds
+
+    implied_odds = batch_implied_odds if pool is None else pool.implied_odds
+
+    results = []
+    valid = []
+    for row_id, row in rows:
+        try:
+            if "error" in row:
+                raise ValueError(row["error"])
+            valid.append((len(results), _parse_odds(row["odds"])))
+            results.append({"id": row_id})
+        except (KeyError, ValueError, TypeError) as e:
+            results.append({"id": row_id, "error": str(e) if not isinstance(e, KeyError) else f"missing {e}"})
+
+    if valid:
+        try:
+            groups = [(valid, _devig_group(implied_odds, valid, methods, odds_format))]
+        except AssertionError:
+            # One market the methods cannot devig fails its whole chunk: devig them one by one to find it
+            groups = []
+            for market in valid:
+                try:
+                    groups.append(([market], _devig_group(implied_odds, [market], methods, odds_format)))
+                except AssertionError as e:
+                    results[market[0]]["error"] = str(e) or "devig failed"
+        for group, (margins, fair_odds) in groups:
+            for j, (i, odds) in enumerate(group):
+                results[i].update({"odds": odds, "margin": margins[j]})
+                for method in methods:
+                    results[i][f"{method}_fair_odds"] = fair_odds[method][j, :len(odds)].tolist()
+
+    return results
+
+
+def devig_parlay_rows(rows, methods, pool=None, odds_format="dec"):
+    """
+    Prices a chunk of parlays with devig_parlays.
+
+    Args:
+        rows (list): (id, row) pairs read from the input.
+        methods (list): Methods of pricing.METHODS to run.
+        pool (DevigPool): Process pool to devig on (default is None, devig in this process).
+        odds_format (str): Format of the total fair odds, one of odds_convert.FORMATS (default is 'dec').
+
+    Returns:
+        list: One output dictionary per row, in input order.
+    """
+    from bulk_devig import devig_parlays
+
+    devig = devig_parlays if pool is None else pool.devig_parlays
+
+    parlays = []
+    for _, row in rows:
+        if "error" in row:
+            parlays.append(row)
+            continue
+        parlay = dict(row)
+        try:
+            if isinstance(parlay.get("legs"), str):
+                parlay["legs"] = parse_legs(parlay["legs"])
+            for key in ("kelly_budget", "kelly_mult"):
+                if parlay.get(key) in ("", None):
+                    parlay.pop(key, None)
+        except ValueError as e:
+            parlay = {"error": str(e)}
+        parlays.append(parlay)
+
+    try:
+        priced_parlays = devig(parlays, methods)
+    except AssertionError:
+        # A leg the methods cannot devig fails its whole chunk: price the parlays one by one to find it
+        priced_parlays = []
+        for parlay in parlays:
+            try:
+                priced_parlays.extend(devig([parlay], methods))
+            except AssertionError as e:
+                priced_parlays.append({"error": str(e) or "devig failed"})
+
+    results = []
+    for (row_id, _), parlay, priced in zip(rows, parlays, priced_parlays):
+        if "error" in parlay:
+            priced = {"error": parlay["error"]}
+        output = {"id": row_id}
+        if "error" in priced:
+            output["error"] = priced["error"]
+        else:
+            output["final_odds"] = priced["final_odds"]
+            for method, result in priced["methods"].items():
+                output[f"{method}_fair_odds"] = result["fair_odds"]
+                output[f"{method}_ev"] = result["ev"]
+                output[f"{method}_kelly"] = result["kelly"]
+            output["min_ev"] = priced["min"]["ev"]
+            output["avg_ev"] = priced["avg"]["ev"]
+            output["max_ev"] = priced["max"]["ev"]
+            output["spread_ev"] = priced["spread"]["ev"]
+        results.append(output)
+
+    if odds_format != "dec":
+        for method in methods:
+            priced = [output for output in results if "error" not in output]
+            converted = _format_fair_odds([output[f"{method}_fair_odds"] for output in priced], odds_format)
+            for output, fair_odds in zip(priced, converted.tolist()):
+                output[f"{method}_fair_odds"] = fair_odds
+    return results
+
+
+def output_columns(mode, methods):
+    if mode == "markets":
+        columns = ["id", "odds", "margin"] + [f"{m}_fair_odds" for m in methods]
+    else:
+        columns = ["id", "final_odds"]
+        for m in methods:
+            columns += [f"{m}_fair_odds", f"{m}_ev", f"{m}_kelly"]
+        columns += ["min_ev", "avg_ev", "max_ev", "spread_ev"]
+    return columns + ["error"]
+
+
+class ResultWriter:
+    """
+    Writes result dictionaries to a CSV or JSONL stream as they are produced.
+
+    Lists are written slash-separated in CSV, like the odds input of the page.
+    """
+
+    def __init__(self, stream, fmt, columns):
+        self.stream = stream
+        self.fmt = fmt
+        if fmt == "csv":
+            self.writer = csv.DictWriter(stream, fieldnames=columns, extrasaction="ignore")
+            self.writer.writeheader()
+
+    def write(self, results):
+        if self.fmt == "jsonl":
+            self.stream.writelines(json.dumps(result) + "\n" for result in results)
+            return
+
+        for result in results:
+            self.writer.writerow({
+                key: "/".join("" if x is None else repr(x) for x in value) if isinstance(value, list) else value
+                for key, value in result.items()
+            })
+
+
+def run(input_stream, output_stream, fmt, output_fmt, mode, methods, chunk_size=DEFAULT_CHUNK_SIZE,
+        progress=None, pool=None, odds_format="dec"):
+    """
+    Streams rows from input to output through the devig methods, one chunk at a time.
+
+    Args:
+        input_stream, output_stream: Text streams.
+        fmt (str): Input format, 'csv' or 'jsonl'.
+        output_fmt (str): Output format, 'csv' or 'jsonl'.
+        mode (str): 'markets' or 'parlays'.
+        methods (list): Methods of pricing.METHODS to run.
+        chunk_size (int): Rows held in memory at a time.
+        progress (file): Stream for per-chunk progress lines (default is None, no progress).
+        pool (DevigPool): Process pool to devig on (default is None, devig in this process).
+        odds_format (str): Format of the fair odds, one of odds_convert.FORMATS (default is 'dec').
+
+    Returns:
+        dict: Rows processed, rows with errors and elapsed seconds.
+    """
+    devig = devig_markets if mode == "markets" else devig_parlay_rows
+    writer = ResultWriter(output_stream, output_fmt, output_columns(mode, methods))
+
+    start = time.perf_counter()
+    n_rows = 0
+    n_errors = 0
+    rows = read_rows(input_stream, fmt)
+    for chunk in chunked(enumerate(rows, start=1), chunk_size):
+        chunk = [(row.get("id") or str(line), row) for line, row in chunk]
+        results = devig(chunk, methods, pool, odds_format)
+        writer.write(results)
+
+        n_rows += len(results)
+        n_errors += sum("error" in result for result in results)
+        if progress is not None:
+            elapsed = time.perf_counter() - start
+            print(f"{n_rows} rows, {n_errors} errors, {n_rows / elapsed:.0f} rows/s", file=progress)
+
+    return {"rows": n_rows, "errors": n_errors, "seconds": time.perf_counter() - start}
+
+
+def _detect_format(path, fmt):
+    if fmt:
+        return fmt
+    if path.endswith(".csv"):
+        return "csv"
+    if path.endswith(".jsonl") or path.endswith(".ndjson"):
+        return "jsonl"
+    raise SystemExit(f"cannot detect the format of '{path}', pass --format")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Devig a CSV or JSONL file of markets or parlays.")
+    parser.add_argument("input", help="input file, or - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="output file, or - for stdout (default)")
+    parser.add_argument("--mode", choices=["markets", "parlays"], default="markets")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="input format (default: from the extension)")
+    parser.add_argument("--output-format", choices=["csv", "jsonl"], help="output format (default: input format)")
+    parser.add_argument("--methods", default=",".join(DEFAULT_METHODS),
+                        help="comma-separated methods (default: all but naive)")
+    parser.add_argument("--odds-format", choices=FORMATS, default="dec", help="format of the fair odds (default: dec)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=1, help="worker processes (default: 1, no pool)")
+    parser.add_argument("--progress", action="store_true", help="print progress after every chunk")
+    args = parser.parse_args(argv)
+
+    methods = [m.strip() for m in args.methods.split(",") if m.strip()]
+    if not methods or any(m not in METHODS for m in methods):
+        parser.error(f"--methods must be a subset of {list(METHODS)}")
+
+    fmt = _detect_format(args.input, args.format)
+    output_fmt = args.output_format or (fmt if args.output == "-" else _detect_format(args.output, args.output_format))
+
+    input_stream = sys.stdin if args.input == "-" else open(args.input, newline="")
+    output_stream = sys.stdout if args.output == "-" else open(args.output, "w", newline="")
+    pool = None
+    if args.workers > 1:
+        from parallel_devig import DevigPool
+        pool = DevigPool(args.workers, chunk_size=max(1000, args.chunk_size // args.workers))
+    try:
+        summary = run(input_stream, output_stream, fmt, output_fmt, args.mode, methods, args.chunk_size,
+                      progress=sys.stderr if args.progress else None, pool=pool, odds_format=args.odds_format)
+    finally:
+        if pool is not None:
+            pool.close()
+        if input_stream is not sys.stdin:
+            input_stream.close()
+        if output_stream is not sys.stdout:
+            output_stream.close()
+
+    rate = summary["rows"] / summary["seconds"] if summary["seconds"] else 0
+    print(f"Devigged {summary['rows']} rows ({summary['errors']} errors) in {summary['seconds']:.2f} s, "
+          f"{rate:.0f} rows/s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,15 @@
 # Customized pybettor lib
 
 from typing import Union
-from fractions import Fraction
-from scipy import optimize
-from scipy.optimize import root_scalar
-import numpy as np
+import time
+
+import metrics
+from market import Market
+from odds_convert import dec_to_frac, dec_to_us, prob_to_dec, prob_to_frac, prob_to_us
+
+# numpy and the batch solvers are imported inside the functions that need them, so that
+# importing this module stays cheap and each backend is only loaded once a method uses it
+# (see backends.py)
 
 
 def _convert_dec_odds(odds, cat_out, prob):
@@ -26,23 +31,18 @@ def _convert_dec_odds(odds, cat_out, prob):
 
 
 def _convert_dec_to_us_odds(odds):
-    new_odds = [(x - 1) * 100 if x >= 2 else -100 / (x - 1) for x in odds]
-    new_odds = [round(x) for x in new_odds]
-    return new_odds
+    return dec_to_us(odds)
 
 
 def _convert_dec_to_frac(odds):
-    new_odds = [Fraction(x - 1).limit_denominator(100) for x in odds]
-    new_odds = [str(x.numerator) + "/" + str(x.denominator) for x in new_odds]
-    return new_odds
+    return dec_to_frac(odds)
 
 
 def _implied_naive_odds(prob, category):
     if category == "all":
-        us = [x / (1 - x) * -100 if x > 0.5 else (1 - x) / x * 100 for x in prob]
-        dec = [round(1 / x, 2) for x in prob]
-        frac = [Fraction(x - 1).limit_denominator(100) for x in dec]
-        frac = [str(x.numerator) + "/" + str(x.denominator) for x in frac]
+        us = prob_to_us(prob, rounded=False)
+        dec = prob_to_dec(prob, ndigits=2)
+        frac = dec_to_frac(dec)
         prob = prob
         imp_odds = {
             "American": us,
@@ -52,15 +52,13 @@ def _implied_naive_odds(prob, category):
         }
 
     elif category == "us":
-        imp_odds = [x / (1 - x) * -100 if x > 0.5 else (1 - x) / x * 100 for x in prob]
-        imp_odds = [round(x) for x in imp_odds]
+        imp_odds = prob_to_us(prob)
 
     elif category == "dec":
-        imp_odds = [round(1 / x, 2) for x in prob]
+        imp_odds = prob_to_dec(prob, ndigits=2)
 
     elif category == "frac":
-        imp_odds = [Fraction((1.0 / x) - 1.0).limit_denominator(100) for x in prob]
-        imp_odds = [str(x.numerator) + "/" + str(x.denominator) for x in imp_odds]
+        imp_odds = prob_to_frac(prob)
 
     return imp_odds
 
@@ -71,26 +69,25 @@ def _implied_basic_odds(prob, margin):
 
 
 def _implied_wpo_odds(prob, margin):
+    # Margin weights proportional to the odds: each outcome carries margin * odds / n of the margin
     num_outcomes = len(prob)
     naive_odds = [1 / x for x in prob]
     specific_margins = [(margin * x) / num_outcomes for x in naive_odds]
-    imp_odds = [x / (1 + y) for x, y in zip(naive_odds, specific_margins)]
+    imp_odds = [x / (1 - y) for x, y in zip(naive_odds, specific_margins)]
     return imp_odds, specific_margins
 
 
 def _implied_odds_ratio_odds(prob, margin):
+    from batch_implied_odds import solve_odds_ratio_market
+
+    # Same solver as the batch path: Newton iterations on the odds ratio, from 1 (no margin)
     if margin != 0:
-        res = optimize.root_scalar(
-            f=or_solvefor,
-            bracket=[0.05, 5],
-            method="brentq",
-            args=(np.array(prob), margin),
-        )
-        odds_ratio = res.root
+        odds_ratio, converged, iterations = solve_odds_ratio_market(prob, sum(prob) - margin)
+        metrics.observe_solver("odds_ratio", iterations, converged)
     else:
         odds_ratio = 1
 
-    imp_odds = [1 / or_func(cc=odds_ratio, probs=x) for x in prob]
+    imp_odds = [(odds_ratio * (1 - x) + x) / x for x in prob]
 
     return imp_odds, odds_ratio
 
@@ -101,48 +98,54 @@ def or_func(cc, probs):
 
 
 def or_solvefor(cc, probs, margin):
+    import numpy as np
+
     tmp = or_func(cc, probs)
     return np.sum(tmp) - (1 + margin)
 
-def _implied_power_odds(odds, margin):
+def _implied_power_odds(prob, margin):
     """
-    Calculates the adjusted probabilities using the power method.
+    Calculates the adjusted odds using the power method.
 
     Args:
-        odds (list): A list of decimal odds (e.g., [1.5, 2.5, 3.0])
+        prob (list): A list of implied probabilities (e.g., [1 / 1.5, 1 / 2.5, 1 / 3.0])
 
     Returns:
-        list: Adjusted probabilities.
-        float: The exponent value k used for adjustment.
+        list: Adjusted odds.
+        float: The exponent value k used for adjustment (odds ** (1 / k) are the adjusted probabilities).
     """
-    # Step 1: Calculate the naive implied probabilities
-    naive_probs = [1 / odd for odd in odds]
-
-    # Step 2: Define a function to find the correct exponent k
-    def find_k(k):
-        # Calculate adjusted probabilities for a given k
-        adjusted_probs = [prob ** (1 / k) for prob in naive_probs]
-        # The sum should be 1 to ensure they are proper probabilities
-        return sum(adjusted_probs) - 1
-
-    # Step 3: Use a numerical method to find the root for k (so that sum of adjusted_probs = 1)
-    result = root_scalar(find_k, method='secant', x0=-1, x1=2.0, xtol=1e-6, rtol=1e-6, maxiter=100)
-
-    # Extract the found k value
-    k = result.root
+    from batch_implied_odds import solve_power_exponent_market
+    from two_way_tables import get_table, record_lookups
+
+    # Two-way markets are looked up in the interpolation table when one is loaded, and solved for k with
+    # the safeguarded Newton solver of the batch path otherwise, or when the table is not accurate enough
+    table = get_table("power") if len(prob) == 2 else None
+    exponent = table.lookup(prob[0], prob[1]) if table is not None else None
+    if table is not None:
+        record_lookups("power", exponent is not None, exponent is None)
+
+    if exponent is not None:
+        k = -1 / exponent
+    else:
+        k, converged, iterations = solve_power_exponent_market(prob)
+        metrics.observe_solver("power", iterations, converged)
 
-    # Step 4: Calculate the adjusted probabilities using the found k
-    adjusted_probs = [prob ** (1 / k) for prob in naive_probs]
-    adjusted_odds = [1/p for p in adjusted_probs]
+    # Calculate the adjusted probabilities using the found k
+    adjusted_probs = [(1 / p) ** (1 / k) for p in prob]
+    adjusted_odds = [1 / p for p in adjusted_probs]
 
     return adjusted_odds, k
 
 
 def pwr_func(nn, probs):
+    import numpy as np
+
     return np.power(probs, nn)
 
 
 def pwr_solvefor(nn, probs, margin):
+    import numpy as np
+
     tmp = pwr_func(nn, probs)
     return np.sum(tmp) - (1 + margin)
 
@@ -152,36 +155,15 @@ def _implied_additive_odds(probs, margin):
     return imp_odds
 
 
-def _implied_shin_odds(prob, margin, gross_margin):
-    if margin != 0:
-        res = optimize.root_scalar(
-            f=shin_solvefor,
-            bracket=[0, 0.4],
-            method="brentq",
-            args=(np.array(prob), margin, gross_margin),
-        )
-        zz = res.root
-    else:
-        zz = 0
-
-    imp_odds = 1 / shin_func(zz, np.array(prob), gross_margin)
+def _implied_shin_odds(prob):
+    from batch_implied_odds import solve_shin_market
 
-    return imp_odds, zz
+    # Same solver as the batch path: closed form for two outcomes, Newton iterations otherwise
+    fair_prob, z_value, converged, iterations = solve_shin_market(prob)
+    metrics.observe_solver("shin", iterations, converged)
+    imp_odds = [1 / p for p in fair_prob]
 
-
-def shin_func(zz, probs, gross_margin):
-    yy = np.sqrt((zz * probs) + ((1 - zz) * probs**2))
-    res = yy * np.sum(yy)
-
-    if gross_margin is not None:
-        res = res / (1 - gross_margin)
-
-    return res
-
-
-def shin_solvefor(zz, probs, margin, gross_margin):
-    tmp = shin_func(zz, probs, gross_margin)
-    return np.sum(tmp) - (1 + margin)
+    return imp_odds, z_value
 
 
 def _implied_balanced_book_odds(prob, margin, gross_margin):
@@ -191,10 +173,7 @@ def _implied_balanced_book_odds(prob, margin, gross_margin):
         gross_margin = 0
 
     zz = (((1 - gross_margin) * (1 + margin)) - 1) / (num_outcomes - 1)
-    imp_odds = [
-        1 / ((1 + margin) * (((x * (1 - zz)) + zz) / ((num_outcomes - 1) * zz + 1)))
-        for x in prob
-    ]
+    imp_odds = [(1 - zz) / (x * (1 - gross_margin) - zz) for x in prob]
 
     return imp_odds, zz
 
@@ -215,7 +194,8 @@ def implied_odds(
     (https://cran.r-project.org/web/packages/implied/implied.pdf)
 
     Args:
-        prob (int, float, list): probability of an event
+        prob (int, float, list, Market): probability of an event, or a validated Market (its probabilities
+            are not checked again)
         category (str, optional): type of odds. Defaults to "us". \n
             'all', returns all odds \n
             'us', American Odds \n
@@ -224,11 +204,11 @@ def implied_odds(
         method (str, optional): method to calculate implied odds. Defaults to "naive". \n
             'naive', naive implied odds \n
             'basic', basic implied odds \n
-            'wpo', weighted probability odds \n
-            'odds_ratio', odds ratio \n
+            'wpo', weighted probability odds (the margin of each outcome proportional to its odds) \n
+            'odds_ratio', odds ratio (solved for the odds ratio that removes the margin) \n
             'power', power \n
             'additive', additive \n
-            'shin', shin \n
+            'shin', shin (Shin's model, solved for the given probabilities; margin is not used) \n
             'balanced_book', balanced book
         margin (float, optional): margin to apply to odds. Defaults to 0.
         gross_margin (float, optional): gross margin to apply to odds. Defaults to None.
@@ -239,18 +219,82 @@ def implied_odds(
             Only returns list when category != 'all' or method in ('naive', 'basic', 'additive')
     """
 
-    if type(prob) is not list:
-        prob = [prob]
+    # Time every solve and count rejected inputs for /metrics
+    start = time.perf_counter()
+    try:
+        imp_odds = _implied_odds(prob, category, method, margin, gross_margin, normalize)
+    except AssertionError:
+        metrics.INPUT_ERRORS.inc("implied_odds")
+        raise
+    metrics.SOLVE_SECONDS.observe(time.perf_counter() - start, method)
+    return imp_odds
+
+
+def _implied_odds(prob, category, method, margin, gross_margin, normalize):
+    prob, balanced_prob = _prepare(prob, category, [method], margin, gross_margin, normalize)
+    return _method_odds(prob, balanced_prob, category, method, margin, gross_margin)
+
+
+def implied_odds_methods(
+    prob: Union[int, float, list],
+    methods: list,
+    category: str = "dec",
+    margin: float = 0,
+    gross_margin: float = None,
+    normalize: bool = True,
+    seconds: dict = None,
+) -> dict:
+    """Implied Odds of Several Methods
+    implied_odds for several methods of the same event, validating the probabilities once.
+
+    Args:
+        prob (int, float, list, Market): as in implied_odds.
+        methods (list): implied_odds method names.
+        category, margin, gross_margin, normalize: as in implied_odds.
+        seconds (dict): Receives the time spent on each method, by method (default is None).
+
+    Returns:
+        dictionary: what implied_odds returns for each method, by method.
+    """
+    start = time.perf_counter()
+    try:
+        prob, balanced_prob = _prepare(prob, category, methods, margin, gross_margin, normalize)
+    except AssertionError:
+        metrics.INPUT_ERRORS.inc("implied_odds")
+        raise
+
+    results = {}
+    for method in methods:
+        results[method] = _method_odds(prob, balanced_prob, category, method, margin, gross_margin)
+        end = time.perf_counter()
+        metrics.SOLVE_SECONDS.observe(end - start, method)
+        if seconds is not None:
+            seconds[method] = end - start
+        start = end
+    return results
+
+
+def _prepare(prob, category, methods, margin, gross_margin, normalize):
+    # Validates the inputs shared by every method, returns the probabilities and the normalized ones
+    if isinstance(prob, Market):
+        # Validated when the market was built, with its probability sum cached
+        total = prob.total
+        prob = prob.probs.tolist()
+    else:
+        if type(prob) is not list:
+            prob = [prob]
+
+        assert all(isinstance(x, float) for x in prob), "calculating implied odds: probability must be numeric"
+        assert all(x > 0 and x < 1 for x in prob), "calculating implied odds: probability must be between 0 and 1"
+        total = None
 
-    assert all(isinstance(x, float) for x in prob), "calculating implied odds: probability must be numeric"
-    assert all(x > 0 and x < 1 for x in prob), "calculating implied odds: probability must be between 0 and 1"
     assert category in [
         "us",
         "frac",
         "dec",
         "all",
     ], "category must be either: ('us', 'dec', 'frac', 'all')"
-    assert method in [
+    assert all(method in [
         "naive",
         "basic",
         "wpo",
@@ -259,7 +303,8 @@ def implied_odds(
         "additive",
         "shin",
         "balanced_book",
-    ], "method must be either: ('naive', 'basic', 'wpo', 'odds_ratio', 'power', 'additive', 'shin', 'balanced_book')"
+    ] for method in methods), \
+        "method must be either: ('naive', 'basic', 'wpo', 'odds_ratio', 'power', 'additive', 'shin', 'balanced_book')"
     assert isinstance(margin, (int, float)), "calculating implied odds: margin must be numeric"
     assert margin >= 0, "calculating implied odds: margin must be greater than or equal to 0"
     assert (
@@ -268,16 +313,26 @@ def implied_odds(
     assert gross_margin is None or (
         gross_margin >= 0 and gross_margin < 1
     ), "calculating implied odds: gross_margin must be None or between 0 and 1"
-    if len(prob) > 1 and method != "naive":
+
+    devig = any(method != "naive" for method in methods)
+    if total is None and (normalize or (len(prob) > 1 and devig)):
+        import numpy as np
+
+        total = np.sum(prob)
+    if len(prob) > 1 and devig:
         assert (
-            np.sum(prob) >= 1 - margin
+            total >= 1 - margin
         ), "calculating implied odds: sum of probabilities must be greater than or equal to 1 - margin"
 
     if normalize:
-        balanced_prob = [x / np.sum(prob) for x in prob]
+        balanced_prob = [x / total for x in prob]
     else:
         balanced_prob = prob
 
+    return prob, balanced_prob
+
+
+def _method_odds(prob, balanced_prob, category, method, margin, gross_margin):
     mydict = {}
 
     if method == "naive":
@@ -301,7 +356,7 @@ def implied_odds(
         imp_odds = _convert_dec_odds(imp_odds, category, prob)
         return imp_odds
     elif method == "shin":
-        imp_odds, z_value = _implied_shin_odds(balanced_prob, margin, gross_margin)
+        imp_odds, z_value = _implied_shin_odds(balanced_prob)
         mydict["z_value"] = z_value
     elif method == "balanced_book":
         imp_odds, z_value = _implied_balanced_book_odds(
@@ -0,0 +1,370 @@
+# Live re-pricing: parlays subscribed to market odds, repriced leg by leg as the odds move
+
+import itertools
+import math
+import random
+import threading
+import time
+
+import metrics
+from market import Market
+from pricing import DEFAULT_METHODS, devig_market
+from utils import expected_value, kelly_bet
+
+# Largest parlay that can be subscribed to, largest number of subscriptions and markets per hub
+MAX_LIVE_LEGS = 20
+MAX_SUBSCRIPTIONS = 10000
+MAX_MARKETS = 10000
+# Largest number of odds updates accepted by the /api/live/odds endpoint per request
+MAX_LIVE_UPDATES = 1000
+
+
+class Subscription:
+    """
+    One parlay priced live by a LiveHub.
+
+    Each leg is a selection of a market of the hub. The fair odds of every leg are kept per method, so an
+    odds update only replaces the legs on the updated market; the totals are products of the kept values,
+    the same numbers price_parlay gives for the current odds.
+
+    An update only marks the subscription as changed and wakes its reader; the snapshot (totals, EV and
+    Kelly stake) is built when the reader takes it. Nothing is queued: a slow reader skips intermediate
+    prices and always receives the current ones. Updates carry the hub's sequence number, so an update
+    that arrives after a newer one of the same market is dropped.
+
+    Args:
+        subscription_id (int): Id assigned by the hub.
+        legs (list): (market id, selection) of each leg.
+        final_odds (float): Decimal odds offered for the parlay.
+        kelly_budget (float): Kelly bank roll (None for no Kelly stake).
+        kelly_mult (float): Kelly multiplier (None for no Kelly stake).
+        methods (list): Methods of pricing.METHODS to price with.
+    """
+
+    def __init__(self, subscription_id, legs, final_odds, kelly_budget, kelly_mult, methods):
+        self.id = subscription_id
+        self.legs = legs
+        self.final_odds = final_odds
+        self.kelly_budget = kelly_budget
+        self.kelly_mult = kelly_mult
+        self.methods = methods
+
+        self.legs_fair_odds = {method: [None] * len(legs) for method in methods}
+        self.legs_sequence = [0] * len(legs)
+        self.version = 0
+        self.pushed_at = None
+        self.closed = False
+        self._delivered = 0
+        self._ready = threading.Condition()
+
+    def update(self, positions, fair_odds, sequence):
+        """
+        Replaces the fair odds of the legs at positions and wakes the reader of the subscription.
+
+        Args:
+            positions (list): Positions of the legs on the updated market.
+            fair_odds (dict): Fair decimal odds of every outcome of the market, per method.
+            sequence (int): Sequence number of the update in the hub.
+
+        Returns:
+            bool: Whether the update was applied (False when a newer update of the market already was).
+        """
+        with self._ready:
+            if sequence <= self.legs_sequence[positions[0]]:
+                return False
+            self._set_legs(positions, fair_odds, sequence)
+            self._push()
+            return True
+
+    def _set_legs(self, positions, fair_odds, sequence):
+        for method in self.methods:
+            legs_fair_odds = self.legs_fair_odds[method]
+            for position in positions:
+                legs_fair_odds[position] = fair_odds[method][self.legs[position][1]]
+        for position in positions:
+            self.legs_sequence[position] = sequence
+
+    def _push(self):
+        # Called with self._ready held
+        self.version += 1
+        self.pushed_at = time.perf_counter()
+        self._ready.notify_all()
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: Version, per-method leg fair odds, total fair odds, EV% and Kelly stake, and MIN/AVG/MAX
+                EV% and their spread.
+        """
+        methods = {}
+        for method in self.methods:
+            total_fair_odds = math.prod(self.legs_fair_odds[method])
+            kelly = None
+            if self.kelly_budget is not None and self.kelly_mult is not None:
+                kelly = kelly_bet(1 / total_fair_odds, self.final_odds - 1, self.kelly_budget, self.kelly_mult)
+            methods[method] = {
+                "legs_fair_odds": list(self.legs_fair_odds[method]),
+                "total_fair_odds": total_fair_odds,
+                "ev": expected_value(1 / total_fair_odds, self.final_odds),
+                "kelly": kelly,
+            }
+        evs = [result["ev"] for result in methods.values()]
+        return {"id": self.id, "version": self.version, "methods": methods,
+                "min_ev": min(evs), "avg_ev": sum(evs) / len(evs), "max_ev": max(evs), "spread_ev": max(evs) - min(evs)}
+
+    def next_snapshot(self, timeout=None):
+        """
+        Waits for a snapshot not returned yet.
+
+        Args:
+            timeout (float): Seconds to wait (default is None, wait until there is one).
+
+        Returns:
+            dict: The latest snapshot, or None on timeout or once the subscription is closed.
+        """
+        with self._ready:
+            if self._delivered == self.version and not self.closed:
+                self._ready.wait(timeout)
+            if self._delivered == self.version or self.closed:
+                return None
+            self._delivered = self.version
+            return self.snapshot()
+
+    def close(self):
+        with self._ready:
+            self.closed = True
+            self._ready.notify_all()
+
+
+class LiveHub:
+    """
+    Latest odds of live markets and the parlays subscribed to them, in one process.
+
+    publish devigs an updated market with every method in one pass (pricing.devig_market) and reprices only
+    the subscriptions with a leg on it. Once max_markets markets are stored, publishing a new one evicts
+    the least recently updated market without subscribers.
+
+    Args:
+        methods (list): Methods of pricing.METHODS offered to subscriptions (default is
+            pricing.DEFAULT_METHODS).
+        max_subscriptions (int): Largest number of open subscriptions.
+        max_markets (int): Largest number of stored markets.
+    """
+
+    def __init__(self, methods=None, max_subscriptions=MAX_SUBSCRIPTIONS, max_markets=MAX_MARKETS):
+        self.methods = list(DEFAULT_METHODS) if methods is None else list(methods)
+        self.max_subscriptions = max_subscriptions
+        self.max_markets = max_markets
+
+        # market id -> (odds, fair odds of every outcome per method, sequence number of the update), least
+        # recently updated first
+        self._markets = {}
+        self._subscribers = {}  # market id -> {subscription: positions of its legs on the market}
+        self._subscriptions = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.updates = 0
+        self.pushes = 0
+
+    def publish(self, market_id, odds, source="api", received=None):
+        """
+        Stores new odds of a market and reprices the parlays subscribed to it.
+
+        Args:
+            market_id (str): Market id.
+            odds (list): Decimal odds of every outcome of the market.
+            source (str): Where the update comes from, for metrics ('api' or 'simulated').
+            received (float): time.perf_counter() when the update arrived (default is now), the start of
+                the update-to-push latency.
+
+        Returns:
+            int: Number of subscriptions pushed.
+        """
+        received = time.perf_counter() if received is None else received
+        odds = [float(o) for o in odds]
+        if len(odds) < 2 or any(not (o > 1 and math.isfinite(o)) for o in odds):
+            raise ValueError("odds must be a list of at least two finite decimal odds greater than 1")
+
+        market = Market.from_odds(odds)
+        fair_odds = devig_market(market, market.margin, self.methods)
+        with self._lock:
+            previous = self._markets.get(market_id)
+            if previous is not None and len(previous[0]) != len(odds):
+                raise ValueError(f"market {market_id} has {len(previous[0])} outcomes")
+            if previous is not None:
+                # Moved to the end, the most recently updated
+                del self._markets[market_id]
+            elif len(self._markets) >= self.max_markets:
+                self._evict_market()
+            self.updates += 1
+            sequence = self.updates
+            self._markets[market_id] = (odds, fair_odds, sequence)
+            subscribers = list(self._subscribers.get(market_id, {}).items())
+            self.pushes += len(subscribers)
+
+        # Pushed outside the lock: a concurrent publish of the same market may push first, and the
+        # sequence number makes the subscriptions keep the newer odds
+        for subscription, positions in subscribers:
+            if subscription.update(positions, fair_odds, sequence):
+                metrics.LIVE_PUSH_SECONDS.observe(subscription.pushed_at - received)
+        metrics.LIVE_UPDATES.inc(source)
+        return len(subscribers)
+
+    def _evict_market(self):
+        # Called with self._lock held: drops the least recently updated market without subscribers
+        for market_id in self._markets:
+            if market_id not in self._subscribers:
+                del self._markets[market_id]
+                return
+        raise RuntimeError(f"at most {self.max_markets} live markets are stored")
+
+    def subscribe(self, legs, final_odds, kelly_budget=None, kelly_mult=None, methods=None):
+        """
+        Opens a subscription to a parlay of markets already published to the hub.
+
+        Args:
+            legs (list): Market id of each leg, or [market id, selection] to pick an outcome other
+                than the first.
+            final_odds (float): Decimal odds offered for the parlay.
+            kelly_budget (float): Kelly bank roll (default is None, no Kelly stake).
+            kelly_mult (float): Kelly multiplier (default is None, no Kelly stake).
+            methods (list): Methods to price with (default is all methods of the hub).
+
+        Returns:
+            Subscription: The subscription, with its first snapshot ready.
+        """
+        methods = self.methods if methods is None else methods
+        if not methods or any(method not in self.methods for method in methods):
+            raise ValueError(f"methods must be a non-empty subset of {self.methods}")
+        if not isinstance(legs, list) or not 1 <= len(legs) <= MAX_LIVE_LEGS:
+            raise ValueError(f"legs must be a list of 1 to {MAX_LIVE_LEGS} markets")
+        if not final_odds > 1:
+            raise ValueError("final_odds must be decimal odds greater than 1")
+        legs = [(leg, 0) if isinstance(leg, str) else (str(leg[0]), int(leg[1])) for leg in legs]
+
+        with self._lock:
+            if len(self._subscriptions) >= self.max_subscriptions:
+                raise RuntimeError(f"at most {self.max_subscriptions} live subscriptions are open")
+            for market_id, selection in legs:
+                if market_id not in self._markets:
+                    raise ValueError(f"unknown market {market_id}")
+                if not 0 <= selection < len(self._markets[market_id][0]):
+                    raise ValueError(f"market {market_id} has no outcome {selection}")
+
+            subscription = Subscription(next(self._ids), legs, final_odds, kelly_budget, kelly_mult, list(methods))
+            positions = {}
+            for position, (market_id, _) in enumerate(legs):
+                positions.setdefault(market_id, []).append(position)
+            with subscription._ready:
+                for market_id, market_positions in positions.items():
+                    _, fair_odds, sequence = self._markets[market_id]
+                    subscription._set_legs(market_positions, fair_odds, sequence)
+                    self._subscribers.setdefault(market_id, {})[subscription] = market_positions
+                subscription._push()
+            self._subscriptions[subscription.id] = subscription
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.pop(subscription.id, None)
+            for market_id, _ in subscription.legs:
+                subscribers = self._subscribers.get(market_id)
+                if subscribers is not None:
+                    subscribers.pop(subscription, None)
+                    if not subscribers:
+                        del self._subscribers[market_id]
+        subscription.close()
+
+    def market_odds(self, market_id):
+        """
+        Returns:
+            list: The latest decimal odds of a market, or None for an unknown market.
+        """
+        with self._lock:
+            market = self._markets.get(market_id)
+        return None if market is None else list(market[0])
+
+    def stats(self):
+        """
+        Returns:
+            dict: Markets, open subscriptions, updates published and subscriptions pushed.
+        """
+        with self._lock:
+            return {
+                "markets": len(self._markets),
+                "subscriptions": len(self._subscriptions),
+                "updates": self.updates,
+                "pushes": self.pushes,
+            }
+
+
+class SimulatedFeed:
+    """
+    Local odds feed for testing: random walks of the true probabilities of two- and three-way markets,
+    quoted with a 3-7% margin and published to a hub.
+
+    Markets are named f"{prefix}{i}" and all published once on creation.
+
+    Args:
+        hub (LiveHub): Hub to publish to.
+        n_markets (int): Number of markets.
+        interval (float): Seconds between updates when running in the background (see start).
+        volatility (float): Standard deviation of a move of the log odds of one outcome.
+        seed (int): Seed of the random walks.
+        prefix (str): Prefix of the market ids.
+    """
+
+    def __init__(self, hub, n_markets=100, interval=0.1, volatility=0.03, seed=0, prefix="sim-"):
+        self.hub = hub
+        self.interval = interval
+        self.volatility = volatility
+        self.ids = [f"{prefix}{i}" for i in range(n_markets)]
+        self._rng = random.Random(seed)
+        self._stop = threading.Event()
+        self._thread = None
+
+        self._probs = {}
+        self._margins = {}
+        for market_id in self.ids:
+            weights = [self._rng.uniform(0.2, 1) for _ in range(self._rng.choice([2, 2, 3]))]
+            self._probs[market_id] = [w / sum(weights) for w in weights]
+            self._margins[market_id] = self._rng.uniform(0.03, 0.07)
+            hub.publish(market_id, self.quote(market_id), source="simulated")
+
+    def quote(self, market_id):
+        """
+        Returns:
+            list: The decimal odds currently offered on a market (rounded to 2 decimals).
+        """
+        margin = self._margins[market_id]
+        return [max(round(1 / (p * (1 + margin)), 2), 1.01) for p in self._probs[market_id]]
+
+    def tick(self, market_id=None):
+        """
+        Moves the true probabilities of one market (a random one by default) and publishes its new odds.
+
+        Returns:
+            str: Id of the updated market.
+            int: Number of subscriptions pushed.
+        """
+        market_id = self._rng.choice(self.ids) if market_id is None else market_id
+        probs = self._probs[market_id]
+        moved = [p * math.exp(self._rng.gauss(0, self.volatility)) for p in probs]
+        self._probs[market_id] = [min(max(p / sum(moved), 0.02), 0.98) for p in moved]
+        return market_id, self.hub.publish(market_id, self.quote(market_id), source="simulated")
+
+    def start(self):
+        """
+        Publishes an update every interval seconds from a daemon thread, until stop.
+        """
+        def run():
+            while not self._stop.wait(self.interval):
+                self.tick()
+
+        self._thread = threading.Thread(target=run, name="simulated-odds-feed", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
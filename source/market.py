@@ -0,0 +1,71 @@
+# Compact, validated markets that implied_odds devigs without re-validating them
+
+from array import array
+
+
+def probs_key(probs):
+    """
+    Returns:
+        bytes: The probabilities rounded to 12 decimals, packed as doubles (a devig cache key).
+    """
+    return array("d", [round(float(p), 12) for p in probs]).tobytes()
+
+
+class Market:
+    """
+    The implied probabilities of one market, validated once.
+
+    A Market is compact: __slots__, with the probabilities stored as an array of doubles and the devig
+    cache key as bytes. It must not be modified once built. It caches what every devig of the market
+    needs: the probability sum used by normalize=True, the margin (as utils.calculate_margin) and the
+    devig cache key (see probs_key). implied_odds and cached_implied_odds accept a Market in place of a
+    probability list and then skip the per-probability checks, so a leg priced with several methods is
+    validated once.
+
+    Build markets with from_odds or from_probs.
+    """
+
+    __slots__ = ("probs", "total", "margin", "key")
+
+    def __init__(self, probs):
+        assert all(isinstance(x, float) for x in probs), "calculating implied odds: probability must be numeric"
+        assert all(x > 0 and x < 1 for x in probs), "calculating implied odds: probability must be between 0 and 1"
+
+        self.probs = array("d", probs)
+        total = sum(probs)
+        self.margin = total - 1
+        if len(probs) >= 8:
+            import numpy as np
+
+            # The list path of implied_odds normalizes by np.sum, which sums pairwise from 8 values on
+            total = float(np.sum(probs))
+        self.total = total
+        self.key = probs_key(probs)
+
+    @classmethod
+    def from_odds(cls, odds):
+        """
+        Args:
+            odds (list): Decimal odds of the market.
+
+        Returns:
+            Market: The market of the implied probabilities 1 / odds.
+        """
+        return cls([1 / float(o) for o in odds])
+
+    @classmethod
+    def from_probs(cls, probs):
+        """
+        Args:
+            probs (list): Implied probabilities of the market.
+
+        Returns:
+            Market: The market.
+        """
+        return cls(list(probs))
+
+    def __len__(self):
+        return len(self.probs)
+
+    def __repr__(self):
+        return f"Market(probs={self.probs.tolist()})"
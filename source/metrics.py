@@ -0,0 +1,240 @@
+# Process-wide solver and request metrics, exposed in the Prometheus text format by /metrics
+
+import bisect
+import contextlib
+import threading
+import time
+
+# Upper bounds of the histogram buckets
+SECONDS_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+ITERATIONS_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30, 50, 100)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    Monotonic counter, one value per combination of label values.
+
+    Args:
+        name (str): Metric name.
+        documentation (str): HELP text.
+        labels (tuple): Label names.
+    """
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        # acquire/release rather than "with": these run on every solve and the context manager costs more
+        self._lock.acquire()
+        try:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+        finally:
+            self._lock.release()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """
+    Histogram with fixed buckets, one set of buckets per combination of label values.
+
+    Args:
+        name (str): Metric name.
+        documentation (str): HELP text.
+        labels (tuple): Label names.
+        buckets (tuple): Increasing upper bounds of the buckets (+Inf is implied).
+    """
+
+    def __init__(self, name, documentation, labels=(), buckets=SECONDS_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _get(self, label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            # Per-bucket (non-cumulative) counts, with a last bucket for +Inf, and the sum
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0]
+        return series
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        self._lock.acquire()
+        try:
+            series = self._series.get(label_values) or self._get(label_values)
+            series[0][index] += 1
+            series[1] += value
+        finally:
+            self._lock.release()
+
+    def observe_many(self, values, *label_values):
+        """
+        Observes every value of a numpy array at once (e.g. the iterations of a batch solve).
+        """
+        import numpy as np
+
+        values = np.asarray(values, dtype=float).ravel()
+        counts = np.bincount(np.searchsorted(self.buckets, values, side="left"), minlength=len(self.buckets) + 1)
+        with self._lock:
+            series = self._get(label_values)
+            for i, count in enumerate(counts.tolist()):
+                series[0][i] += count
+            series[1] += float(values.sum())
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += count
+                    le = bound if bound == "+Inf" else _format_value(float(bound))
+                    labels = _format_labels(self.labels, label_values, [("le", le)])
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labels, label_values)
+                lines.append(f"{self.name}_sum{labels} {_format_value(float(total))}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+SOLVE_SECONDS = Histogram(
+    "devig_solve_seconds", "Time spent devigging one market with implied_odds.", ("method",))
+SOLVER_ITERATIONS = Histogram(
+    "devig_solver_iterations", "Iterations used by the iterative solvers, per market.", ("method", "path"),
+    buckets=ITERATIONS_BUCKETS)
+SOLVER_NONCONVERGED = Counter(
+    "devig_solver_nonconverged_total", "Markets whose solver stopped without converging.", ("method", "path"))
+BATCH_SECONDS = Histogram(
+    "devig_batch_seconds", "Time spent in one batch_implied_odds call.", ("method",))
+BATCH_MARKETS = Counter(
+    "devig_batch_markets_total", "Markets devigged by batch_implied_odds.", ("method",))
+TABLE_LOOKUPS = Counter(
+    "devig_table_lookups_total", "Two-way markets served by an interpolation table (hit) or the solver (fallback).",
+    ("method", "result"))
+INPUT_ERRORS = Counter(
+    "devig_input_errors_total", "Inputs rejected by validation.", ("source",))
+TIMEOUTS = Counter(
+    "devig_timeouts_total", "Requests that hit DEVIG_REQUEST_TIMEOUT.", ("endpoint",))
+LIVE_UPDATES = Counter(
+    "devig_live_updates_total", "Odds updates published to the live hub.", ("source",))
+LIVE_PUSH_SECONDS = Histogram(
+    "devig_live_push_seconds", "Time from an odds update to the repriced parlay being pushed to a subscriber.")
+CONSENSUS_REFRESH_SECONDS = Histogram(
+    "devig_consensus_refresh_seconds", "Time spent refreshing the multi-book consensus.")
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time spent handling a request.", ("endpoint",))
+REQUESTS = Counter(
+    "http_requests_total", "Requests handled.", ("endpoint", "status"))
+
+REGISTRY = [SOLVE_SECONDS, SOLVER_ITERATIONS, SOLVER_NONCONVERGED, BATCH_SECONDS, BATCH_MARKETS, TABLE_LOOKUPS,
+            INPUT_ERRORS, TIMEOUTS, LIVE_UPDATES, LIVE_PUSH_SECONDS, CONSENSUS_REFRESH_SECONDS, REQUEST_SECONDS,
+            REQUESTS]
+
+
+def observe_solver(method, iterations, converged, path="single"):
+    """
+    Records the iterations and convergence of one solve.
+
+    Args:
+        method (str): implied_odds method name.
+        iterations (int, np.ndarray): Iterations used, one value per market for a batch
+            (None when the solver does not report them).
+        converged (bool, np.ndarray): Whether the solve converged, one value per market for a batch.
+        path (str): 'single' (implied_odds) or 'batch' (batch_implied_odds).
+    """
+    if path == "batch":
+        if iterations is not None:
+            SOLVER_ITERATIONS.observe_many(iterations, method, path)
+        nonconverged = int((~converged).sum())
+    else:
+        if iterations is not None:
+            SOLVER_ITERATIONS.observe(iterations, method, path)
+        nonconverged = 0 if converged else 1
+    if nonconverged:
+        SOLVER_NONCONVERGED.inc(method, path, amount=nonconverged)
+
+
+def render(extra_lines=()):
+    """
+    Returns:
+        str: Every metric of REGISTRY in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    lines.extend(extra_lines)
+    return "\n".join(lines) + "\n"
+
+
+class Profile:
+    """
+    Stage-by-stage timing breakdown of one request, enabled per request (see app.py).
+
+    Stages with the same name are added up, e.g. the devig time of every leg of one method.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self._start = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        """
+        Adds time measured elsewhere to a stage.
+        """
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def as_dict(self):
+        """
+        Returns:
+            dict: Milliseconds spent in each stage, in the order they first ran, and the total.
+        """
+        breakdown = {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()}
+        breakdown["total"] = round((time.perf_counter() - self._start) * 1000, 3)
+        return breakdown
+
+    def server_timing(self):
+        """
+        Returns:
+            str: The breakdown as a Server-Timing header value (shown by browser dev tools).
+        """
+        return ", ".join(f"{name.replace('.', '-')};dur={ms}" for name, ms in self.as_dict().items())
+
+
+def stage(profile, name):
+    """
+    profile.stage(name), or a no-op when profiling is off (profile is None).
+    """
+    return contextlib.nullcontext() if profile is None else profile.stage(name)
@@ -0,0 +1,243 @@
+# Bulk conversion between decimal, US and fractional odds and probabilities
+#
+# Every function takes a list or a numpy array and returns the same kind. Short lists (a market, a
+# parlay) go through plain Python, longer inputs through numpy; both give exactly the same numbers,
+# with Python's rounding (round() to the nearest even integer, round(x, 2) to the nearest decimal).
+# numpy is only imported once a long input needs it, so the page does not load it to format odds.
+
+from fractions import Fraction
+from functools import lru_cache
+
+FORMATS = ["dec", "us", "frac", "prob"]
+
+# Below this many values numpy's per-call overhead outweighs the vectorized arithmetic
+_NUMPY_MIN_SIZE = 16
+
+
+def _as_array(values):
+    """
+    Returns:
+        np.ndarray: The values as an array, or None for a short list to convert in plain Python.
+        bool: Whether the input already was an array.
+    """
+    if isinstance(values, (list, tuple)) and len(values) < _NUMPY_MIN_SIZE:
+        return None, False
+
+    import numpy as np
+
+    if isinstance(values, np.ndarray):
+        return values, True
+    return np.asarray(values, dtype=float), False
+
+
+def round_decimals(values, ndigits):
+    """
+    round(x, ndigits) of every value of a numpy array, with Python's correctly rounded result.
+
+    np.round scales by 10 ** ndigits, which can misround values within an ulp of a tie; those few
+    values are rounded again with round().
+    """
+    import numpy as np
+
+    rounded = np.round(values, ndigits)
+    scaled = values * 10.0 ** ndigits
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    for i in np.flatnonzero(near_tie):
+        rounded.flat[i] = round(float(values.flat[i]), ndigits)
+    return rounded
+
+
+def dec_to_us(odds):
+    """
+    Decimal odds to US odds, rounded to integers.
+
+    Args:
+        odds (list, np.ndarray): Decimal odds.
+
+    Returns:
+        list or np.ndarray: US odds (int).
+    """
+    array, is_array = _as_array(odds)
+    if array is None:
+        return [round((x - 1) * 100 if x >= 2 else -100 / (x - 1)) for x in odds]
+
+    import numpy as np
+
+    if np.any(array == 1):
+        raise ZeroDivisionError("float division by zero")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        us = np.where(array >= 2, (array - 1) * 100, -100 / (array - 1))
+    us = np.rint(us).astype(np.int64)
+    return us if is_array else us.tolist()
+
+
+def prob_to_us(prob, rounded=True):
+    """
+    Probabilities to US odds.
+
+    Args:
+        prob (list, np.ndarray): Probabilities.
+        rounded (bool): Round to integers (default is True).
+
+    Returns:
+        list or np.ndarray: US odds.
+    """
+    array, is_array = _as_array(prob)
+    if array is None:
+        us = [x / (1 - x) * -100 if x > 0.5 else (1 - x) / x * 100 for x in prob]
+        return [round(x) for x in us] if rounded else us
+
+    import numpy as np
+
+    if np.any((array == 0) | (array == 1)):
+        raise ZeroDivisionError("float division by zero")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        us = np.where(array > 0.5, array / (1 - array) * -100, (1 - array) / array * 100)
+    if rounded:
+        us = np.rint(us).astype(np.int64)
+    return us if is_array else us.tolist()
+
+
+@lru_cache(maxsize=65536)
+def _frac(x):
+    fraction = Fraction(x).limit_denominator(100)
+    return str(fraction.numerator) + "/" + str(fraction.denominator)
+
+
+def dec_to_frac(odds):
+    """
+    Decimal odds to fractional odds, the closest fraction with a denominator of at most 100.
+
+    Fractions are computed once per distinct value and cached, so large exports (where odds repeat
+    a lot) cost one Fraction per distinct price.
+
+    Args:
+        odds (list, np.ndarray): Decimal odds.
+
+    Returns:
+        list or np.ndarray: Fractional odds, e.g. "5/2" (an object array for array input).
+    """
+    array, is_array = _as_array(odds)
+    if array is None:
+        return [_frac(x - 1) for x in odds]
+
+    import numpy as np
+
+    unique, inverse = np.unique(array - 1, return_inverse=True)
+    fracs = np.array([_frac(x) for x in unique.tolist()], dtype=object)[inverse.reshape(array.shape)]
+    return fracs if is_array else fracs.tolist()
+
+
+def prob_to_frac(prob):
+    """
+    Probabilities to fractional odds (1 / prob - 1, denominator of at most 100).
+    """
+    array, is_array = _as_array(prob)
+    if array is None:
+        return [_frac((1.0 / x) - 1.0) for x in prob]
+
+    import numpy as np
+
+    unique, inverse = np.unique((1.0 / array) - 1.0, return_inverse=True)
+    fracs = np.array([_frac(x) for x in unique.tolist()], dtype=object)[inverse.reshape(array.shape)]
+    return fracs if is_array else fracs.tolist()
+
+
+def prob_to_dec(prob, ndigits=None):
+    """
+    Probabilities to decimal odds.
+
+    Args:
+        prob (list, np.ndarray): Probabilities.
+        ndigits (int): Round to this many decimals like round() (default is None, no rounding).
+
+    Returns:
+        list or np.ndarray: Decimal odds.
+    """
+    array, is_array = _as_array(prob)
+    if array is None:
+        return [1 / x if ndigits is None else round(1 / x, ndigits) for x in prob]
+
+    dec = 1 / array
+    if ndigits is not None:
+        dec = round_decimals(dec, ndigits)
+    return dec if is_array else dec.tolist()
+
+
+def us_to_dec(odds):
+    """
+    US odds to decimal odds.
+
+    Args:
+        odds (list, np.ndarray): US odds (at least 100 or at most -100).
+
+    Returns:
+        list or np.ndarray: Decimal odds.
+    """
+    array, is_array = _as_array(odds)
+    if array is None:
+        return [1 + x / 100 if x > 0 else 1 + 100 / -x for x in odds]
+
+    import numpy as np
+
+    with np.errstate(divide="ignore"):
+        dec = np.where(array > 0, 1 + array / 100, 1 + 100 / -array)
+    return dec if is_array else dec.tolist()
+
+
+def frac_to_dec(odds):
+    """
+    Fractional odds ("5/2", or a plain number) to decimal odds.
+    """
+    dec = []
+    for x in odds:
+        numerator, _, denominator = str(x).partition("/")
+        dec.append(1 + float(numerator) / float(denominator or 1))
+    if isinstance(odds, (list, tuple)):
+        return dec
+
+    import numpy as np
+
+    return np.array(dec)
+
+
+def convert(values, from_format, to_format):
+    """
+    Converts odds or probabilities between FORMATS, through decimal odds.
+
+    Args:
+        values (list, np.ndarray): Odds or probabilities.
+        from_format (str): One of FORMATS.
+        to_format (str): One of FORMATS.
+
+    Returns:
+        list or np.ndarray: The converted values.
+    """
+    assert from_format in FORMATS and to_format in FORMATS, f"formats must be in {FORMATS}"
+    if from_format == to_format:
+        return values
+
+    if from_format == "prob":
+        if to_format == "us":
+            return prob_to_us(values)
+        if to_format == "frac":
+            return prob_to_frac(values)
+        return prob_to_dec(values)
+
+    if from_format == "us":
+        dec = us_to_dec(values)
+    elif from_format == "frac":
+        dec = frac_to_dec(values)
+    else:
+        dec = values
+
+    if to_format == "us":
+        return dec_to_us(dec)
+    if to_format == "frac":
+        return dec_to_frac(dec)
+    if to_format == "prob":
+        array, is_array = _as_array(dec)
+        if array is None:
+            return [1 / x for x in dec]
+        return 1 / array if is_array else (1 / array).tolist()
+    return dec
@@ -0,0 +1,296 @@
+# One-pass parser of pasted parlay slips in decimal, US or fractional odds
+#
+# A slip is legs separated by commas, semicolons or new lines. The odds of a leg (the parlay's selection
+# first) are separated by "/", "|" or spaces: "1.91/1.95", "-110/+105", "5/2 4/7". Fractional odds write
+# the fraction with "/", so the outcomes of a fractional leg are separated by "|" or spaces.
+# numpy is imported by the first parse, not when the app imports the parser.
+
+from dataclasses import dataclass, field
+import re
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import numpy as np
+
+ODDS_FORMATS = ["auto", "dec", "us", "frac"]
+# Leg errors listed by error_message; the others are only counted
+MAX_LISTED_ERRORS = 10
+
+_LEG = re.compile(r"[^,;\n]+")
+# Odds of a leg split at "/", or only at "|" and spaces in fractional legs
+_SLASH_TOKEN = re.compile(r"[^\s/|]+")
+_SPACED_TOKEN = re.compile(r"[^\s|]+")
+# Auto-detected fractional leg: a "/" and two odds separated by "|" or spaces alone
+_SPACED_ODDS = re.compile(r"[^\s/|][\s|]+[^\s/|]")
+# A slip of decimal or US odds separated by "/" alone, checked in one match before the per-leg parse
+_NUMBER = r"[+-]?(?:\d+\.?\d*|\.\d+)"
+_PLAIN_LEG = rf"[ \t\r]*{_NUMBER}(?:[ \t\r]*/[ \t\r]*{_NUMBER})+[ \t\r]*"
+_PLAIN_SLIP = re.compile(rf"[\s,;]*(?:{_PLAIN_LEG}(?:[,;\n][\s,;]*|$))*")
+_PLAIN_VALUE = re.compile(_NUMBER)
+_VALUE = re.compile(r"(?P<sign>[+-])?(?P<num>\d+\.?\d*|\.\d+)(?:/(?P<den>\d+\.?\d*|\.\d+))?|(?P<evens>evs|evens|ev)",
+                    re.IGNORECASE)
+
+_DEC, _US, _FRAC = range(3)
+_FORMAT_CODES = {"dec": _DEC, "us": _US, "frac": _FRAC}
+_FORMAT_NAMES = ["dec", "us", "frac"]
+_RANGE_ERRORS = ["decimal odds must be greater than 1", "US odds must be at least 100 or at most -100",
+                 "fractional odds must be greater than 0"]
+
+
+class SlipError(ValueError):
+    """
+    Raised by ParsedSlip.check when legs of a slip did not parse; errors holds all of them.
+    """
+
+    def __init__(self, message, errors):
+        super().__init__(message)
+        self.errors = errors
+
+
+@dataclass
+class ParsedSlip:
+    """
+    The legs of a slip as decimal odds, and the errors of the legs that did not parse.
+
+    odds holds one row per leg that parsed (NaN after its last outcome), in slip order; leg_numbers
+    maps each row back to its leg in the paste.
+    """
+
+    odds: "np.ndarray"
+    counts: "np.ndarray"
+    leg_numbers: list
+    formats: list
+    errors: list = field(default_factory=list)
+    legs_total: int = 0
+
+    def legs(self):
+        """
+        Returns:
+            list: The decimal odds of each leg that parsed, as price_parlay takes them.
+        """
+        return [row[:n] for row, n in zip(self.odds.tolist(), self.counts.tolist())]
+
+    def error_message(self):
+        """
+        Returns:
+            str: One line per leg error (the first MAX_LISTED_ERRORS), e.g.
+                "Leg 3, character 18: '2.5x' is not decimal, US or fractional odds".
+        """
+        lines = [f"Leg {e['leg']}, character {e['position'] + 1}: {e['error']}" for e in self.errors[:MAX_LISTED_ERRORS]]
+        if len(self.errors) > MAX_LISTED_ERRORS:
+            lines.append(f"... and {len(self.errors) - MAX_LISTED_ERRORS} more")
+        return "\n".join(lines)
+
+    def check(self):
+        """
+        Raises SlipError when any leg did not parse.
+        """
+        if self.errors:
+            raise SlipError(self.error_message(), self.errors)
+
+
+def _check_format(odds_format):
+    if odds_format not in ODDS_FORMATS:
+        raise ValueError(f"odds format must be one of {ODDS_FORMATS}")
+
+
+def _token_format(match, leg_format):
+    # Format code of one odds value, or an error message
+    if match["evens"]:
+        return _FRAC
+    if leg_format is None:
+        return _FRAC if match["den"] else _US if match["sign"] else _DEC
+    if match["den"] and leg_format != _FRAC:
+        return f"fractional odds in a {['decimal', 'US'][leg_format]} leg"
+    if match["sign"] and leg_format != _US:
+        return "only US odds have a sign"
+    return leg_format
+
+
+def _to_decimal(codes, signs, nums, dens):
+    # Decimal odds of every value at once: numerators, denominators and signs arrive as strings
+    import numpy as np
+
+    codes = np.asarray(codes)
+    values = np.array(nums, dtype=float)
+    denominators = 1 if dens is None else np.array(dens, dtype=float)
+    us = np.where(np.array(signs) == "-", -values, values)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.select(
+            [codes == _DEC, codes == _FRAC, us >= 100, us <= -100],
+            [values, 1 + values / denominators, 1 + us / 100, 1 + 100 / -us],
+            np.nan,
+        )
+
+
+def _pad(decimal, counts):
+    # One row of odds per leg, NaN after its last outcome
+    import numpy as np
+
+    token_legs = np.repeat(np.arange(len(counts)), counts)
+    slots = np.arange(len(token_legs)) - np.repeat(np.cumsum(counts) - counts, counts)
+    odds = np.full((len(counts), counts.max(initial=0)), np.nan)
+    odds[token_legs, slots] = decimal
+    return odds
+
+
+def _parse_plain(text, fixed_format):
+    """
+    The common slip of decimal or US odds separated by "/" without a regex match per value: one match
+    checks the slip, one findall reads every value.
+
+    Returns:
+        ParsedSlip: The slip, or None when it is not a plain slip or has errors (the per-leg parse then
+            reports them with their positions).
+    """
+    import numpy as np
+
+    if fixed_format == _FRAC or _PLAIN_SLIP.fullmatch(text) is None:
+        return None
+    values = np.array(_PLAIN_VALUE.findall(text), dtype=str)
+    # The first character of each value is its sign, if any
+    signed = np.isin(values.astype("U1"), ["+", "-"])
+    if fixed_format == _DEC and signed.any():
+        return None
+    codes = np.full(len(values), _US) if fixed_format == _US else np.where(signed, _US, _DEC)
+    counts = np.array([leg.count("/") + 1 for leg in _LEG.findall(text) if leg.strip()], dtype=np.int64)
+
+    # numpy reads the sign of "-110" itself, so no signs are passed on
+    decimal = _to_decimal(codes, "", values, None)
+    odds = _pad(decimal, counts)
+    with np.errstate(divide="ignore"):
+        if not (decimal > 1).all() or (np.nansum(1 / odds, axis=1) < 1).any():
+            return None
+    first = np.cumsum(counts) - counts
+    mixed = np.minimum.reduceat(codes, first) != np.maximum.reduceat(codes, first) if len(counts) else []
+    return ParsedSlip(
+        odds=odds,
+        counts=counts,
+        leg_numbers=list(range(1, len(counts) + 1)),
+        formats=["mixed" if m else _FORMAT_NAMES[c] for m, c in zip(np.asarray(mixed).tolist(), codes[first].tolist())],
+        legs_total=len(counts),
+    )
+
+
+def parse_slip(text, odds_format="auto"):
+    """
+    Parses a pasted slip in one pass: every leg is tokenized, then all odds are converted to decimal
+    odds and validated at once. A slip of decimal or US odds separated by "/" is read without
+    tokenizing legs, and only parsed leg by leg when it has errors.
+
+    Args:
+        text (str): The slip, see the module header.
+        odds_format (str): One of ODDS_FORMATS (default is 'auto'). 'auto' reads signed odds as US odds,
+            fractions and evens ("evs") as fractional odds and the others as decimal odds; a leg with a
+            "/" whose outcomes are separated by "|" or spaces is fractional, so "5/2 4/7" is two
+            fractions and "5/2" two decimal odds.
+
+    Returns:
+        ParsedSlip: The legs that parsed, and an error for every leg that did not: {"leg": leg number,
+            "position": offset of the leg or the bad odds in text, "token": the text at fault, "error"}.
+    """
+    import numpy as np
+
+    _check_format(odds_format)
+    fixed_format = None if odds_format == "auto" else _FORMAT_CODES[odds_format]
+    slip = _parse_plain(text, fixed_format)
+    if slip is not None:
+        return slip
+
+    errors = []
+    leg_numbers, leg_positions, leg_texts, leg_formats = [], [], [], []
+    codes, signs, nums, dens, token_legs, token_positions, token_texts = [], [], [], [], [], [], []
+    leg_number = 0
+    for leg in _LEG.finditer(text):
+        leg_text = leg[0]
+        if not leg_text.strip():
+            continue
+        leg_number += 1
+        start = leg.start()
+        fractional = fixed_format == _FRAC or (fixed_format is None and "/" in leg_text
+                                               and _SPACED_ODDS.search(leg_text) is not None)
+        leg_format = _FRAC if fractional else fixed_format
+
+        tokens = []
+        for token in (_SPACED_TOKEN if fractional else _SLASH_TOKEN).finditer(leg_text):
+            match = _VALUE.fullmatch(token[0])
+            code = "is not decimal, US or fractional odds" if match is None else _token_format(match, leg_format)
+            if isinstance(code, str):
+                errors.append({"leg": leg_number, "position": start + token.start(), "token": token[0],
+                               "error": f"'{token[0]}' {code}" if match is None else f"'{token[0]}': {code}"})
+                break
+            tokens.append((code, match, start + token.start(), token[0]))
+        else:
+            if len(tokens) < 2:
+                errors.append({"leg": leg_number, "position": start + len(leg_text) - len(leg_text.lstrip()),
+                               "token": leg_text.strip(), "error": "a leg needs at least two odds"})
+                continue
+            row = len(leg_numbers)
+            leg_numbers.append(leg_number)
+            leg_positions.append(start + len(leg_text) - len(leg_text.lstrip()))
+            leg_texts.append(leg_text.strip())
+            leg_formats.append({code for code, *_ in tokens})
+            for code, match, position, token_text in tokens:
+                codes.append(code)
+                signs.append(match["sign"] or "")
+                nums.append(match["num"] or "1")
+                dens.append(match["den"] or "1")
+                token_legs.append(row)
+                token_positions.append(position)
+                token_texts.append(token_text)
+
+    # "ev" and "evens" are 1/1: their numerator and denominator default to "1"
+    counts = np.bincount(token_legs, minlength=len(leg_numbers))
+    decimal = _to_decimal(np.array(codes, dtype=np.int64), signs, nums, dens)
+    odds = _pad(decimal, counts)
+
+    # Values that are no odds (US odds between -100 and 100, decimal odds or fractions of at most 1),
+    # then legs whose odds leave no margin; each leg reports its first error
+    bad = np.zeros(len(leg_numbers), dtype=bool)
+    for i in np.flatnonzero(~(decimal > 1)).tolist():
+        if bad[token_legs[i]]:
+            continue
+        bad[token_legs[i]] = True
+        errors.append({"leg": leg_numbers[token_legs[i]], "position": token_positions[i], "token": token_texts[i],
+                       "error": f"'{token_texts[i]}': {_RANGE_ERRORS[codes[i]]}"})
+    with np.errstate(divide="ignore"):
+        no_margin = ~bad & (np.nansum(1 / odds, axis=1) < 1)
+    for row in np.flatnonzero(no_margin).tolist():
+        errors.append({"leg": leg_numbers[row], "position": leg_positions[row], "token": leg_texts[row],
+                       "error": "odds must include a margin (implied probabilities summing to at least 1)"})
+
+    keep = ~(bad | no_margin)
+    errors.sort(key=lambda e: e["leg"])
+    return ParsedSlip(
+        odds=odds[keep],
+        counts=counts[keep],
+        leg_numbers=[n for n, k in zip(leg_numbers, keep.tolist()) if k],
+        formats=[_FORMAT_NAMES[min(f)] if len(f) == 1 else "mixed" for f, k in zip(leg_formats, keep.tolist()) if k],
+        errors=errors,
+        legs_total=leg_number,
+    )
+
+
+def parse_price(text, odds_format="auto"):
+    """
+    Parses a single price, e.g. the odds offered for a parlay: "3.5", "+250" or "5/2".
+
+    Args:
+        text (str): The price.
+        odds_format (str): One of ODDS_FORMATS (default is 'auto'; a fraction is fractional odds).
+
+    Returns:
+        float: Decimal odds.
+    """
+    _check_format(odds_format)
+    match = _VALUE.fullmatch(text.strip())
+    if match is None:
+        raise ValueError(f"'{text.strip()}' is not decimal, US or fractional odds")
+    code = _token_format(match, None if odds_format == "auto" else _FORMAT_CODES[odds_format])
+    if isinstance(code, str):
+        raise ValueError(f"'{text.strip()}': {code}")
+    decimal = float(_to_decimal([code], [match["sign"] or ""], [match["num"] or "1"],
+                                [match["den"] or "1"])[0])
+    if not decimal > 1:
+        raise ValueError(f"'{text.strip()}': {_RANGE_ERRORS[code]}")
+    return decimal
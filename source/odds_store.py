@@ -0,0 +1,447 @@
+# Append-only columnar store of historical odds snapshots, read through memory maps
+#
+# Usage:
+#   python source/odds_store.py stats history/
+#
+# A store is a directory of little-endian column files (one value per row), the names behind the ids
+# and a small index, committed by rewriting meta.json:
+#   timestamp.f8 (seconds since the epoch), event.u4, market.u4, outcome.u2, book.u2, odds.f4 (decimal)
+#   events.jsonl, markets.jsonl, outcomes.jsonl, books.jsonl: one JSON string per id
+#   blocks.f8: first and last timestamp of every BLOCK_ROWS rows
+#   event_blocks.u4: (event id, block) pairs, the blocks each event has rows in
+
+import argparse
+import json
+import mmap
+import os
+import sys
+
+import numpy as np
+
+from batch_implied_odds import batch_implied_odds
+from pricing import METHODS
+
+_VERSION = 1
+BLOCK_ROWS = 65536
+
+COLUMNS = {
+    "timestamp": "<f8",
+    "event": "<u4",
+    "market": "<u4",
+    "outcome": "<u2",
+    "book": "<u2",
+    "odds": "<f4",
+}
+# Columns holding ids of names, and the largest id each can hold
+NAME_COLUMNS = {"event": 2 ** 32 - 1, "market": 2 ** 32 - 1, "outcome": 2 ** 16 - 1, "book": 2 ** 16 - 1}
+
+# Rows returned per chunk by scan (about 24 MB of columns)
+DEFAULT_CHUNK_ROWS = 1000000
+
+
+def _plural(column):
+    return f"{column}s"
+
+
+class OddsStore:
+    """
+    Odds snapshots, one row per outcome quoted: (timestamp, event, market, outcome, book, decimal odds).
+
+    Rows are appended one line at a time (every outcome of one book's market at one timestamp, in
+    consecutive rows) and never modified. Appends write the columns, then commit the new row count to
+    meta.json, so readers (in this process or another) only see complete appends and an interrupted
+    append is discarded by the next one.
+
+    Readers memory-map the columns: scans hand out views of the mapped pages, so a full scan of a store
+    larger than memory streams it from disk. The block index restricts time range and event queries to
+    the blocks that can match.
+
+    Args:
+        path (str): Directory of the store (created when it does not exist).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        if not os.path.exists(self._file("meta.json")):
+            self._write_meta({"version": _VERSION, "rows": 0, "event_blocks": 0,
+                              "names": {_plural(c): 0 for c in NAME_COLUMNS},
+                              "name_bytes": {_plural(c): 0 for c in NAME_COLUMNS}})
+        self._meta = self._read_meta()
+        self._names = {column: None for column in NAME_COLUMNS}
+        self._ids = {column: None for column in NAME_COLUMNS}
+        self._mapped_rows = None
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _read_meta(self):
+        with open(self._file("meta.json")) as f:
+            meta = json.load(f)
+        if meta.get("version") != _VERSION:
+            raise ValueError(f"{self.path} is not an odds store (version {_VERSION})")
+        return meta
+
+    def _write_meta(self, meta):
+        # Atomic commit: readers see the old or the new meta.json, never a partial one
+        temporary = self._file("meta.json.tmp")
+        with open(temporary, "w") as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self._file("meta.json"))
+
+    @property
+    def rows(self):
+        return self._meta["rows"]
+
+    def reload(self):
+        """
+        Picks up appends committed by other processes since the store was opened.
+        """
+        self._meta = self._read_meta()
+
+    def _load_names(self, column):
+        # Names of the ids of a column, as committed
+        if self._names[column] is None or len(self._names[column]) < self._meta["names"][_plural(column)]:
+            names = []
+            path = self._file(f"{_plural(column)}.jsonl")
+            if os.path.exists(path):
+                with open(path) as f:
+                    names = [json.loads(line) for _, line in zip(range(self._meta["names"][_plural(column)]), f)]
+            self._names[column] = names
+            self._ids[column] = {name: i for i, name in enumerate(names)}
+        return self._names[column]
+
+    def names(self, column, ids):
+        """
+        Returns:
+            list: The names of the ids of a name column (event, market, outcome or book).
+        """
+        names = self._load_names(column)
+        return [names[i] for i in np.asarray(ids).tolist()]
+
+    def ids(self, column, names):
+        """
+        Returns:
+            np.ndarray: The ids of names of a name column, -1 for names never stored.
+        """
+        self._load_names(column)
+        return np.array([self._ids[column].get(str(name), -1) for name in names], dtype=np.int64)
+
+    def _encode(self, column, values):
+        """
+        Ids of the names of one appended column, assigning new ids to new names.
+
+        Rows of one line repeat its event, market and book, so each run of equal names is looked up once.
+
+        Returns:
+            np.ndarray: Ids of the values.
+            list: The new names, in id order.
+        """
+        self._load_names(column)
+        values = np.asarray(values)
+        starts = np.flatnonzero(np.concatenate(([True], values[1:] != values[:-1])))
+        known = self._ids[column]
+        first_id = len(self._names[column])
+        added = {}
+        codes = []
+        for name in values[starts].tolist():
+            name = str(name)
+            code = known.get(name)
+            if code is None:
+                code = added.get(name)
+                if code is None:
+                    code = added[name] = first_id + len(added)
+            codes.append(code)
+        if first_id + len(added) > NAME_COLUMNS[column] + 1:
+            raise ValueError(f"at most {NAME_COLUMNS[column] + 1} {_plural(column)} can be stored")
+        return np.repeat(np.array(codes, dtype=np.int64), np.diff(np.append(starts, len(values)))), list(added)
+
+    def append(self, timestamp, event, market, outcome, book, odds):
+        """
+        Appends rows, given as columns of equal length (names as strings).
+
+        The rows of one line (every outcome of one book's market at one timestamp) must be consecutive;
+        scans and lines rely on it. Timestamps need not be sorted, but the time index is most selective
+        when they are.
+
+        Args:
+            timestamp (list, np.ndarray): Seconds since the epoch.
+            event, market, outcome, book (list, np.ndarray): Names.
+            odds (list, np.ndarray): Decimal odds, greater than 1 (stored as 32-bit floats).
+
+        Returns:
+            int: Number of rows in the store.
+        """
+        timestamp = np.asarray(timestamp, dtype=float)
+        odds = np.asarray(odds, dtype=float)
+        n = len(timestamp)
+        if any(len(column) != n for column in (event, market, outcome, book, odds)):
+            raise ValueError("columns must have the same length")
+        if not np.all(np.isfinite(timestamp)):
+            raise ValueError("timestamps must be finite")
+        if not np.all(odds > 1):
+            raise ValueError("decimal odds must be greater than 1")
+        if not n:
+            return self.rows
+
+        self.reload()
+        meta = self._meta
+        columns = {"timestamp": timestamp.astype("<f8"), "odds": odds.astype("<f4")}
+        new_names = {}
+        for column, values in (("event", event), ("market", market), ("outcome", outcome), ("book", book)):
+            codes, new_names[column] = self._encode(column, values)
+            columns[column] = codes.astype(COLUMNS[column])
+
+        rows = meta["rows"]
+        for column, dtype in COLUMNS.items():
+            self._append_file(f"{column}.{dtype[1:]}", columns[column], rows * np.dtype(dtype).itemsize)
+        name_bytes = {}
+        for column, names in new_names.items():
+            encoded = "".join(json.dumps(name) + "\n" for name in names).encode()
+            committed = meta["name_bytes"][_plural(column)]
+            self._append_file(f"{_plural(column)}.jsonl", np.frombuffer(encoded, dtype=np.uint8), committed)
+            name_bytes[_plural(column)] = committed + len(encoded)
+
+        # Index: time range of every block touched, (event, block) pairs of the new rows
+        first_block = rows // BLOCK_ROWS
+        block_of_row = (rows + np.arange(n)) // BLOCK_ROWS
+        block_starts = np.concatenate(([0], np.flatnonzero(np.diff(block_of_row)) + 1))
+        bounds = np.stack([np.minimum.reduceat(timestamp, block_starts),
+                           np.maximum.reduceat(timestamp, block_starts)], axis=1)
+        blocks_path = self._file("blocks.f8")
+        if rows % BLOCK_ROWS:
+            # The first block was partly filled by previous appends: widen its range
+            previous = np.fromfile(blocks_path, dtype="<f8", count=2, offset=first_block * 16)
+            bounds[0] = min(bounds[0, 0], previous[0]), max(bounds[0, 1], previous[1])
+        self._write_at(blocks_path, bounds.astype("<f8"), first_block * 16)
+
+        keys = np.unique(block_of_row << 32 | columns["event"].astype(np.int64))
+        pairs = np.stack([keys & 0xFFFFFFFF, keys >> 32], axis=1)
+        self._append_file("event_blocks.u4", pairs.astype("<u4"), meta["event_blocks"] * 8)
+
+        names = {_plural(column): meta["names"][_plural(column)] + len(new_names[column]) for column in NAME_COLUMNS}
+        self._meta = {"version": _VERSION, "rows": rows + n, "event_blocks": meta["event_blocks"] + len(pairs),
+                      "names": names, "name_bytes": name_bytes}
+        self._write_meta(self._meta)
+        for column, new in new_names.items():
+            ids = self._ids[column]
+            for name in new:
+                ids[name] = len(self._names[column])
+                self._names[column].append(name)
+        return self.rows
+
+    def append_lines(self, lines):
+        """
+        Appends lines as in book_consensus.BookConsensus.ingest, with a "timestamp" each.
+
+        Args:
+            lines (list): {"timestamp": float, "book": str, "event": str, "market": str,
+                "odds": [odds, ...], "outcomes": [name, ...] (optional, default "0", "1", ...)}.
+
+        Returns:
+            int: Number of rows in the store.
+        """
+        columns = {column: [] for column in COLUMNS}
+        for line in lines:
+            odds = [float(o) for o in line["odds"]]
+            outcomes = line.get("outcomes") or [str(i) for i in range(len(odds))]
+            if len(outcomes) != len(odds):
+                raise ValueError("outcomes must name each of the odds once")
+            columns["timestamp"].extend([float(line["timestamp"])] * len(odds))
+            for column in ("event", "market", "book"):
+                columns[column].extend([str(line[column])] * len(odds))
+            columns["outcome"].extend(str(o) for o in outcomes)
+            columns["odds"].extend(odds)
+        return self.append(**columns)
+
+    def _append_file(self, name, values, committed_size):
+        # Drops whatever an interrupted append left after the committed data, then appends
+        path = self._file(name)
+        with open(path, "ab") as f:
+            f.truncate(committed_size)
+            f.write(values.tobytes())
+
+    def _write_at(self, path, values, offset):
+        with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+            f.truncate(offset)
+            f.seek(offset)
+            f.write(values.tobytes())
+
+    def _map(self, name, dtype, count):
+        # Read-only numpy view of the first count values of a file (empty files cannot be mapped)
+        if not count:
+            return np.empty(0, dtype=dtype)
+        with open(self._file(name), "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # The array keeps the map open
+        return np.frombuffer(mapped, dtype=dtype, count=count)
+
+    def columns(self):
+        """
+        Returns:
+            dict: Read-only memory-mapped view of every column, one value per committed row.
+        """
+        if self._mapped_rows != self.rows:
+            rows = self.rows
+            n_blocks = (rows + BLOCK_ROWS - 1) // BLOCK_ROWS
+            self._columns = {column: self._map(f"{column}.{dtype[1:]}", dtype, rows) for column, dtype in COLUMNS.items()}
+            self._blocks = self._map("blocks.f8", "<f8", 2 * n_blocks).reshape(n_blocks, 2)
+            self._event_blocks = self._map("event_blocks.u4", "<u4", 2 * self._meta["event_blocks"]).reshape(-1, 2)
+            self._mapped_rows = rows
+        return self._columns
+
+    def _selected_blocks(self, start, end, events):
+        # Blocks that can hold rows in [start, end) of the given event ids
+        self.columns()
+        selected = np.ones(len(self._blocks), dtype=bool)
+        if start is not None:
+            selected &= self._blocks[:, 1] >= start
+        if end is not None:
+            selected &= self._blocks[:, 0] < end
+        if events is not None:
+            with_events = np.zeros(len(self._blocks), dtype=bool)
+            with_events[self._event_blocks[np.isin(self._event_blocks[:, 0], events), 1]] = True
+            selected &= with_events
+        return np.flatnonzero(selected)
+
+    def scan(self, start=None, end=None, events=None, markets=None, books=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+        """
+        Reads the rows in a time range, optionally of some events, markets and books, in chunks.
+
+        Without filters chunks are views of the mapped columns (nothing is copied); with filters they hold
+        the matching rows of the blocks that can match. Lines are never split across chunks.
+
+        Args:
+            start (float): First timestamp included (default is None, from the first row).
+            end (float): First timestamp excluded (default is None, to the last row).
+            events, markets, books (list): Names to keep (default is None, all).
+            chunk_rows (int): Rows read at once (rounded to whole blocks).
+
+        Yields:
+            dict: Columns of the matching rows of one chunk, ids for the name columns (see names).
+        """
+        columns = self.columns()
+        event_ids = None if events is None else self.ids("event", events)
+        market_ids = None if markets is None else self.ids("market", markets)
+        book_ids = None if books is None else self.ids("book", books)
+        blocks = self._selected_blocks(start, end, event_ids)
+        filtered = any(x is not None for x in (start, end, events, markets, books))
+        blocks_per_chunk = max(chunk_rows // BLOCK_ROWS, 1)
+
+        # Consecutive selected blocks are read together
+        carry = None
+        i = 0
+        while i < len(blocks):
+            j = i + 1
+            while j < len(blocks) and j - i < blocks_per_chunk and blocks[j] == blocks[j - 1] + 1:
+                j += 1
+            first, last = blocks[i] * BLOCK_ROWS, min((blocks[j - 1] + 1) * BLOCK_ROWS, self.rows)
+            chunk = {column: values[first:last] for column, values in columns.items()}
+            if filtered:
+                keep = np.ones(last - first, dtype=bool)
+                if start is not None:
+                    keep &= chunk["timestamp"] >= start
+                if end is not None:
+                    keep &= chunk["timestamp"] < end
+                for column, ids in (("event", event_ids), ("market", market_ids), ("book", book_ids)):
+                    if ids is not None:
+                        keep &= np.isin(chunk[column], ids)
+                chunk = {column: values[keep] for column, values in chunk.items()}
+            i = j
+
+            # Hold back the last line of the chunk, it may continue in the next one
+            if carry is not None:
+                chunk = {column: np.concatenate([carry[column], values]) for column, values in chunk.items()}
+            if i < len(blocks) and len(chunk["timestamp"]):
+                cut = _line_starts(chunk)[-1]
+                carry = {column: values[cut:] for column, values in chunk.items()}
+                chunk = {column: values[:cut] for column, values in chunk.items()}
+            else:
+                carry = None
+            if len(chunk["timestamp"]):
+                yield chunk
+
+    def lines(self, method="mult", start=None, end=None, events=None, markets=None, books=None,
+              chunk_rows=DEFAULT_CHUNK_ROWS):
+        """
+        Devigs every line of a scan with one of pricing.METHODS, a batch_implied_odds call per chunk.
+
+        Args:
+            method (str): Devig method.
+            start, end, events, markets, books, chunk_rows: as in scan.
+
+        Yields:
+            dict: Per line of one chunk: "timestamp", "event", "market", "book" (ids), and padded
+                "outcome" ids (-1 in padding), "odds" and "fair_odds" (NaN in padding, and for lines without
+                a margin).
+        """
+        assert method in METHODS, f"method must be one of {list(METHODS)}"
+        for chunk in self.scan(start, end, events, markets, books, chunk_rows):
+            starts = _line_starts(chunk)
+            counts = np.diff(np.append(starts, len(chunk["timestamp"])))
+            line = np.repeat(np.arange(len(starts)), counts)
+            position = np.arange(len(line)) - starts[line]
+
+            odds = np.full((len(starts), counts.max()), np.nan)
+            odds[line, position] = chunk["odds"]
+            outcome = np.full(odds.shape, -1, dtype=np.int64)
+            outcome[line, position] = chunk["outcome"]
+            probs = 1 / odds
+            margins = np.nansum(probs, axis=1) - 1
+            # Lines without a margin (or a single outcome) cannot be devigged
+            valid = (margins >= 0) & (counts >= 2)
+            fair_odds = np.full(odds.shape, np.nan)
+            if valid.any():
+                fair_odds[valid] = batch_implied_odds(probs[valid], method=METHODS[method], margin=margins[valid],
+                                                      normalize=False)["implied_odds"]
+
+            yield {
+                "timestamp": chunk["timestamp"][starts],
+                "event": chunk["event"][starts],
+                "market": chunk["market"][starts],
+                "book": chunk["book"][starts],
+                "outcome": outcome,
+                "odds": odds,
+                "fair_odds": fair_odds,
+            }
+
+    def stats(self):
+        """
+        Returns:
+            dict: Rows, blocks, names of each column and size on disk in bytes.
+        """
+        size = sum(os.path.getsize(self._file(name)) for name in os.listdir(self.path))
+        stats = {"rows": self.rows, "blocks": (self.rows + BLOCK_ROWS - 1) // BLOCK_ROWS, "bytes": size}
+        stats.update(self._meta["names"])
+        return stats
+
+
+def _line_starts(chunk):
+    # First row of every line: where the timestamp, event, market or book changes
+    n = len(chunk["timestamp"])
+    starts = np.ones(n, dtype=bool)
+    for column in ("timestamp", "event", "market", "book"):
+        values = chunk[column]
+        starts[1:] &= values[1:] == values[:-1]
+    starts[1:] = ~starts[1:]
+    return np.flatnonzero(starts)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect an odds store.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    stats = subparsers.add_parser("stats")
+    stats.add_argument("path")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(os.path.join(args.path, "meta.json")):
+        parser.error(f"{args.path} is not an odds store")
+    store = OddsStore(args.path)
+    json.dump(store.stats(), sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# Multi-core execution of batch_implied_odds over large batches of markets or parlays
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from batch_implied_odds import batch_implied_odds
+
+DEFAULT_CHUNK_SIZE = 50000
+
+
+def _share(array):
+    """
+    Copies an array into a new shared memory block.
+
+    Returns:
+        SharedMemory: The block (the caller closes and unlinks it).
+        tuple: (name, shape, dtype) to attach to it from a worker.
+    """
+    array = np.ascontiguousarray(array)
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def _attach(spec):
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _devig_chunk(inputs, output, start, stop, method, normalize):
+    """
+    Worker: devigs markets [start, stop) of the shared input arrays.
+
+    The fair odds are written straight into the shared output array; only the (small) per-market
+    method parameters are sent back.
+    """
+    handles = []
+    try:
+        arrays = {}
+        for key, spec in inputs.items():
+            shm, array = _attach(spec)
+            handles.append(shm)
+            arrays[key] = array[start:stop]
+        shm, out = _attach(output)
+        handles.append(shm)
+
+        result = batch_implied_odds(
+            arrays["prob"],
+            method=method,
+            margin=arrays["margin"],
+            gross_margin=arrays.get("gross_margin"),
+            normalize=normalize,
+            warm_start=arrays.get("warm_start"),
+        )
+        out[start:stop] = result.pop("implied_odds")
+        return result
+    finally:
+        for shm in handles:
+            shm.close()
+
+
+class DevigPool:
+    """
+    Process pool that prices large batches of markets in chunks.
+
+    Inputs reach the workers through shared memory, so nothing is pickled per row, and chunks are
+    reassembled by position, so the output order does not depend on scheduling.
+
+    Args:
+        workers (int): Number of worker processes (default is os.cpu_count()).
+        chunk_size (int): Markets per task.
+    """
+
+    def __init__(self, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.workers = workers or os.cpu_count()
+        self.chunk_size = chunk_size
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown()
+
+    def implied_odds(self, prob, method="basic", margin=0, gross_margin=None, normalize=True, warm_start=None):
+        """
+        batch_implied_odds split across the pool.
+
+        Args:
+            prob (np.ndarray): Padded 2-D array of probabilities, one market per row (NaN padding).
+            method, margin, gross_margin, normalize, warm_start: as in batch_implied_odds.
+
+        Returns:
+            dictionary: Same keys and values as batch_implied_odds on the whole batch.
+        """
+        prob = np.asarray(prob, dtype=float)
+        n_markets = prob.shape[0]
+
+        inputs = {"prob": prob, "margin": np.broadcast_to(np.asarray(margin, dtype=float), (n_markets,))}
+        if gross_margin is not None:
+            inputs["gross_margin"] = np.broadcast_to(np.asarray(gross_margin, dtype=float), (n_markets,))
+        if warm_start is not None:
+            inputs["warm_start"] = np.broadcast_to(np.asarray(warm_start, dtype=float), (n_markets,))
+
+        blocks = []
+        try:
+            specs = {}
+            for key, array in inputs.items():
+                shm, specs[key] = _share(array)
+                blocks.append(shm)
+            out_shm, out_spec = _share(np.empty(prob.shape))
+            blocks.append(out_shm)
+
+            bounds = [(start, min(start + self.chunk_size, n_markets)) for start in range(0, n_markets, self.chunk_size)]
+            futures = [
+                self._executor.submit(_devig_chunk, specs, out_spec, start, stop, method, normalize)
+                for start, stop in bounds
+            ]
+            chunks = [future.result() for future in futures]
+
+            mydict = {"implied_odds": np.ndarray(prob.shape, buffer=out_shm.buf).copy()}
+        finally:
+            for shm in blocks:
+                shm.close()
+                shm.unlink()
+
+        for key in (chunks[0] if chunks else {}):
+            mydict[key] = np.concatenate([chunk[key] for chunk in chunks])
+        return mydict
+
+    def devig_parlays(self, parlays, methods=None, deadline=None):
+        """
+        bulk_devig.devig_parlays with the legs devigged across the pool.
+
+        Returns:
+            list: One result dictionary per parlay, in input order.
+        """
+        from bulk_devig import devig_parlays
+        from pricing import METHODS
+
+        def devig_legs(legs_probs, margins, method):
+            return self.implied_odds(legs_probs, method=METHODS[method], margin=margins, normalize=False)["implied_odds"]
+
+        return devig_parlays(parlays, methods, devig_legs=devig_legs, deadline=deadline)
@@ -0,0 +1,237 @@
+# Search a pool of candidate legs for the parlays with the highest EV or Kelly stake
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from market import Market
+from pricing import METHODS, check_deadline, devig_leg
+from utils import expected_value, kelly_bet
+
+# Largest pool of legs and parlay size accepted by the /api/search endpoint
+MAX_POOL_SIZE = 100
+MAX_PARLAY_LEGS = 8
+
+OBJECTIVES = ["ev", "kelly"]
+
+
+@dataclass
+class ParlayPricing:
+    """
+    How the book prices a parlay from the offered odds of its legs.
+
+    The offered parlay odds are the product of the legs' offered odds, with the winnings scaled by
+    1 + boost (e.g. 0.2 for a 20% profit boost, -0.1 for a 10% parlay tax) and capped at max_odds.
+    """
+    boost: float = 0.0
+    max_odds: float = None
+
+    def offered_odds(self, legs_odds_product):
+        odds = 1 + (legs_odds_product - 1) * (1 + self.boost)
+        if self.max_odds is not None:
+            odds = np.minimum(odds, self.max_odds)
+        return odds
+
+
+def _validate_leg(leg):
+    """
+    Checks one leg of the pool and converts it to plain floats.
+
+    Args:
+        leg (dict): {"odds": [odds, ...], "id": str (optional), "event": str (optional),
+            "offered_odds": float (optional, default is the first odds)}. The first odds are the
+            selection; the others complete its market and are only used to devig it.
+
+    Returns:
+        tuple: Market odds, offered odds of the selection.
+    """
+    if not isinstance(leg, dict):
+        raise ValueError("leg must be an object")
+
+    odds = leg.get("odds")
+    if not isinstance(odds, list) or len(odds) < 2:
+        raise ValueError("odds must be a list of at least two decimal odds")
+    odds = [float(o) for o in odds]
+    if any(not 1 < o < np.inf for o in odds):
+        raise ValueError("decimal odds must be finite and greater than 1")
+    if sum(1 / o for o in odds) < 1:
+        raise ValueError("odds must include a margin (implied probabilities summing to at least 1)")
+
+    offered_odds = float(leg.get("offered_odds", odds[0]))
+    if not 1 < offered_odds < np.inf:
+        raise ValueError("offered_odds must be finite decimal odds greater than 1")
+
+    return odds, offered_odds
+
+
+def _conflicts(legs, exclude):
+    """
+    Builds the matrix of legs that cannot be in the same parlay: legs of the same event and the
+    explicitly excluded pairs (given by leg id, or by position for legs without an id). Leg ids must
+    be unique.
+    """
+    n_legs = len(legs)
+    conflict = np.zeros((n_legs, n_legs), dtype=bool)
+
+    events = [leg.get("event") for leg in legs]
+    for i in range(n_legs):
+        for j in range(i + 1, n_legs):
+            if events[i] is not None and events[i] == events[j]:
+                conflict[i, j] = conflict[j, i] = True
+
+    ids = {}
+    for i, leg in enumerate(legs):
+        leg_id = leg.get("id", i)
+        if leg_id in ids:
+            raise ValueError(f"duplicate leg id {leg_id!r} (legs {ids[leg_id]} and {i})")
+        ids[leg_id] = i
+    for pair in exclude:
+        if len(pair) != 2 or any(x not in ids for x in pair):
+            raise ValueError(f"exclude: unknown legs {pair}")
+        i, j = ids[pair[0]], ids[pair[1]]
+        conflict[i, j] = conflict[j, i] = True
+
+    return conflict
+
+
+def _score(fair_prob, offered_odds, objective, kelly_budget, kelly_mult):
+    if objective == "ev":
+        return expected_value(fair_prob, offered_odds)
+    return kelly_bet(fair_prob, offered_odds - 1, kelly_budget, kelly_mult)
+
+
+def search_parlays(legs, max_legs=3, top_k=10, objective="ev", method="mult", pricing=None, exclude=(),
+                   kelly_budget=100, kelly_mult=1.0, min_legs=2, deadline=None):
+    """
+    Finds the best parlays of min_legs..max_legs legs from a pool of candidate legs.
+
+    Each leg is devigged once (pricing.devig_leg) and legs are assumed independent, so a parlay's fair
+    probability is the product of its legs' fair probabilities. Parlays are grown one leg at a time,
+    all extensions of a size at once as sums of log probabilities and log odds. A partial parlay is
+    dropped as soon as no extension of it can beat the current top_k: its score is bounded using the
+    legs with the best edge (fair probability x offered odds) left to add.
+
+    Args:
+        legs (list): The candidate legs, see _validate_leg for the format.
+        max_legs (int): Largest parlay size.
+        top_k (int): Number of parlays to return.
+        objective (str): 'ev' (EV%) or 'kelly' (Kelly stake).
+        method (str): Devig method, one of pricing.METHODS.
+        pricing (ParlayPricing): Rule for the offered parlay odds (default is the plain product).
+        exclude (list): Pairs of leg ids that cannot be in the same parlay, on top of same-event legs.
+        kelly_budget (float): Kelly bank roll (default is 100, stakes in % of the bank roll).
+        kelly_mult (float): Kelly multiplier.
+        min_legs (int): Smallest parlay size.
+        deadline (float): time.monotonic() value after which the search stops with a TimeoutError
+            (default is None, no deadline).
+
+    Returns:
+        list: The top_k parlays, best first: leg ids, fair probability and odds, offered odds, EV% and
+            Kelly stake.
+        dict: Search statistics: parlays evaluated and partial parlays pruned.
+    """
+    assert objective in OBJECTIVES, f"objective must be one of {OBJECTIVES}"
+    assert method in METHODS, f"method must be one of {list(METHODS)}"
+    assert 2 <= min_legs <= max_legs, "parlay sizes must satisfy 2 <= min_legs <= max_legs"
+    assert top_k >= 1, "top_k must be at least 1"
+    pricing = ParlayPricing() if pricing is None else pricing
+    assert -1 < pricing.boost < np.inf, "boost must be finite and greater than -1"
+    assert pricing.max_odds is None or pricing.max_odds > 1, "max_odds must be decimal odds greater than 1"
+    assert 0 < kelly_budget < np.inf, "kelly_budget must be positive and finite"
+    assert 0 < kelly_mult < np.inf, "kelly_mult must be positive and finite"
+
+    markets = []
+    for i, leg in enumerate(legs):
+        try:
+            markets.append(_validate_leg(leg))
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"leg {i}: {e}") from e
+    conflict = _conflicts(legs, exclude)
+    n_legs = len(legs)
+
+    fair_prob = np.empty(n_legs)
+    for i, (odds, _) in enumerate(markets):
+        check_deadline(deadline)
+        market = Market.from_odds(odds)
+        fair_prob[i] = 1 / devig_leg(market, market.margin, method)[0]
+    offered = np.array([offered_odds for _, offered_odds in markets])
+
+    # Sort legs by edge, best first: the best r legs after position i are then i+1..i+r, and
+    # edge_bound[i, r] = log of their product of edges (edges below 1 count as 1)
+    order = np.argsort(-(fair_prob * offered), kind="stable")
+    log_prob = np.log(fair_prob[order])
+    log_odds = np.log(offered[order])
+    conflict = conflict[np.ix_(order, order)]
+    gains = np.concatenate(([0.0], np.cumsum(np.maximum(log_prob + log_odds, 0))))
+    # Log of the largest product of r offered odds in the pool, bounding the odds any extension reaches
+    top_log_odds = np.concatenate(([0.0], np.cumsum(np.sort(log_odds)[::-1])))
+    positions = np.arange(n_legs)
+
+    def edge_bound(last, remaining):
+        return gains[np.minimum(last + 1 + remaining, n_legs)] - gains[last + 1]
+
+    # Frontier of partial parlays: leg positions, log sums and legs they can no longer be combined with
+    combos = positions[:, None]
+    sum_log_prob = log_prob.copy()
+    sum_log_odds = log_odds.copy()
+    blocked = conflict.copy()
+
+    best = []  # (score, leg positions), best first
+    stats = {"evaluated": 0, "pruned": 0}
+    for size in range(2, max_legs + 1):
+        check_deadline(deadline)
+
+        # Extend every partial parlay with every later leg it does not conflict with
+        parent, leg = np.nonzero((positions[None, :] > combos[:, -1:]) & ~blocked)
+        if not len(parent):
+            break
+        combos = np.hstack((combos[parent], leg[:, None]))
+        sum_log_prob = sum_log_prob[parent] + log_prob[leg]
+        sum_log_odds = sum_log_odds[parent] + log_odds[leg]
+        blocked = blocked[parent] | conflict[leg]
+
+        prob = np.exp(sum_log_prob)
+        parlay_odds = pricing.offered_odds(np.exp(sum_log_odds))
+
+        if size >= min_legs:
+            stats["evaluated"] += len(combos)
+            scores = _score(prob, parlay_odds, objective, kelly_budget, kelly_mult)
+            top = np.argpartition(-scores, min(top_k, len(scores)) - 1)[:top_k]
+            best = sorted(best + [(float(scores[i]), combos[i].tolist()) for i in top], key=lambda x: -x[0])[:top_k]
+
+        if size == max_legs:
+            break
+
+        # Bound the best score any extension can reach (offered odds only grow with more legs)
+        ev_bound = (1 + pricing.boost) * np.exp(sum_log_prob + sum_log_odds + edge_bound(combos[:, -1], max_legs - size))
+        ev_bound += max(-pricing.boost, 0) * prob - 1
+        if pricing.max_odds is not None:
+            ev_bound = np.minimum(ev_bound, prob * pricing.max_odds - 1)
+        if objective == "ev":
+            bound = 100 * ev_bound
+        else:
+            # The Kelly fraction is EV / (odds - 1) and extensions have higher odds: a positive EV bound
+            # is divided by the current odds, a negative one by the highest odds an extension can reach
+            max_odds = pricing.offered_odds(np.exp(sum_log_odds + top_log_odds[min(max_legs - size, n_legs)]))
+            fraction = np.where(ev_bound >= 0, ev_bound / (parlay_odds - 1), ev_bound / (max_odds - 1))
+            bound = kelly_budget * kelly_mult * np.minimum(fraction, prob)
+
+        if len(best) == top_k:
+            keep = bound > best[-1][0]
+            stats["pruned"] += int((~keep).sum())
+            combos, sum_log_prob, sum_log_odds, blocked = combos[keep], sum_log_prob[keep], sum_log_odds[keep], blocked[keep]
+
+    results = []
+    for _, combo in best:
+        indices = sorted(int(order[p]) for p in combo)
+        prob = float(np.prod(fair_prob[indices]))
+        parlay_odds = float(pricing.offered_odds(float(np.prod(offered[indices]))))
+        results.append({
+            "legs": [legs[i].get("id", i) for i in indices],
+            "fair_prob": prob,
+            "fair_odds": 1 / prob,
+            "offered_odds": parlay_odds,
+            "ev": expected_value(prob, parlay_odds),
+            "kelly": kelly_bet(prob, parlay_odds - 1, kelly_budget, kelly_mult),
+        })
+    return results, stats
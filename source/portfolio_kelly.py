@@ -0,0 +1,124 @@
+# Kelly stakes for many simultaneous bets, sized jointly to maximize the expected log growth
+
+import numpy as np
+
+from utils import kelly_bet
+
+# Bets up to this count are optimized over every win/lose outcome, larger portfolios over sampled outcomes
+MAX_EXACT_BETS = 12
+DEFAULT_SCENARIOS = 20000
+
+# Largest portfolio accepted by the /api/portfolio endpoint
+MAX_PORTFOLIO_SIZE = 200
+
+
+def _outcomes(probs, n_scenarios, seed):
+    """
+    Win/lose outcomes of independent bets and their weights.
+
+    Args:
+        probs (np.ndarray): Win probability of each bet.
+        n_scenarios (int): Number of sampled outcomes when there are more than MAX_EXACT_BETS bets.
+        seed (int): Seed of the sampler.
+
+    Returns:
+        np.ndarray: Boolean matrix, one row per outcome, True where the bet wins.
+        np.ndarray: Probability of each outcome (exact), or 1 / n_scenarios (sampled).
+        bool: Whether the outcomes were enumerated exactly.
+    """
+    n_bets = len(probs)
+    if n_bets <= MAX_EXACT_BETS:
+        wins = ((np.arange(2 ** n_bets)[:, None] >> np.arange(n_bets)) & 1).astype(bool)
+        weights = np.prod(np.where(wins, probs, 1 - probs), axis=1)
+        return wins, weights, True
+
+    rng = np.random.default_rng(seed)
+    wins = rng.random((n_scenarios, n_bets)) < probs
+    return wins, np.full(n_scenarios, 1 / n_scenarios), False
+
+
+def optimize_portfolio(probs, odds, kelly_budget, kelly_mult=1.0, max_exposure=1.0, n_scenarios=DEFAULT_SCENARIOS,
+                       seed=0):
+    """
+    Sizes simultaneous independent bets by maximizing the expected log of the bankroll jointly.
+
+    Sizing each bet alone with kelly_bet ignores that the bets share one bankroll and overbets it. Here
+    the fractions f maximize E[log(1 + sum_i f_i * r_i)], r_i = odds_i - 1 on a win and -1 on a loss,
+    subject to f_i >= 0 and sum_i f_i <= max_exposure / kelly_mult, over every outcome for up to
+    MAX_EXACT_BETS bets and over n_scenarios sampled outcomes beyond. The objective is concave, so
+    the solver (SLSQP) finds the global optimum. The stakes are then scaled by kelly_mult, like kelly_bet.
+    Should the solver fail, the independent Kelly fractions scaled down to the exposure cap are used.
+
+    Args:
+        probs (list): Devigged win probability of each bet.
+        odds (list): Offered decimal odds of each bet.
+        kelly_budget (float): Bank roll.
+        kelly_mult (float): Kelly multiplier (default is 1.0, full Kelly).
+        max_exposure (float): Largest fraction of the bankroll staked in total (default is 1.0).
+        n_scenarios (int): Sampled outcomes for large portfolios.
+        seed (int): Seed of the outcome sampler, so results are reproducible.
+
+    Returns:
+        dictionary: "stakes" (portfolio stake of each bet), "independent_stakes" (kelly_bet of each bet
+            alone, floored at 0), "fractions" (stakes / bankroll), "exposure" (total fraction staked),
+            "growth" (expected log growth of the bankroll), "exact" (outcomes enumerated, not sampled),
+            "converged" (False when the solver failed and the capped independent fractions were used).
+    """
+    from scipy import optimize
+
+    probs = np.asarray(probs, dtype=float)
+    odds = np.asarray(odds, dtype=float)
+
+    assert probs.shape == odds.shape and probs.ndim == 1, "probs and odds must be lists of the same length"
+    assert np.all((probs > 0) & (probs < 1)), "probabilities must be between 0 and 1"
+    assert np.all((odds > 1) & np.isfinite(odds)), "decimal odds must be finite and greater than 1"
+    assert 0 < kelly_budget < np.inf, "kelly_budget must be positive and finite"
+    assert 0 < kelly_mult <= 1, "kelly_mult must be in (0, 1]"
+    assert 0 < max_exposure <= 1, "max_exposure must be in (0, 1]"
+
+    independent = np.maximum(kelly_bet(probs, odds - 1, kelly_budget, kelly_mult), 0)
+    fractions = np.zeros(len(probs))
+
+    # Bets without an edge get nothing; the optimization runs over the others
+    positive = np.flatnonzero(probs * odds > 1)
+    exact = True
+    converged = True
+    growth = 0.0
+    if len(positive):
+        wins, weights, exact = _outcomes(probs[positive], n_scenarios, seed)
+        returns = np.where(wins, odds[positive] - 1, -1.0)
+
+        # Full Kelly fractions are capped so the scaled stakes respect max_exposure, and below 1 so that
+        # losing every bet still leaves a bankroll
+        total_cap = min(max_exposure / kelly_mult, 1 - 1e-9)
+
+        def neg_growth(f):
+            wealth = np.maximum(1 + returns @ f, 1e-300)
+            return -weights @ np.log(wealth), -(weights / wealth) @ returns
+
+        # Start from the independent fractions, scaled into the feasible region
+        start = (probs[positive] * odds[positive] - 1) / (odds[positive] - 1)
+        start *= min(1.0, 0.9 * total_cap / start.sum())
+
+        res = optimize.minimize(
+            neg_growth,
+            start,
+            jac=True,
+            method="SLSQP",
+            bounds=[(0, total_cap)] * len(positive),
+            constraints=[{"type": "ineq", "fun": lambda f: total_cap - f.sum(), "jac": lambda f: -np.ones_like(f)}],
+            options={"ftol": 1e-12, "maxiter": 500},
+        )
+        converged = bool(res.success and np.all(np.isfinite(res.x)))
+        fractions[positive] = (np.clip(res.x, 0, None) if converged else start) * kelly_mult
+        growth = float(weights @ np.log(1 + returns @ fractions[positive]))
+
+    return {
+        "stakes": fractions * kelly_budget,
+        "independent_stakes": independent,
+        "fractions": fractions,
+        "exposure": float(fractions.sum()),
+        "growth": growth,
+        "exact": exact,
+        "converged": converged,
+    }
@@ -0,0 +1,295 @@
+# Single-pass pricing pipeline: parse legs once, devig with every selected method, format on demand
+
+from dataclasses import dataclass, field
+import math
+import statistics
+import time
+
+from devig_cache import cached_fair_odds, cached_implied_odds
+from market import Market
+from metrics import stage
+from odds_convert import dec_to_us
+from utils import expected_value, kelly_bet
+
+# App method names and the implied_odds method behind each of them
+METHODS = {
+    "mult": "basic",
+    "add": "additive",
+    "power": "power",
+    "shin": "shin",
+    "wpo": "wpo",
+    "odds_ratio": "odds_ratio",
+    "balanced_book": "balanced_book",
+    "naive": "naive",
+}
+
+# Methods priced by default: every method that removes the margin (naive keeps it, for reference)
+DEFAULT_METHODS = [method for method in METHODS if method != "naive"]
+
+
+@dataclass
+class MethodResult:
+    method: str
+    legs_fair_odds: list
+    total_fair_odds: float
+    ev: float
+    kelly: float = None
+
+
+@dataclass
+class Consensus:
+    min: float
+    avg: float
+    max: float
+
+    @property
+    def spread(self):
+        return self.max - self.min
+
+    def as_dict(self):
+        return {"min": self.min, "avg": self.avg, "max": self.max, "spread": self.spread}
+
+
+def consensus(values):
+    """
+    Returns:
+        Consensus: Minimum, average and maximum of one value over the methods (None without values).
+    """
+    return Consensus(min(values), sum(values) / len(values), max(values)) if values else None
+
+
+@dataclass
+class PricingResult:
+    legs_odds: list
+    margins: list
+    final_odds: float
+    methods: dict = field(default_factory=dict)
+
+    @property
+    def evs(self):
+        return [result.ev for result in self.methods.values()]
+
+    @property
+    def kellys(self):
+        return [result.kelly for result in self.methods.values() if result.kelly is not None]
+
+    def legs_consensus(self):
+        """
+        Returns:
+            list: Consensus of the fair probability of each leg's selection over the methods.
+        """
+        results = list(self.methods.values())
+        return [consensus([1 / result.legs_fair_odds[i][0] for result in results]) for i in range(len(self.legs_odds))]
+
+    def consensus(self):
+        """
+        Returns:
+            dict: Consensus of the parlay's fair probability, EV% and Kelly wager (None without Kelly
+                inputs) over the methods.
+        """
+        return {
+            "fair_prob": consensus([1 / result.total_fair_odds for result in self.methods.values()]),
+            "ev": consensus(self.evs),
+            "kelly": consensus(self.kellys),
+        }
+
+
+def check_deadline(deadline):
+    """
+    Raises TimeoutError once a time.monotonic() deadline has passed (None means no deadline).
+    """
+    if deadline is not None and time.monotonic() > deadline:
+        raise TimeoutError("pricing took longer than the request timeout")
+
+
+def parse_legs(odds_input):
+    """
+    Parses the odds of a parlay, e.g. "1.5/2.5, 1.4/2.5".
+
+    Args:
+        odds_input (str): Legs separated by commas, the decimal odds of a leg separated by slashes.
+            The first odds of each leg are the ones in the parlay.
+
+    Returns:
+        list: The decimal odds of each leg.
+    """
+    return [list(map(float, leg.split('/'))) for leg in odds_input.split(',')]
+
+
+def _fair_odds(devigged):
+    return devigged["implied_odds"] if isinstance(devigged, dict) else devigged
+
+
+def devig_leg(probs, margin, method):
+    """
+    Devigs one leg with one of METHODS.
+
+    Args:
+        probs (list, Market): Implied probabilities of the leg, or its Market.
+        margin (float): Margin of the leg.
+        method (str): One of METHODS.
+
+    Returns:
+        list: Fair decimal odds of the leg.
+    """
+    return _fair_odds(cached_implied_odds(probs, category="dec", method=METHODS[method], normalize=False, margin=margin))
+
+
+def devig_market(probs, margin, methods, profile=None):
+    """
+    Devigs one leg with several of METHODS in one pass: the leg is validated once and the results of all
+    the methods share one cache entry. Gives the same fair odds as devig_leg with each method.
+
+    Args:
+        probs (list, Market): Implied probabilities of the leg, or its Market.
+        margin (float): Margin of the leg.
+        methods (list): Methods of METHODS.
+        profile (metrics.Profile): Records the time spent devigging with each method as "devig.<method>"
+            (default is None, no profiling).
+
+    Returns:
+        dict: Fair decimal odds of the leg, by method.
+    """
+    seconds = None if profile is None else {}
+    fair_odds = cached_fair_odds(probs, [METHODS[method] for method in methods], normalize=False, margin=margin,
+                                 seconds=seconds)
+    if profile is not None:
+        for method in methods:
+            profile.add(f"devig.{method}", seconds.get(METHODS[method], 0.0))
+    return dict(zip(methods, fair_odds))
+
+
+def price_parlay(legs_odds, final_odds, kelly_budget=None, kelly_mult=None, methods=None, deadline=None,
+                 profile=None):
+    """
+    Devigs every leg of a parlay with each method and calculates EV and Kelly wager.
+
+    Each leg is validated once into a Market and devigged with all methods in one pass (devig_market).
+
+    Args:
+        legs_odds (list): The decimal odds of each leg, see parse_legs.
+        final_odds (float): Decimal odds offered for the parlay.
+        kelly_budget (float): Kelly bank roll (default is None, no Kelly wager).
+        kelly_mult (float): Kelly multiplier (default is None, no Kelly wager).
+        methods (list): Methods to run (default is DEFAULT_METHODS).
+        deadline (float): time.monotonic() value after which pricing stops with a TimeoutError
+            (default is None, no deadline).
+        profile (metrics.Profile): Records the time spent devigging with each method and on EV/Kelly
+            (default is None, no profiling).
+
+    Returns:
+        PricingResult: Per-leg fair odds and total fair odds, EV% and Kelly wager for each method.
+    """
+    methods = list(DEFAULT_METHODS) if methods is None else methods
+
+    markets = [Market.from_odds(odds) for odds in legs_odds]
+    margins = [market.margin for market in markets]
+
+    legs_devigged = []
+    for market in markets:
+        check_deadline(deadline)
+        legs_devigged.append(devig_market(market, market.margin, methods, profile))
+
+    result = PricingResult(legs_odds=legs_odds, margins=margins, final_odds=final_odds)
+    with stage(profile, "ev_kelly"):
+        for method in methods:
+            legs_fair_odds = [devigged[method] for devigged in legs_devigged]
+            total_fair_odds = math.prod([fair_odds[0] for fair_odds in legs_fair_odds])
+            ev = expected_value(1 / total_fair_odds, final_odds)
+
+            kelly = None
+            if kelly_budget is not None and kelly_mult is not None:
+                kelly = kelly_bet(1 / total_fair_odds, final_odds - 1, kelly_budget, kelly_mult)
+
+            result.methods[method] = MethodResult(method, legs_fair_odds, total_fair_odds, ev, kelly)
+
+    return result
+
+
+def format_method(result, method):
+    """
+    Renders the results of one method for the page.
+
+    Args:
+        result (PricingResult): Output of price_parlay.
+        method (str): One of the methods in result.
+
+    Returns:
+        str: Per-leg and total fair values, EV% and Kelly wager, lines separated by <br>.
+    """
+    method_result = result.methods[method]
+    legs_fair_odds = method_result.legs_fair_odds
+
+    legs_summary = []
+    for i in range(len(legs_fair_odds)):
+        fair_odds_us = dec_to_us(legs_fair_odds[i])
+        legs_summary.append(f"Leg#{i} ({result.legs_odds[i][0]}): Margin = {round(result.margins[i] * 100, 2)}% | "
+                            f"Fair Value = {round(legs_fair_odds[i][0], 2)} "
+                            f"(US {fair_odds_us[0]}) "
+                            f"({round(1 / legs_fair_odds[i][0] * 100, 2)}%)")
+    summary = "<br>".join(legs_summary)
+
+    total_fair_odds = method_result.total_fair_odds
+    total_fair_odds_us = dec_to_us([total_fair_odds])
+    summary += f"<br>Final Odds ({result.final_odds}): Total Fair Value = {round(total_fair_odds, 2)} " \
+               f"(US {total_fair_odds_us[0]}) ({round(1 / total_fair_odds * 100, 2)}%)"
+
+    kelly = round(method_result.kelly, 2) if method_result.kelly is not None else None
+    return f"{summary}<br>EV% = {round(method_result.ev, 2)}%, Kelly Wager = ${kelly}"
+
+
+def format_summary(result):
+    """
+    Renders the MIN, AVG and MAX lines over all methods for the page, and the SPREAD line between the
+    MIN and MAX.
+
+    Args:
+        result (PricingResult): Output of price_parlay.
+
+    Returns:
+        str: The MIN line.
+        str: The AVG line.
+        str: The MAX line.
+        str: The SPREAD line.
+    """
+    evs = [round(ev, 2) for ev in result.evs]
+    kellys = [round(kelly, 2) for kelly in result.kellys]
+
+    ev_avg = round(statistics.mean(evs), 2)
+    kelly_avg = round(statistics.mean(kellys), 2) if kellys else None
+    avg_results_str = f"AVG: EV% = {ev_avg}%, Kelly Wager = ${kelly_avg}"
+
+    ev_min = min(evs)
+    kelly_min = min(kellys) if kellys else None
+    min_results_str = f"MIN: EV% = {ev_min}%, Kelly Wager = ${kelly_min}"
+
+    ev_max = max(evs)
+    kelly_max = max(kellys) if kellys else None
+    max_results_str = f"MAX: EV% = {ev_max}%, Kelly Wager = ${kelly_max}"
+
+    kelly_spread = round(kelly_max - kelly_min, 2) if kellys else None
+    spread_results_str = f"SPREAD: EV% = {round(ev_max - ev_min, 2)}%, Kelly Wager = ${kelly_spread}"
+
+    return min_results_str, avg_results_str, max_results_str, spread_results_str
+
+
+def format_consensus(result):
+    """
+    Renders the agreement of the methods on each leg and on the parlay for the page.
+
+    Args:
+        result (PricingResult): Output of price_parlay.
+
+    Returns:
+        str: Per-leg and total fair value at the AVG probability, with the MIN-MAX probability range and
+            its spread, lines separated by <br>.
+    """
+    def line(agreement):
+        return f"Fair Value = {round(1 / agreement.avg, 2)} ({round(agreement.avg * 100, 2)}%, " \
+               f"MIN-MAX {round(agreement.min * 100, 2)}-{round(agreement.max * 100, 2)}%, " \
+               f"spread {round(agreement.spread * 100, 2)}%)"
+
+    lines = [f"Leg#{i} ({result.legs_odds[i][0]}): {line(agreement)}"
+             for i, agreement in enumerate(result.legs_consensus())]
+    lines.append(f"Final Odds ({result.final_odds}): Total {line(result.consensus()['fair_prob'])}")
+    return "<br>".join(lines)
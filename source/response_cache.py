@@ -0,0 +1,243 @@
+# Cache of rendered responses to identical pricing requests, in process or shared by the workers
+
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from devig_cache import DevigCache
+
+BACKENDS = ["memory", "sqlite", "off"]
+
+
+def request_key(endpoint, *parts):
+    """
+    Builds a cache key from normalized request inputs.
+
+    Args:
+        endpoint (str): Name of the endpoint, so equal inputs of different endpoints do not collide.
+        parts: JSON-serializable inputs (e.g. parsed leg odds as floats, not the raw form text).
+
+    Returns:
+        str: Hex digest of the endpoint and inputs.
+    """
+    encoded = json.dumps([endpoint, *parts], sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(encoded.encode(), digest_size=20).hexdigest()
+
+
+def etag(body):
+    """
+    Returns:
+        str: Strong entity tag of a response body (without quotes).
+    """
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+class MemoryBackend:
+    """
+    Per-process LRU backend, a DevigCache bounded by entry count and memory with an optional TTL.
+    """
+
+    name = "memory"
+
+    def __init__(self, max_entries, max_bytes, ttl=None):
+        self._cache = DevigCache(max_entries=max_entries, max_bytes=max_bytes, ttl=ttl)
+
+    def get(self, key):
+        hit, value = self._cache.get(key)
+        return value if hit else None
+
+    def put(self, key, value):
+        self._cache.put(key, value)
+
+    def stats(self):
+        stats = self._cache.stats()
+        return {"entries": stats["entries"], "bytes": stats["bytes"]}
+
+    def clear(self):
+        self._cache.clear()
+
+
+class SqliteBackend:
+    """
+    Backend in an SQLite file, shared by every worker process of the machine (WAL mode, one connection
+    per thread and process). Least recently used entries are deleted once max_entries or max_bytes is
+    exceeded.
+
+    Args:
+        path (str): Database file.
+        max_entries (int): Maximum number of entries.
+        max_bytes (int): Maximum total size of the cached values.
+        ttl (float): Seconds after which an entry expires (default is None, entries never expire).
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path, max_entries, max_bytes, ttl=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._local = threading.local()
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS responses "
+            "(key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, expires REAL, used REAL NOT NULL)"
+        )
+        self._connection().execute("CREATE INDEX IF NOT EXISTS responses_used ON responses (used)")
+
+    def _connection(self):
+        # Connections must not cross a fork (gunicorn workers fork from the master that imported the app)
+        connection, pid = getattr(self._local, "connection", (None, None))
+        if connection is None or pid != os.getpid():
+            # Autocommit, and wait for the other workers' writes rather than failing
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = (connection, os.getpid())
+        return connection
+
+    def get(self, key):
+        connection = self._connection()
+        row = connection.execute("SELECT value, expires FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+
+        now = time.time()
+        value, expires = row
+        if expires is not None and expires < now:
+            connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            return None
+        connection.execute("UPDATE responses SET used = ? WHERE key = ?", (now, key))
+        return value
+
+    def put(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+
+        now = time.time()
+        expires = now + self.ttl if self.ttl is not None else None
+        connection = self._connection()
+        connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                           (key, value, len(value), expires, now))
+
+        # Evict least recently used entries until both bounds hold
+        entries, size = connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        while entries > self.max_entries or size > self.max_bytes:
+            excess = max(entries - self.max_entries, 1)
+            evicted = connection.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY used LIMIT ?) RETURNING size",
+                (excess,),
+            ).fetchall()
+            entries -= len(evicted)
+            size -= sum(row[0] for row in evicted)
+
+    def stats(self):
+        connection = self._connection()
+        entries, size = connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"entries": entries, "bytes": size}
+
+    def clear(self):
+        self._connection().execute("DELETE FROM responses")
+
+
+class ResponseCache:
+    """
+    Response bodies by request key, with hit/miss counters and the bytes served without recomputing them.
+
+    Counters are per process, also with a shared backend.
+
+    Args:
+        backend (MemoryBackend, SqliteBackend): Where the bodies are stored (None disables the cache).
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.bytes_saved = 0
+
+    def get(self, key):
+        """
+        Returns:
+            bytes: The cached body, or None on a miss.
+        """
+        if self.backend is None:
+            return None
+        body = self.backend.get(key)
+        with self._lock:
+            if body is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.bytes_saved += len(body)
+        return body
+
+    def put(self, key, body):
+        if self.backend is not None:
+            self.backend.put(key, body)
+
+    def get_json(self, key):
+        body = self.get(key)
+        return None if body is None else json.loads(body)
+
+    def put_json(self, key, value):
+        self.put(key, json.dumps(value, separators=(",", ":")).encode())
+
+    def record_not_modified(self, size):
+        # A conditional request answered 304: the body was not sent either
+        with self._lock:
+            self.not_modified += 1
+            self.bytes_saved += size
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self):
+        """
+        Returns:
+            dict: Backend, entries and bytes stored, hits, misses, hit ratio, 304 responses and bytes saved.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                "backend": self.backend.name if self.backend is not None else "off",
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "not_modified": self.not_modified,
+                "bytes_saved": self.bytes_saved,
+            }
+        if self.backend is not None:
+            stats.update(self.backend.stats())
+        return stats
+
+
+def from_environment():
+    """
+    Builds the cache configured by DEVIG_RESPONSE_CACHE (memory, sqlite or off, default memory),
+    DEVIG_RESPONSE_CACHE_PATH (SQLite file, default in the temporary directory),
+    DEVIG_RESPONSE_CACHE_MAX_ENTRIES (default 10000), DEVIG_RESPONSE_CACHE_MAX_BYTES (default 64 MiB)
+    and DEVIG_RESPONSE_CACHE_TTL (seconds, default none).
+
+    Returns:
+        ResponseCache: The cache.
+    """
+    backend = os.environ.get("DEVIG_RESPONSE_CACHE", "memory")
+    assert backend in BACKENDS, f"DEVIG_RESPONSE_CACHE must be one of {BACKENDS}"
+    max_entries = int(os.environ.get("DEVIG_RESPONSE_CACHE_MAX_ENTRIES", 10000))
+    max_bytes = int(os.environ.get("DEVIG_RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+    ttl = float(os.environ["DEVIG_RESPONSE_CACHE_TTL"]) if os.environ.get("DEVIG_RESPONSE_CACHE_TTL") else None
+
+    if backend == "memory":
+        return ResponseCache(MemoryBackend(max_entries, max_bytes, ttl))
+    if backend == "sqlite":
+        path = os.environ.get("DEVIG_RESPONSE_CACHE_PATH",
+                              os.path.join(tempfile.gettempdir(), "devig-response-cache.sqlite3"))
+        return ResponseCache(SqliteBackend(path, max_entries, max_bytes, ttl))
+    return ResponseCache(None)
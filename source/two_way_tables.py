@@ -0,0 +1,253 @@
+# Precomputed interpolation tables for devigging two-way markets without a root finder
+#
+# Usage:
+#   python source/two_way_tables.py build -o tables/power.tbl [--step 0.0005] [--max-margin 0.25]
+#
+# Then set DEVIG_TWO_WAY_TABLES=tables/power.tbl (comma-separated for several files).
+
+import argparse
+import math
+import mmap
+import os
+import struct
+import sys
+
+import numpy as np
+
+import metrics
+
+# Methods with a table: the fair probabilities of a two-way market only depend on its two probabilities
+TABLE_METHODS = ["power"]
+
+# Header: magic, version, method, grid sizes along the normalized probability q = p1 / (p1 + p2)
+# and the margin m = p1 + p2 - 1, first grid point and step along each
+_MAGIC = b"DV2W"
+_VERSION = 1
+_HEADER = struct.Struct("<4sH2x16sIIdddd")
+_HEADER_SIZE = 64
+
+DEFAULT_TOLERANCE = float(os.environ.get("DEVIG_TWO_WAY_TOLERANCE", 1e-6))
+
+
+def _solve_fair_prob(q, m, method):
+    """
+    Fair probabilities of the two-way markets (q * (1 + m), (1 - q) * (1 + m)), NaN where a
+    probability is not below 1.
+    """
+    from batch_implied_odds import solve_power_exponent
+
+    assert method in TABLE_METHODS, f"method must be one of {TABLE_METHODS}"
+    p1 = q * (1 + m)
+    p2 = (1 - q) * (1 + m)
+    valid = (p1 < 1) & (p2 < 1)
+
+    prob = np.stack([np.where(valid, p1, 0.5).ravel(), np.where(valid, p2, 0.5).ravel()], axis=1)
+    exponent, _, _ = solve_power_exponent(prob)
+    fair_prob = prob ** (-1 / exponent[:, None])
+    fair_prob[~valid.ravel()] = np.nan
+    return fair_prob[:, 0].reshape(q.shape), fair_prob[:, 1].reshape(q.shape), p1, p2
+
+
+def _interpolation_error(grid, q, m, method):
+    """
+    Largest difference between the interpolated and the exact fair probabilities of both outcomes at
+    the given points, whose interpolated first probability is grid.
+    """
+    exact1, exact2, p1, p2 = _solve_fair_prob(q, m, method)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # The second probability comes from the exponent implied by the first, as in TwoWayTable.lookup
+        approx2 = p2 ** (np.log(grid) / np.log(p1))
+    error = np.maximum(np.abs(grid - exact1), np.abs(approx2 - exact2))
+    return np.where(np.isnan(error), np.inf, error)
+
+
+def build_table(method="power", step=0.0005, max_margin=0.25, q_min=0.005):
+    """
+    Tabulates the fair probability of the first outcome over a (q, m) grid.
+
+    q = p1 / (p1 + p2) runs from q_min to 1 - q_min and the margin m = p1 + p2 - 1 from 0 to
+    max_margin. Each cell also stores the largest error of bilinear interpolation inside it, measured
+    against the exact solver at its center and edge midpoints.
+
+    Args:
+        method (str): One of TABLE_METHODS.
+        step (float): Grid step along q and m.
+        max_margin (float): Largest margin covered.
+        q_min (float): Smallest normalized probability covered.
+
+    Returns:
+        dict: Grid parameters.
+        np.ndarray: Fair probability of the first outcome at each grid point (NaN where the market is invalid).
+        np.ndarray: Interpolation error bound of each cell (float32, inf where the table must not be used).
+    """
+    n_q = int(round((1 - 2 * q_min) / step)) + 1
+    n_m = int(round(max_margin / step)) + 1
+    q = q_min + step * np.arange(n_q)
+    m = step * np.arange(n_m)
+
+    values, _, _, _ = _solve_fair_prob(*np.meshgrid(q, m, indexing="ij"), method)
+
+    # Bilinear interpolation is the average of the nodes at cell centers and edge midpoints
+    q_mid = q[:-1] + step / 2
+    m_mid = m[:-1] + step / 2
+    center = (values[:-1, :-1] + values[1:, :-1] + values[:-1, 1:] + values[1:, 1:]) / 4
+    q_edges = (values[:-1, :] + values[1:, :]) / 2
+    m_edges = (values[:, :-1] + values[:, 1:]) / 2
+
+    errors = _interpolation_error(center, *np.meshgrid(q_mid, m_mid, indexing="ij"), method)
+    q_edge_errors = _interpolation_error(q_edges, *np.meshgrid(q_mid, m, indexing="ij"), method)
+    m_edge_errors = _interpolation_error(m_edges, *np.meshgrid(q, m_mid, indexing="ij"), method)
+    errors = np.maximum.reduce([
+        errors,
+        q_edge_errors[:, :-1], q_edge_errors[:, 1:],
+        m_edge_errors[:-1, :], m_edge_errors[1:, :],
+    ])
+
+    params = {"method": method, "n_q": n_q, "n_m": n_m, "q_min": q_min, "q_step": step, "m_min": 0.0, "m_step": step}
+    return params, values, errors.astype(np.float32)
+
+
+def write_table(path, params, values, errors):
+    header = _HEADER.pack(_MAGIC, _VERSION, params["method"].encode(), params["n_q"], params["n_m"],
+                          params["q_min"], params["q_step"], params["m_min"], params["m_step"])
+    with open(path, "wb") as f:
+        f.write(header.ljust(_HEADER_SIZE, b"\0"))
+        f.write(np.ascontiguousarray(values, dtype="<f8").tobytes())
+        f.write(np.ascontiguousarray(errors, dtype="<f4").tobytes())
+
+
+class TwoWayTable:
+    """
+    A table written by write_table, memory-mapped read-only so every process shares one copy.
+
+    Args:
+        path (str): Table file.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, method, n_q, n_m, q_min, q_step, m_min, m_step = _HEADER.unpack_from(self._mmap)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"{path} is not a two-way table (version {_VERSION})")
+        self.method = method.rstrip(b"\0").decode()
+        self.n_q, self.n_m = n_q, n_m
+        self.q_min, self.q_step, self.m_min, self.m_step = q_min, q_step, m_min, m_step
+
+        values_size = 8 * n_q * n_m
+        errors_size = 4 * (n_q - 1) * (n_m - 1)
+        if len(self._mmap) != _HEADER_SIZE + values_size + errors_size:
+            raise ValueError(f"{path} is truncated")
+
+        # memoryviews for fast scalar lookups, numpy views of the same pages for batches
+        buffer = memoryview(self._mmap)
+        self._values = buffer[_HEADER_SIZE:_HEADER_SIZE + values_size].cast("d")
+        self._errors = buffer[_HEADER_SIZE + values_size:].cast("f")
+        self.values = np.frombuffer(self._mmap, dtype="<f8", count=n_q * n_m, offset=_HEADER_SIZE).reshape(n_q, n_m)
+        self.errors = np.frombuffer(self._mmap, dtype="<f4", count=(n_q - 1) * (n_m - 1),
+                                    offset=_HEADER_SIZE + values_size).reshape(n_q - 1, n_m - 1)
+
+    def lookup(self, p1, p2, tolerance=None):
+        """
+        Interpolates the solution of one two-way market.
+
+        Args:
+            p1, p2 (float): Implied probabilities of the market.
+            tolerance (float): Largest accepted error on the fair probabilities (default is DEFAULT_TOLERANCE).
+
+        Returns:
+            float: The exponent a (fair probabilities are p ** a), or None outside the grid or when the
+                interpolation error of the cell may exceed the tolerance.
+        """
+        tolerance = DEFAULT_TOLERANCE if tolerance is None else tolerance
+        total = p1 + p2
+        x = (p1 / total - self.q_min) / self.q_step
+        y = (total - 1 - self.m_min) / self.m_step
+        if not (0 <= x <= self.n_q - 1 and 0 <= y <= self.n_m - 1):
+            return None
+
+        i = min(int(x), self.n_q - 2)
+        j = min(int(y), self.n_m - 2)
+        if not self._errors[i * (self.n_m - 1) + j] <= tolerance:
+            return None
+
+        tx, ty = x - i, y - j
+        k = i * self.n_m + j
+        fair_prob = ((1 - tx) * ((1 - ty) * self._values[k] + ty * self._values[k + 1])
+                     + tx * ((1 - ty) * self._values[k + self.n_m] + ty * self._values[k + self.n_m + 1]))
+        return math.log(fair_prob) / math.log(p1)
+
+    def lookup_many(self, p1, p2, tolerance=None):
+        """
+        lookup for arrays of two-way markets.
+
+        Returns:
+            np.ndarray: The exponent a of each market, NaN where lookup would return None.
+        """
+        tolerance = DEFAULT_TOLERANCE if tolerance is None else tolerance
+        total = p1 + p2
+        x = (p1 / total - self.q_min) / self.q_step
+        y = (total - 1 - self.m_min) / self.m_step
+        inside = (x >= 0) & (x <= self.n_q - 1) & (y >= 0) & (y <= self.n_m - 1)
+
+        i = np.clip(np.where(inside, x, 0).astype(int), 0, self.n_q - 2)
+        j = np.clip(np.where(inside, y, 0).astype(int), 0, self.n_m - 2)
+        tx, ty = x - i, y - j
+        values = self.values
+        fair_prob = ((1 - tx) * ((1 - ty) * values[i, j] + ty * values[i, j + 1])
+                     + tx * ((1 - ty) * values[i + 1, j] + ty * values[i + 1, j + 1]))
+
+        usable = inside & (self.errors[i, j] <= tolerance)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(usable, np.log(fair_prob) / np.log(p1), np.nan)
+
+
+_TABLES = None
+
+
+def get_table(method):
+    """
+    Returns:
+        TwoWayTable: The table of a method from the files in DEVIG_TWO_WAY_TABLES, loaded on first use,
+            or None when there is none.
+    """
+    global _TABLES
+    if _TABLES is None:
+        tables = {}
+        for path in os.environ.get("DEVIG_TWO_WAY_TABLES", "").split(","):
+            if path.strip():
+                table = TwoWayTable(path.strip())
+                tables[table.method] = table
+        _TABLES = tables
+    return _TABLES.get(method)
+
+
+def record_lookups(method, hits, fallbacks):
+    if hits:
+        metrics.TABLE_LOOKUPS.inc(method, "hit", amount=hits)
+    if fallbacks:
+        metrics.TABLE_LOOKUPS.inc(method, "fallback", amount=fallbacks)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build a two-way interpolation table.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build")
+    build.add_argument("-o", "--output", required=True)
+    build.add_argument("--method", choices=TABLE_METHODS, default="power")
+    build.add_argument("--step", type=float, default=0.0005)
+    build.add_argument("--max-margin", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    params, values, errors = build_table(args.method, args.step, args.max_margin)
+    write_table(args.output, params, values, errors)
+
+    usable = np.isfinite(errors)
+    print(f"{args.output}: {params['n_q']} x {params['n_m']} grid, {os.path.getsize(args.output) / 1e6:.1f} MB, "
+          f"cells within 1e-6: {(errors[usable] <= 1e-6).mean():.1%}, within 1e-8: {(errors[usable] <= 1e-8).mean():.1%}",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -36,3 +36,21 @@ def kelly_bet(prob_win, b, bankroll, kelly_multiplier=1.0):
     bet_size = bankroll * adjusted_fraction
 
     return bet_size
+
+
+def expected_value(prob_win, odds, risk=100):
+    """
+    Calculate the expected value of a bet.
+
+    Args:
+        prob_win (float): Probability of winning (e.g., 0.55 for a 55% chance).
+        odds (float): Decimal odds of the bet (e.g., 2.0).
+        risk (float): Size of the bet (default is 100, so the result is the EV in %).
+
+    Returns:
+        float: Expected profit of the bet.
+    """
+    loss_prob = 1 - prob_win
+    amount_won = risk * odds - risk
+
+    return prob_win * amount_won - loss_prob * risk